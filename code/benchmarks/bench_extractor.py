@@ -0,0 +1,360 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from drive_extractor import PATH_LIMITS, ArchiveSink, Extractor, LocalSink, PathSanitizer
+from drive_extractor.checkpoint import Checkpoint
+from drive_extractor.manifest import Manifest
+from drive_extractor.pathindex import PathIndex
+from drive_extractor.sinks import ARCHIVE_FORMATS
+from drive_extractor.statuslog import StatusWriter
+
+from .synthetic_export import generate_export
+
+# Stage name -> method timed for it. Worker stages are summed over all workers.
+STAGES = {
+    'central_directory': (Manifest, 'add_archive'),
+    'planning': (Extractor, 'plan_entry'),
+    'sanitize': (PathSanitizer, 'sanitize'),
+    'collision_resolution': (PathIndex, 'resolve'),
+    'create_dirs': (PathIndex, 'create_pending_dirs'),
+    'checkpoint': (Checkpoint, 'record_planned'),
+    'decompress_write': (Extractor, 'extract_member'),
+    'status_logging': (StatusWriter, 'write_rows'),
+    'error_recovery': (Extractor, 'process_errors'),
+}
+
+# Filesystem calls counted from Python
+FS_CALLS = ['stat', 'lstat', 'listdir', 'scandir', 'mkdir', 'link', 'remove']
+
+
+@contextlib.contextmanager
+def patched(owner, attr, make_wrapper):
+    original = getattr(owner, attr)
+    setattr(owner, attr, make_wrapper(original))
+    try:
+        yield
+    finally:
+        setattr(owner, attr, original)
+
+
+class Probes:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {stage: {'seconds': 0.0, 'calls': 0} for stage in STAGES}
+        self.fs_calls = dict.fromkeys(FS_CALLS, 0)
+
+    def timed(self, stage):
+        def make_wrapper(original):
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    with self.lock:
+                        self.stages[stage]['seconds'] += elapsed
+                        self.stages[stage]['calls'] += 1
+            return wrapper
+        return make_wrapper
+
+    def counted(self, name):
+        def make_wrapper(original):
+            def wrapper(*args, **kwargs):
+                with self.lock:
+                    self.fs_calls[name] += 1
+                return original(*args, **kwargs)
+            return wrapper
+        return make_wrapper
+
+    @contextlib.contextmanager
+    def installed(self):
+        with contextlib.ExitStack() as stack:
+            for stage, (owner, attr) in STAGES.items():
+                stack.enter_context(patched(owner, attr, self.timed(stage)))
+            for name in FS_CALLS:
+                stack.enter_context(patched(os, name, self.counted(name)))
+            yield self
+
+
+def read_proc_io():
+    # Kernel counters for this process (Linux only): read/write syscalls and bytes
+    try:
+        with open('/proc/self/io', 'r') as file:
+            return {key: int(value) for key, value in (line.split(': ') for line in file)}
+    except OSError:
+        return {}
+
+
+def peak_rss_mb():
+    # VmHWM is reset by exec, ru_maxrss on Linux keeps the parent's peak from before the fork
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_once(zip_files, output_folder, workers, **options):
+    # archive (a format) and path_limits (a name) pick the sink, the other options go to the extractor
+    engine_options = dict(options)
+    archive = engine_options.pop('archive', None)
+    path_limits = engine_options.pop('path_limits', None)
+    if archive:
+        engine_options['sink'] = ArchiveSink(os.path.join(output_folder, 'bench-archive.' + archive),
+                                             path_limits=path_limits or 'posix')
+    elif path_limits:
+        engine_options['sink'] = LocalSink(path_limits)
+    io_before = read_proc_io()
+    with Probes().installed() as probes:
+        extractor = Extractor(zip_files, output_folder, max_workers=workers, **engine_options)
+        start = time.perf_counter()
+        extractor.process_zips()
+        wall = time.perf_counter() - start
+    io_after = read_proc_io()
+
+    total_bytes = extractor.total_bytes
+    return {
+        'workers': workers,
+        'options': options,
+        'zip_files': len(zip_files),
+        'files': extractor.total_files,
+        'bytes': total_bytes,
+        'wall_seconds': round(wall, 4),
+        'files_per_second': round(extractor.total_files / wall, 1) if wall else None,
+        'mb_per_second': round(total_bytes / (1024 * 1024) / wall, 2) if wall else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': {stage: {'seconds': round(values['seconds'], 4), 'calls': values['calls']}
+                   for stage, values in probes.stages.items()},
+        'fs_calls': probes.fs_calls,
+        'extractor_metrics': extractor.metrics.snapshot()['stages'],
+        'syscalls': {key: io_after[key] - io_before.get(key, 0)
+                     for key in ('syscr', 'syscw', 'rchar', 'wchar') if key in io_after},
+        'result': {
+            'files_processed': extractor.files_processed,
+            'files_errors': extractor.files_errors,
+            'errors_fixed': extractor.errors_fixed,
+            'errors_failed': extractor.errors_failed,
+        },
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def expand_zips(paths):
+    zip_files = []
+    for path in paths:
+        zip_files.extend(sorted(glob.glob(os.path.join(path, '*.zip'))) if os.path.isdir(path) else [path])
+    return zip_files
+
+
+def run_in_subprocess(zip_files, workers, extra_args=()):
+    # A fresh interpreter per run, so peak RSS and syscall counts only cover that run
+    with tempfile.TemporaryDirectory(prefix='bench-output-') as output_folder:
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_extractor', 'run', *zip_files, '--output', output_folder,
+             '--workers', str(workers), *extra_args],
+            capture_output=True, text=True)
+    if completed.returncode not in (0, 1):
+        # 1 only means the run went over its RSS ceiling
+        raise subprocess.CalledProcessError(completed.returncode, completed.args, completed.stdout, completed.stderr)
+    return json.loads(completed.stdout)
+
+
+def add_generator_arguments(parser):
+    parser.add_argument('--files', type=int, default=5000, help="Number of members (default: 5000)")
+    parser.add_argument('--parts', type=int, default=4, help="Number of ZIP parts (default: 4)")
+    parser.add_argument('--depth', type=int, default=4, help="Maximum folder depth (default: 4)")
+    parser.add_argument('--folders', type=int, default=200, help="Number of folders (default: 200)")
+    parser.add_argument('--median-size', type=int, default=16 * 1024, help="Median file size in bytes")
+    parser.add_argument('--size-sigma', type=float, default=1.5, help="Log-normal spread of file sizes, 0 for fixed")
+    parser.add_argument('--max-size', type=int, default=64 * 1024 * 1024, help="Largest file size in bytes")
+    parser.add_argument('--long-names', type=float, default=0.05, help="Share of names over the length limit")
+    parser.add_argument('--invalid-chars', type=float, default=0.05, help="Share of names with invalid characters")
+    parser.add_argument('--duplicates', type=float, default=0.05, help="Share of members repeated across parts")
+    parser.add_argument('--stored', type=float, default=0.3, help="Share of members stored without compression")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def add_engine_arguments(parser):
+    parser.add_argument('--buffer-size', type=int, help="Copy buffer per worker in KiB")
+    parser.add_argument('--no-zero-copy', dest='zero_copy', action='store_false',
+                        help="Read stored members through zipfile")
+    parser.add_argument('--pipeline', action='store_true', help="Use the pipelined read/inflate/write engine")
+    parser.add_argument('--processes', action='store_true', help="Extract on worker processes instead of threads")
+    parser.add_argument('--small-files', action='store_true', help="Extract small files in runs")
+    parser.add_argument('--low-memory', action='store_true', help="Run the extractor in low-memory mode")
+    parser.add_argument('--sha256', action='store_true', help="Hash every file while it is written")
+    parser.add_argument('--archive', choices=sorted(set(ARCHIVE_FORMATS.values())),
+                        help="Write the files into one archive of this format in the output folder")
+    parser.add_argument('--path-limits', choices=sorted(PATH_LIMITS),
+                        help="Name and path limits, e.g. windows to compare with runs before they were per platform")
+    parser.add_argument('--rss-ceiling', type=float, metavar='MB',
+                        help="Fail (exit status 1) when a run's peak RSS is above this")
+
+
+def engine_args(args):
+    # Passed on from suite to the runs
+    extra_args = ['--buffer-size', str(args.buffer_size)] if args.buffer_size else []
+    extra_args += [] if args.zero_copy else ['--no-zero-copy']
+    extra_args += ['--pipeline'] if args.pipeline else []
+    extra_args += ['--processes'] if args.processes else []
+    extra_args += ['--small-files'] if args.small_files else []
+    extra_args += ['--low-memory'] if args.low_memory else []
+    extra_args += ['--sha256'] if args.sha256 else []
+    extra_args += ['--archive', args.archive] if args.archive else []
+    extra_args += ['--path-limits', args.path_limits] if args.path_limits else []
+    return extra_args + (['--rss-ceiling', str(args.rss_ceiling)] if args.rss_ceiling else [])
+
+
+def check_rss_ceiling(result, ceiling):
+    if ceiling:
+        result['rss_ceiling_mb'] = ceiling
+        result['within_rss_ceiling'] = result['peak_rss_mb'] is not None and result['peak_rss_mb'] <= ceiling
+    return result
+
+
+def generator_options(args):
+    return dict(files=args.files, parts=args.parts, depth=args.depth, folders=args.folders,
+                median_size=args.median_size, size_sigma=args.size_sigma, max_size=args.max_size,
+                long_name_ratio=args.long_names, invalid_char_ratio=args.invalid_chars,
+                duplicate_ratio=args.duplicates, stored_ratio=args.stored, seed=args.seed)
+
+
+def write_json(data, path):
+    text = json.dumps(data, indent=2)
+    if path:
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+def compare(baseline, candidate):
+    rows = []
+    for old, new in zip(baseline['runs'], candidate['runs']):
+        row = {'workers': new['workers']}
+        for key in ('wall_seconds', 'files_per_second', 'mb_per_second', 'peak_rss_mb'):
+            if old.get(key) and new.get(key) is not None:
+                row[key] = {'baseline': old[key], 'candidate': new[key], 'ratio': round(new[key] / old[key], 3)}
+        rows.append(row)
+    return rows
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='benchmarks.bench_extractor',
+                                     description="Benchmark the extractor on synthetic Google Drive downloads.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    suite = commands.add_parser('suite', help="Generate an export and extract it with each worker count")
+    add_generator_arguments(suite)
+    suite.add_argument('--workers', type=int, nargs='+', default=[1, 4], help="Worker counts to run")
+    suite.add_argument('--dedup', choices=['hardlink', 'reflink'])
+    add_engine_arguments(suite)
+    suite.add_argument('--json', help="Write results to this file instead of stdout")
+
+    generate = commands.add_parser('generate', help="Only write a synthetic export")
+    generate.add_argument('output', help="Folder for the ZIP parts")
+    add_generator_arguments(generate)
+
+    run = commands.add_parser('run', help="Extract existing ZIP files once and report")
+    run.add_argument('zips', nargs='+', help="ZIP files, or folders of ZIP files")
+    run.add_argument('--output', required=True, help="Output folder, should be empty")
+    run.add_argument('--workers', type=int, default=1)
+    run.add_argument('--dedup', choices=['hardlink', 'reflink'])
+    add_engine_arguments(run)
+    run.add_argument('--json', help="Write results to this file instead of stdout")
+
+    compare_runs = commands.add_parser('compare', help="Compare two suite results")
+    compare_runs.add_argument('baseline')
+    compare_runs.add_argument('candidate')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'generate':
+        _, description = generate_export(args.output, **generator_options(args))
+        write_json(description, None)
+
+    elif args.command == 'run':
+        os.makedirs(args.output, exist_ok=True)
+        options = {'dedup': args.dedup} if args.dedup else {}
+        if args.buffer_size:
+            options['copy_buffer_size'] = args.buffer_size * 1024
+        if not args.zero_copy:
+            options['zero_copy'] = False
+        if args.pipeline:
+            options['pipeline'] = True
+        if args.processes:
+            options['processes'] = True
+        if args.small_files:
+            options['small_files'] = True
+        if args.low_memory:
+            options['low_memory'] = True
+        if args.sha256:
+            options['sha256'] = True
+        if args.archive:
+            options['archive'] = args.archive
+        if args.path_limits:
+            options['path_limits'] = args.path_limits
+        result = check_rss_ceiling(run_once(expand_zips(args.zips), args.output, args.workers, **options),
+                                   args.rss_ceiling)
+        write_json(result, args.json)
+        if not result.get('within_rss_ceiling', True):
+            return 1
+
+    elif args.command == 'suite':
+        input_folder = tempfile.mkdtemp(prefix='bench-export-')
+        try:
+            start = time.perf_counter()
+            zip_files, description = generate_export(input_folder, **generator_options(args))
+            description['generate_seconds'] = round(time.perf_counter() - start, 2)
+            extra_args = (['--dedup', args.dedup] if args.dedup else []) + engine_args(args)
+            runs = [run_in_subprocess(zip_files, workers, extra_args) for workers in args.workers]
+        finally:
+            shutil.rmtree(input_folder, ignore_errors=True)
+        write_json({'environment': environment(), 'export': description, 'runs': runs}, args.json)
+        if not all(run.get('within_rss_ceiling', True) for run in runs):
+            return 1
+
+    elif args.command == 'compare':
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        with open(args.candidate, 'r', encoding='utf-8') as file:
+            candidate = json.load(file)
+        write_json(compare(baseline, candidate), None)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
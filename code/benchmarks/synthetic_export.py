@@ -0,0 +1,100 @@
+import math
+import os
+import random
+import warnings
+import zipfile
+
+# Google Drive names the parts of a download like this
+PART_NAME = 'drive-download-20240101T000000Z-{:03d}.zip'
+
+WORDS = ['Project', 'Report', 'Meeting notes', 'Photos', 'Budget', 'Thesis', 'Draft', 'Final', 'Lab data',
+         'Scans', 'Shared', 'Archive', 'Copy of', 'Untitled', 'Slides', 'Figures', 'Results', 'Old']
+EXTENSIONS = ['.docx', '.xlsx', '.pptx', '.pdf', '.jpg', '.png', '.txt', '.csv', '.mp4', '']
+INVALID_CHARS = '<>:"|?*'
+
+
+def random_name(rng, long_name_ratio, invalid_char_ratio):
+    name = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+    if rng.random() < long_name_ratio:
+        name = ' - '.join([name] * rng.randint(4, 10))
+    if rng.random() < invalid_char_ratio:
+        name += rng.choice(INVALID_CHARS) + str(rng.randint(1, 99))
+    if rng.random() < 0.1:
+        name += ' '  # Drive keeps trailing spaces
+    return name
+
+
+def random_size(rng, median_size, sigma, max_size):
+    if sigma <= 0:
+        return min(median_size, max_size)
+    return min(max_size, int(rng.lognormvariate(math.log(max(median_size, 1)), sigma)))
+
+
+def random_content(rng, size, compressible):
+    if compressible:
+        line = (' '.join(rng.sample(WORDS, 4)) + '\n').encode()
+        return (line * (size // len(line) + 1))[:size]
+    # Not rng.randbytes(), which Python 3.8 lacks; its getrandbits() also refuses 0 bits
+    return rng.getrandbits(8 * size).to_bytes(size, 'little') if size else b''
+
+
+def generate_export(output_folder, files=1000, parts=4, depth=4, folders=50, median_size=16 * 1024,
+                    size_sigma=1.5, max_size=64 * 1024 * 1024, long_name_ratio=0.05, invalid_char_ratio=0.05,
+                    duplicate_ratio=0.05, stored_ratio=0.3, compressible_ratio=0.7, seed=0):
+    # Writes a split Google Drive download of `files` members into `parts` ZIP files.
+    # Returns the ZIP paths and a description of what was generated.
+    rng = random.Random(seed)
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Folder tree
+    folder_paths = ['My Drive']
+    for _ in range(folders):
+        parent = rng.choice(folder_paths)
+        if parent.count('/') < depth:
+            folder_paths.append(f"{parent}/{random_name(rng, long_name_ratio, invalid_char_ratio)}")
+
+    zip_paths = [os.path.join(output_folder, PART_NAME.format(i + 1)) for i in range(parts)]
+    archives = [zipfile.ZipFile(path, 'w') for path in zip_paths]
+    written = []
+    total_bytes = 0
+    duplicates = 0
+    stored = 0
+    with warnings.catch_warnings():
+        # Repeated names inside one part are intended
+        warnings.simplefilter('ignore', UserWarning)
+        try:
+            for i in range(files):
+                archive = archives[i % parts]
+                if written and rng.random() < duplicate_ratio:
+                    # Drive repeats files across parts, under the same or a different name
+                    name, data = rng.choice(written)
+                    if rng.random() < 0.5:
+                        name = f"{rng.choice(folder_paths)}/{random_name(rng, 0, 0)}{os.path.splitext(name)[1]}"
+                    duplicates += 1
+                else:
+                    name = f"{rng.choice(folder_paths)}/{random_name(rng, long_name_ratio, invalid_char_ratio)}" \
+                           f"{rng.choice(EXTENSIONS)}"
+                    size = random_size(rng, median_size, size_sigma, max_size)
+                    data = random_content(rng, size, rng.random() < compressible_ratio)
+                    if len(written) < 2000 and size <= 1024 * 1024:
+                        written.append((name, data))
+
+                compress_type = zipfile.ZIP_STORED if rng.random() < stored_ratio else zipfile.ZIP_DEFLATED
+                stored += compress_type == zipfile.ZIP_STORED
+                archive.writestr(zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0)), data,
+                                 compress_type=compress_type)
+                total_bytes += len(data)
+        finally:
+            for archive in archives:
+                archive.close()
+
+    return zip_paths, {
+        'files': files,
+        'parts': parts,
+        'folders': len(folder_paths),
+        'total_bytes': total_bytes,
+        'compressed_bytes': sum(os.path.getsize(path) for path in zip_paths),
+        'duplicates': duplicates,
+        'stored_members': stored,
+        'seed': seed,
+    }
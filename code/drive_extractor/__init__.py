@@ -0,0 +1,9 @@
+from .engine import DEFAULT_WORKERS, Extractor
+from .filters import MemberFilter
+from .parts import group_parts
+from .sanitize import MAX_FOLDER_NAME_LENGTH, MAX_PATH_LENGTH, PATH_LIMITS, PathSanitizer
+from .sinks import ArchiveSink, LocalSink, S3Sink
+from .verify import Verifier
+
+__all__ = ['DEFAULT_WORKERS', 'MAX_FOLDER_NAME_LENGTH', 'MAX_PATH_LENGTH', 'PATH_LIMITS', 'ArchiveSink', 'Extractor',
+           'LocalSink', 'MemberFilter', 'PathSanitizer', 'S3Sink', 'Verifier', 'group_parts']
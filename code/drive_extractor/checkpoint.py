@@ -0,0 +1,162 @@
+import functools
+import os
+import pathlib
+import sqlite3
+
+CHECKPOINT_FILE_NAME = 'extraction_checkpoint.sqlite'
+COMMIT_EVERY = 500  # Completed files between checkpoint commits
+
+
+# Records which ZIP member went to which destination, so an interrupted or extended run can
+# pick up where it stopped. Members are keyed by the ZIP file's name and size and infolist()
+# position: the ZIP files may be moved or downloaded again between runs, while parts of different
+# exports that share a name keep their own records. Destinations are stored relative to the output
+# folder so the folder can be moved.
+class Checkpoint:
+    def __init__(self, output_folder, reset=False, zip_files=(), read_only=False):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, CHECKPOINT_FILE_NAME)
+        self.pending_done = []
+        # Sizes are looked up again for every run, the ZIP files may have changed since the last one
+        zip_key.cache_clear()
+
+        if read_only:
+            # For --plan, which writes nothing to the output folder. Without the write-ahead log of a run
+            # still going or killed, the file is read as immutable, so SQLite does not create a log either.
+            has_log = os.path.exists(self.path + '-wal')
+            self.conn = sqlite3.connect(pathlib.Path(self.path).absolute().as_uri() +
+                                        ('?mode=ro' if has_log else '?mode=ro&immutable=1'), uri=True)
+            columns = [column[1] for column in self.conn.execute('PRAGMA table_info(members)')]
+            self.sha256_column = 'sha256' if 'sha256' in columns else 'NULL'
+            # Records under older keys are taken over as they are loaded instead
+            self.older_keys = self.find_older_keys(zip_files)
+            return
+        self.sha256_column = 'sha256'
+        self.older_keys = {}
+
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS members (
+                zip_file TEXT NOT NULL,
+                member_index INTEGER NOT NULL,
+                member TEXT NOT NULL,
+                crc INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                dest TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                sha256 TEXT,
+                PRIMARY KEY (zip_file, member_index)
+            )''')
+        if 'sha256' not in [column[1] for column in self.conn.execute('PRAGMA table_info(members)')]:
+            # Written before files could be hashed
+            self.conn.execute('ALTER TABLE members ADD COLUMN sha256 TEXT')
+        # Files a verify run found intact, with the size and mtime they had then
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS verified (
+                zip_file TEXT NOT NULL,
+                member_index INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                PRIMARY KEY (zip_file, member_index)
+            )''')
+        if reset:
+            self.conn.execute('DELETE FROM members')
+            self.conn.execute('DELETE FROM verified')
+        else:
+            renamed = [(key, older_key) for older_key, key in self.find_older_keys(zip_files).items()]
+            for table in ('members', 'verified'):
+                self.conn.executemany(f'UPDATE OR IGNORE {table} SET zip_file = ? WHERE zip_file = ?', renamed)
+        self.conn.commit()
+
+    def find_older_keys(self, zip_files):
+        # Checkpoints written before keyed members by the ZIP file's name alone, or by its absolute path:
+        # their records go to the ZIP file of this run with that name, unless several have it and nothing
+        # tells which one they belong to. Returns older key -> key.
+        by_name = {}
+        for zip_file in zip_files:
+            by_name.setdefault(os.path.basename(zip_file), []).append(zip_file)
+        older_keys = {}
+        for (key,) in self.conn.execute('SELECT DISTINCT zip_file FROM members'):
+            if '/' in key and not os.path.isabs(key):
+                continue
+            matches = by_name.get(os.path.basename(key), ())
+            if len(matches) == 1 and os.path.isfile(matches[0]):
+                older_keys[key] = zip_key(matches[0])
+        return older_keys
+
+    @staticmethod
+    def key(zip_file, member_index):
+        return zip_key(zip_file), member_index
+
+    def load(self):
+        # (zip file key, member index) -> (member, crc, size, absolute destination, done, sha256 or None)
+        records = {}
+        for zip_file, member_index, member, crc, size, dest, done, sha256 in self.conn.execute(
+                f'SELECT zip_file, member_index, member, crc, size, dest, done, {self.sha256_column} FROM members'):
+            records[(self.older_keys.get(zip_file, zip_file), member_index)] = (
+                member, crc, size, os.path.join(self.output_folder, dest), bool(done), sha256)
+        return records
+
+    def load_range(self, zip_file, first_member, last_member):
+        # Like load(), for the members first_member..last_member of one ZIP file only
+        records = {}
+        key = zip_key(zip_file)
+        for member_index, member, crc, size, dest, done, sha256 in self.conn.execute(
+                'SELECT member_index, member, crc, size, dest, done, sha256 FROM members '
+                'WHERE zip_file = ? AND member_index BETWEEN ? AND ?', (key, first_member, last_member)):
+            records[(key, member_index)] = (member, crc, size, os.path.join(self.output_folder, dest), bool(done),
+                                             sha256)
+        return records
+
+    def destinations(self):
+        # Absolute destination of every recorded member, read as it is iterated
+        for (dest,) in self.conn.execute('SELECT dest FROM members'):
+            yield os.path.join(self.output_folder, dest)
+
+    def record_planned(self, rows):
+        # rows: (zip_file, member_index, member, crc, size, dest), committed before any of them are written
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO members (zip_file, member_index, member, crc, size, dest, done) '
+            'VALUES (?, ?, ?, ?, ?, ?, 0)',
+            [(*self.key(zip_file, member_index), member, crc, size, os.path.relpath(dest, self.output_folder))
+             for zip_file, member_index, member, crc, size, dest in rows])
+        self.conn.commit()
+
+    def record_done(self, zip_file, member_index, sha256=None):
+        self.pending_done.append((sha256, *self.key(zip_file, member_index)))
+        if len(self.pending_done) >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        if self.pending_done:
+            self.conn.executemany('UPDATE members SET done = 1, sha256 = ? WHERE zip_file = ? AND member_index = ?',
+                                  self.pending_done)
+            self.pending_done = []
+        self.conn.commit()
+
+    def load_verified(self):
+        # (zip file key, member index) -> (size, mtime_ns) of the files verify runs found intact
+        return {(zip_file, member_index): (size, mtime_ns) for zip_file, member_index, size, mtime_ns
+                in self.conn.execute('SELECT zip_file, member_index, size, mtime_ns FROM verified')}
+
+    def record_verified(self, intact, failed):
+        # intact: (zip_file, member_index, size, mtime_ns) of files found intact, failed: (zip_file, member_index)
+        self.conn.executemany('INSERT OR REPLACE INTO verified VALUES (?, ?, ?, ?)',
+                              [(*self.key(zip_file, member_index), size, mtime_ns)
+                               for zip_file, member_index, size, mtime_ns in intact])
+        self.conn.executemany('DELETE FROM verified WHERE zip_file = ? AND member_index = ?',
+                              [self.key(zip_file, member_index) for zip_file, member_index in failed])
+        self.conn.commit()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+@functools.lru_cache(maxsize=None)
+def zip_key(zip_file):
+    # A ZIP file's key in the checkpoint, '<name>/<size>', looked up once per ZIP file rather than once
+    # per member. No name holds a slash, which sets these keys apart from names and absolute paths.
+    return f'{os.path.basename(zip_file)}/{os.path.getsize(zip_file)}'
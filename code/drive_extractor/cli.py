@@ -0,0 +1,278 @@
+import argparse
+import contextlib
+import csv
+import datetime
+import os
+import re
+import signal
+import sys
+
+from .dedup import DEDUP_MODES
+from .engine import ALREADY_EXTRACTED, DEFAULT_WORKERS, DUPLICATE_SKIPPED, Extractor
+from .fastcopy import COPY_BUFFER_SIZE
+from .filters import MemberFilter
+from .sanitize import PATH_LIMITS
+from .sinks import ARCHIVE_FORMATS, S3_PART_SIZE, ArchiveSink, LocalSink, S3Sink
+from .statuslog import SANITIZED_DEST, STATUS_FORMATS
+from .verify import VERIFY_SUMMARY_FILE_NAME, Verifier
+from .zipindex import unpack_date_time
+
+PLAN_FIELDS = ['zip_file', 'file', 'size', 'modified', 'destination', 'action']
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(value):
+    # Bytes, or with a K, M, G or T suffix (powers of 1024)
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*', value, re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r}")
+    return int(float(match[1]) * SIZE_UNITS[match[2].upper()])
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {value!r}, use YYYY-MM-DD or YYYY-MM-DDTHH:MM")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='drive_extractor',
+        description="Rebuild the folder structure of a Google Drive download from its ZIP files "
+                    "without opening the GUI.")
+    parser.add_argument('zip_files', nargs='+', metavar='ZIP', help="ZIP files downloaded from Google Drive")
+    parser.add_argument('-o', '--output', required=True, help="Output folder for the extracted files")
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of parallel extraction workers (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--no-resume', dest='resume', action='store_false',
+                        help="Ignore the checkpoint of earlier runs into the output folder and extract everything again")
+    parser.add_argument('--dedup', choices=DEDUP_MODES,
+                        help="Write identical files only once: skip copies at the same path and "
+                             "link copies at other paths to the first one")
+    parser.add_argument('--dedup-verify', action='store_true',
+                        help="Compare the full SHA-256 of duplicates before linking, not only CRC32 and size")
+    parser.add_argument('--status-format', choices=STATUS_FORMATS, default='csv',
+                        help="Write file_status.csv, or a compact columnar file_status.bin for very large runs "
+                             "(convert with: python -m drive_extractor.statuscsv file_status.bin)")
+    parser.add_argument('--buffer-size', type=int, default=COPY_BUFFER_SIZE // 1024, metavar='KIB',
+                        help=f"Copy buffer per worker in KiB (default: {COPY_BUFFER_SIZE // 1024})")
+    parser.add_argument('--no-zero-copy', dest='zero_copy', action='store_false',
+                        help="Read stored (uncompressed) members through zipfile instead of copying them "
+                             "inside the kernel")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Read, decompress and write in separate stages connected by bounded queues, "
+                             "instead of one worker per file")
+    parser.add_argument('--processes', action='store_true',
+                        help="Extract on --workers processes instead of threads, for exports of many small "
+                             "compressed files where one CPU core is the limit (output folder only)")
+    parser.add_argument('--small-files', action='store_true',
+                        help="Extract small files in runs of neighbours in the ZIP file, each run read at once and "
+                             "its files written with as few system calls as possible (Linux and macOS, output "
+                             "folder only)")
+    parser.add_argument('--sha256', action='store_true',
+                        help="Hash every file while it is written and record its SHA-256 in file_status and the "
+                             "checkpoint (turns zero-copy off)")
+    parser.add_argument('--verify', action='store_true',
+                        help="Check the files already in the output folder against the ZIP files instead of "
+                             "extracting: size, CRC32 and the recorded SHA-256, written to verify_report.csv")
+    parser.add_argument('--rehash', action='store_true',
+                        help="With --verify, hash every file again, also those unchanged since the last verification")
+    parser.add_argument('--io-limit', type=parse_size, metavar='SIZE',
+                        help="Write at most SIZE per second, e.g. 50M, to leave disk bandwidth for other work")
+    parser.add_argument('--plan', action='store_true',
+                        help="Print the matching files and where they would be extracted as CSV, without "
+                             "extracting or writing anything to the output folder")
+    parser.add_argument('--index', action='store_true',
+                        help="Keep an index of each ZIP file's central directory next to it (<zip>.index) and read "
+                             "that instead of the ZIP file on later runs")
+
+    filters = parser.add_argument_group(
+        'filters', "Only extract (or plan, or verify) the files that match. Patterns are matched against the "
+                   "file's path in the export, e.g. 'My Drive/Photos/2023/img.jpg'; each option can be repeated.")
+    filters.add_argument('--include', action='append', default=[], metavar='GLOB',
+                         help="Glob the whole path must match, case-insensitive, * also matches / "
+                              "(e.g. 'My Drive/Photos/*' or '*.pdf')")
+    filters.add_argument('--exclude', action='append', default=[], metavar='GLOB', help="Glob to leave out")
+    filters.add_argument('--include-regex', action='append', default=[], metavar='REGEX',
+                         help="Regular expression to search the path for")
+    filters.add_argument('--exclude-regex', action='append', default=[], metavar='REGEX',
+                         help="Regular expression to leave out")
+    filters.add_argument('--min-size', type=parse_size, metavar='SIZE', help="Smallest file size, e.g. 500K")
+    filters.add_argument('--max-size', type=parse_size, metavar='SIZE', help="Largest file size, e.g. 2G")
+    filters.add_argument('--modified-after', type=parse_date, metavar='DATE',
+                         help="Only files modified at or after DATE (YYYY-MM-DD[THH:MM], as stored in the ZIP)")
+    filters.add_argument('--modified-before', type=parse_date, metavar='DATE',
+                         help="Only files modified before DATE")
+
+    output = parser.add_argument_group(
+        'output', "Write the files somewhere else than the output folder, which then only keeps the logs "
+                  "and the checkpoint")
+    output.add_argument('--archive', metavar='PATH',
+                        help="Write all files into one archive instead: PATH ending in .zip (ZIP64), .tar, .tar.gz "
+                             "or .tgz, or - for standard output together with --archive-format")
+    output.add_argument('--archive-format', choices=sorted(set(ARCHIVE_FORMATS.values())),
+                        help="Archive format when it cannot be told from the name")
+    output.add_argument('--s3', metavar='URL',
+                        help="Upload the files to s3://bucket/prefix instead, with the credentials of the usual "
+                             "AWS configuration (needs boto3)")
+    output.add_argument('--s3-endpoint', metavar='URL',
+                        help="Endpoint of an S3-compatible store, e.g. http://localhost:9000 for MinIO")
+    output.add_argument('--upload-part-size', type=parse_size, default=S3_PART_SIZE, metavar='SIZE',
+                        help=f"Files larger than this are uploaded in parts of this size "
+                             f"(default: {S3_PART_SIZE // 1024 ** 2}M, at least 5M)")
+    output.add_argument('--path-limits', choices=sorted(PATH_LIMITS),
+                        help="Length limits for names and paths: windows keeps names to 50 characters and paths to "
+                             "260 on any platform (default: this platform's for a folder, posix for an archive, "
+                             "s3 for S3)")
+
+    parser.add_argument('--low-memory', action='store_true',
+                        help="Keep memory flat for exports with millions of files, at some cost in speed")
+    parser.add_argument('--prometheus-file', metavar='PATH',
+                        help="Also write the run's metrics in Prometheus text format, e.g. for the node_exporter "
+                             "textfile collector (extraction_metrics.json is always written)")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="Profile the run with cProfile, all threads, and write the stats to PATH "
+                             "(read with python -m pstats PATH)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.workers < 1:
+        print("error: --workers must be at least 1", file=sys.stderr)
+        return 2
+
+    if args.buffer_size < 1:
+        print("error: --buffer-size must be at least 1", file=sys.stderr)
+        return 2
+
+    missing = [f for f in args.zip_files if not os.path.isfile(f)]
+    if missing:
+        print(f"error: ZIP file not found: {missing[0]}", file=sys.stderr)
+        return 2
+
+    try:
+        member_filter = build_filter(args)
+    except re.error as e:
+        print(f"error: invalid regular expression: {e}", file=sys.stderr)
+        return 2
+
+    if args.verify:
+        if args.archive or args.s3:
+            print("error: --verify checks the files in the output folder, not in an archive or S3", file=sys.stderr)
+            return 2
+        return verify(args, member_filter)
+
+    try:
+        extractor = Extractor(args.zip_files, args.output, max_workers=args.workers, resume=args.resume,
+                              dedup=args.dedup, dedup_verify=args.dedup_verify, status_format=args.status_format,
+                              copy_buffer_size=args.buffer_size * 1024, zero_copy=args.zero_copy,
+                              prometheus_file=args.prometheus_file, profile_file=args.profile,
+                              pipeline=args.pipeline, processes=args.processes,
+                              small_files=args.small_files, low_memory=args.low_memory, sha256=args.sha256,
+                              member_filter=member_filter, zip_index=args.index, io_limit=args.io_limit,
+                              sink=build_sink(args))
+    except (ValueError, RuntimeError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if args.plan:
+        return plan(extractor)
+
+    os.makedirs(args.output, exist_ok=True)
+    with cancel_on_signals(extractor.control):
+        extractor.process_zips()
+
+    # Echo the processing summary, not into an archive written to standard output
+    with open(os.path.join(args.output, 'processing_summary.txt'), 'r', encoding='utf-8') as file:
+        print(file.read(), end='', file=sys.stderr if args.archive == '-' else sys.stdout)
+
+    # Non-zero exit status if any file could not be extracted, even after error processing
+    if extractor.cancelled:
+        return 130
+    if extractor.total_errors > 0:
+        return 1 if extractor.errors_failed else 0
+    return 1 if extractor.files_errors else 0
+
+
+@contextlib.contextmanager
+def cancel_on_signals(control):
+    # Ctrl+C or SIGTERM cancels the run: files in flight are dropped, and the logs, checkpoint and summary
+    # are written as usual. A second Ctrl+C stops at once.
+    def cancel(signum, frame):
+        print("Cancelling, finishing the logs (Ctrl+C again to stop at once)...", file=sys.stderr)
+        control.cancel()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    handlers = {signum: signal.signal(signum, cancel) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        yield
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+
+def build_sink(args):
+    # Where the files go, the output folder when no other output is given
+    if args.archive and args.s3:
+        raise ValueError("--archive and --s3 cannot be used together")
+    if args.archive:
+        return ArchiveSink(args.archive, args.archive_format, path_limits=args.path_limits or 'posix')
+    if args.s3:
+        return S3Sink(args.s3, endpoint_url=args.s3_endpoint, part_size=args.upload_part_size,
+                      path_limits=args.path_limits or 's3')
+    return LocalSink(args.path_limits) if args.path_limits else LocalSink()
+
+
+def build_filter(args):
+    # None when no filter option is given
+    if not (args.include or args.exclude or args.include_regex or args.exclude_regex or args.min_size is not None
+            or args.max_size is not None or args.modified_after or args.modified_before):
+        return None
+    return MemberFilter(include=args.include, exclude=args.exclude, include_regex=args.include_regex,
+                        exclude_regex=args.exclude_regex, min_size=args.min_size, max_size=args.max_size,
+                        modified_after=args.modified_after, modified_before=args.modified_before)
+
+
+def plan(extractor):
+    writer = csv.writer(sys.stdout)
+    try:
+        writer.writerow(PLAN_FIELDS)
+        for zip_file, entry, file_status, dest_path, duplicate in extractor.plan():
+            if entry is None:
+                writer.writerow([zip_file, '', '', '', '', str(dest_path)])
+                continue
+            manifest = extractor.manifest
+            if dest_path is ALREADY_EXTRACTED:
+                dest_path, action = file_status[SANITIZED_DEST], 'already extracted'
+            elif dest_path is DUPLICATE_SKIPPED:
+                dest_path, action = file_status[SANITIZED_DEST], 'duplicate, skipped'
+            elif isinstance(dest_path, Exception):
+                dest_path, action = '', f"error: {dest_path}"
+            elif duplicate is not None:
+                action = f"link to {duplicate[1]}"
+            else:
+                action = 'extract'
+            modified = datetime.datetime(*unpack_date_time(manifest.date_time[entry]))
+            writer.writerow([zip_file, manifest.names[entry], manifest.file_size[entry], modified, dest_path, action])
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader stopped early, e.g. head: send what is still buffered nowhere, so exiting does not
+        # fail on it again, and stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return 0
+
+
+def verify(args, member_filter):
+    verifier = Verifier(args.zip_files, args.output, max_workers=args.workers, rehash=args.rehash,
+                        member_filter=member_filter, zip_index=args.index)
+    try:
+        verifier.verify()
+    except FileNotFoundError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    with open(os.path.join(args.output, VERIFY_SUMMARY_FILE_NAME), 'r', encoding='utf-8') as file:
+        print(file.read(), end='')
+    return 1 if verifier.failed else 0
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEDUP_MODES = ('hardlink', 'reflink')
+FICLONE = 0x40049409  # Linux ioctl to share extents between two files (Btrfs, XFS, ...)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+# Finds members whose content was already seen in this run, using the CRC32 and size from
+# the central directory, so duplicates are caught before anything is decompressed.
+class DuplicateIndex:
+    def __init__(self):
+        self.by_content = {}  # (crc, size) -> (destination, manifest entry)
+        self.by_path = {}     # (logical path, crc, size) -> (destination, manifest entry)
+
+    def find(self, logical_path, crc, size):
+        # Returns (same logical path, destination, entry) of the first copy, None for new content
+        source = self.by_path.get((logical_path, crc, size))
+        if source is not None:
+            return (True,) + source
+        if size == 0:
+            # Empty files are cheaper to create than to link
+            return None
+        source = self.by_content.get((crc, size))
+        if source is not None:
+            return (False,) + source
+        return None
+
+    def add(self, logical_path, crc, size, dest_path, entry):
+        self.by_path.setdefault((logical_path, crc, size), (dest_path, entry))
+        self.by_content.setdefault((crc, size), (dest_path, entry))
+
+
+def hash_stream(stream):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    with open(path, 'rb') as file:
+        return hash_stream(file)
+
+
+def reflink(source_path, dest_path):
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform")
+    with open(source_path, 'rb') as source, open(dest_path, 'wb') as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+
+def link_file(source_path, dest_path, mode):
+    # Materialise dest_path with the content of source_path, returns how it was done.
+    # Falls back to a plain copy when the filesystem cannot link (FAT, cross-device, ...).
+    if os.path.lexists(dest_path):
+        os.remove(dest_path)
+    try:
+        if mode == 'reflink':
+            reflink(source_path, dest_path)
+        else:
+            os.link(source_path, dest_path)
+        return mode
+    except OSError:
+        shutil.copyfile(source_path, dest_path)
+        return 'copy'
@@ -0,0 +1,992 @@
+import os
+import hashlib
+import zipfile
+import threading
+import itertools
+import time
+import collections
+import concurrent.futures
+import contextlib
+
+from .checkpoint import CHECKPOINT_FILE_NAME, Checkpoint
+from .dedup import DEDUP_MODES, DuplicateIndex, hash_file, hash_stream
+from .errorlog import ERROR_FIELDS, FIXED_ERROR_FIELDS, CsvLog, ErrorRecords
+from .fastcopy import COPY_BUFFER_SIZE, can_copy_raw, copy_raw, copy_stream
+from .filters import logical_path
+from .jobs import Cancelled, JobControl
+from .manifest import Manifest, MemberInfos
+from .metrics import METRICS_FILE_NAME, Metrics, Profiler, write_json, write_prometheus
+from .parts import group_parts
+from .pathindex import PATH_INDEX_FILE_NAME, PathIndex, has_content
+from .pipeline import Pipeline
+from .procpool import PROCESS_SHARD_SIZE, ProcessShards
+from .progress import ProgressChannel
+from .sanitize import PathSanitizer
+from .sinks import LocalSink
+from .smallfiles import SMALL_FILES_SUPPORTED, FolderWriter, RunReader, is_small, small_runs
+from .statuslog import (MOVED, ORIGINAL_DEST, REASON, SANITIZED_DEST, SANITIZED_NAME, SHA256, STATUS_FORMATS,
+                        new_status, open_status_writer)
+from .zipindex import unpack_date_time
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)  # Parallel extraction workers
+PLAN_CHUNK_SIZE = 256        # Destinations planned and checkpointed at a time
+
+# Files the extractor itself writes to the output folder
+OUTPUT_LOG_FILES = {'file_status.csv', 'file_status.bin', 'error_log.csv', 'fixed_errors.csv', 'final_errors.csv',
+                    'processing_summary.txt', METRICS_FILE_NAME, CHECKPOINT_FILE_NAME, CHECKPOINT_FILE_NAME + '-wal',
+                    CHECKPOINT_FILE_NAME + '-shm', PATH_INDEX_FILE_NAME, 'verify_report.csv', 'verify_summary.txt'}
+
+ALREADY_EXTRACTED = object()  # Planned destination of members an earlier run already extracted
+DUPLICATE_SKIPPED = object()  # Planned destination of identical members at an already planned path
+
+# Destinations tried, in order, for files the first pass could not extract: (label, PathSanitizer method)
+RECOVERY_STRATEGIES = [('short path', 'short_path'), ('hashed path', 'hashed_path')]
+RECOVERY_BATCH_SIZE = 4096   # Error records retried at a time
+
+
+def format_size(num_bytes):
+    if num_bytes < 1024:
+        return f"{num_bytes} B"
+    for unit in ('KB', 'MB', 'GB', 'TB'):
+        num_bytes /= 1024
+        if num_bytes < 1024 or unit == 'TB':
+            return f"{num_bytes:.1f} {unit}"
+
+
+class Extractor:
+    def __init__(self, zip_files, output_folder, max_workers=DEFAULT_WORKERS, queue=None, progress_by_bytes=False,
+                 resume=True, dedup=None, dedup_verify=False, status_format='csv', copy_buffer_size=COPY_BUFFER_SIZE,
+                 zero_copy=True, prometheus_file=None, profile_file=None, pipeline=False,
+                 low_memory=False, sha256=False, member_filter=None, zip_index=False, control=None, io_limit=None,
+                 sink=None, processes=False, small_files=False):
+        # Parts of the same Google Drive download are grouped and put in part order, so the result
+        # (which of two same-named files keeps its name) does not depend on the order they were picked
+        self.export_sets = group_parts(zip_files)
+        self.zip_files = [zip_file for export_set in self.export_sets for zip_file in export_set.zip_files]
+        self.output_folder = output_folder
+
+        # Progress tracker
+        self.total_files = 0
+        self.total_bytes = 0
+        self.files_processed = 0
+        self.files_errors = 0
+        self.files_skipped = 0
+
+        # Deduplication tracker
+        self.duplicates_skipped = 0
+        self.duplicates_linked = 0
+        self.duplicate_bytes_saved = 0
+
+        # Error processing tracker
+        self.total_errors = 0
+        self.errors_fixed = 0
+        self.errors_failed = 0
+        self.errors = []
+
+        # Where the files go: the output folder by default, or one archive or an object store (see sinks).
+        # The output folder always keeps the logs and the checkpoint. Names are kept within the sink's limits.
+        self.sink = sink if sink is not None else LocalSink()
+        self.sink.attach(output_folder, max(1, max_workers))
+        self.sanitizer = PathSanitizer(output_folder, limits=self.sink.path_limits, relative=not self.sink.local)
+        self.path_index = None
+
+        # Pause, resume and cancel from another thread, and a limit on the bytes written per second
+        self.control = control if control is not None else JobControl()
+        if io_limit:
+            self.control.io_limit = io_limit
+        self.cancelled = False
+
+        # Progress messages for a GUI, None when running headless
+        self.queue = queue
+        self.progress = ProgressChannel(queue)
+        self.progress_by_bytes = progress_by_bytes
+        self.resume = resume and self.sink.resumable
+
+        # Deduplicate identical members: None, 'hardlink' or 'reflink'
+        if dedup is not None and dedup not in DEDUP_MODES:
+            raise ValueError(f"dedup must be one of {DEDUP_MODES}, not {dedup!r}")
+        self.dedup = dedup
+        self.dedup_verify = dedup_verify
+        if dedup_verify and not self.sink.local:
+            raise ValueError("dedup_verify compares with the first copy on disk, it needs the local sink")
+
+        # file_status as CSV, or as a compact columnar file for very large runs
+        if status_format not in STATUS_FORMATS:
+            raise ValueError(f"status_format must be one of {STATUS_FORMATS}, not {status_format!r}")
+        self.status_format = status_format
+
+        self.manifest = None
+
+        # Only extract the members a filters.MemberFilter matches, and read the central directories
+        # through index files kept next to the ZIP files
+        self.member_filter = member_filter
+        self.zip_index = zip_index
+
+        # Copying: buffer size per worker, and whether stored members are copied by the kernel
+        if copy_buffer_size < 1:
+            raise ValueError("copy_buffer_size must be at least 1")
+        self.copy_buffer_size = copy_buffer_size
+
+        # SHA-256 of every file, computed while it is written and recorded in file_status and the checkpoint.
+        # Bytes the kernel copies never pass through Python, so hashing turns zero-copy off.
+        self.sha256 = sha256
+        self.zero_copy = zero_copy and not sha256
+
+        # Read, decompress and write in separate stages instead of one worker per file. Its writers take
+        # turns between files, which a sink writing a single stream cannot follow.
+        self.pipeline = pipeline and self.sink.concurrent_writes
+
+        # Extract on max_workers processes instead of threads, for many small compressed members where
+        # the Python work around each one keeps a single core busy. Only into the output folder.
+        self.processes = processes and self.sink.local
+        if self.pipeline and self.processes:
+            raise ValueError("pipeline and processes cannot be used together")
+
+        # Extract small members in runs of neighbours: one read from the archive per run, and files written
+        # relative to their folder's descriptor. Only into the output folder and on the worker pool.
+        self.small_files = small_files and self.sink.local and SMALL_FILES_SUPPORTED
+        if small_files and (self.pipeline or self.processes):
+            raise ValueError("small_files cannot be used with pipeline or processes")
+
+        # Keep memory flat for exports with millions of members: workers open members from the manifest
+        # instead of each holding every archive's infolist(), the path index lives in an SQLite file,
+        # the checkpoint is read as needed and error records are read back from error_log.csv
+        self.low_memory = low_memory
+
+        # Stage timings for extraction_metrics.json and an optional Prometheus textfile,
+        # and a cProfile of every thread when profile_file is set
+        self.metrics = Metrics()
+        self.prometheus_file = prometheus_file
+        self.profiler = Profiler(profile_file) if profile_file else None
+
+        # Worker pool, shared by the extraction and the error recovery pass
+        self.max_workers = max(1, max_workers)
+        self.executor = None
+        self.worker_local = threading.local()
+        self.worker_zips = []
+        self.worker_zips_lock = threading.Lock()
+        self.worker_folders_open = []
+
+    def notify(self, msg):
+        self.progress.post(msg)
+
+    def process_zips(self):
+        self.metrics.start()
+        if self.profiler is not None:
+            self.profiler.start_thread()
+        try:
+            # Both passes use the same workers, so ZIP files opened for extraction stay open for recovery
+            with self.worker_pool():
+                # 1: Extract folder structure
+                self.notify(('update_progress_label_extracting', "Extracting files..."))
+                self.extract_files()
+
+                # 2: Process errors (if any)
+                if self.errors:
+                    self.notify(('update_progress_label_errors', "Processing errors..."))
+                    with self.metrics.timed('error_recovery'):
+                        self.process_errors(self.errors)
+        except Cancelled:
+            # Files being written were dropped. The logs and checkpoint are closed as usual, files finished
+            # after the last one logged are extracted again by the next run.
+            self.cancelled = True
+            self.notify(('update_progress_label_extracting', "Extraction cancelled"))
+        finally:
+            # Finishes the archive, also when cancelled, with the files written so far
+            self.sink.close()
+            if self.path_index is not None:
+                self.path_index.close()
+            if self.profiler is not None:
+                self.profiler.stop()
+        self.metrics.finish()
+
+        # Write processing summary to text file
+        self.write_processing_summary()
+        self.write_metrics()
+        self.progress.flush()
+
+    @contextlib.contextmanager
+    def worker_pool(self):
+        # Reuses the pool of an enclosing call, otherwise starts one and closes its ZIP handles at the end
+        if self.executor is not None:
+            yield self.executor
+            return
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, initializer=self.profiler.start_thread if self.profiler else None)
+        self.executor = executor
+        try:
+            yield executor
+        finally:
+            self.executor = None
+            executor.shutdown()
+            self.close_worker_zips()
+
+    @contextlib.contextmanager
+    def extraction_stages(self):
+        # The pipelined engine or the worker processes when enabled, None to extract each file on one worker
+        if self.processes:
+            shards = ProcessShards(self.manifest, self.metrics, self.max_workers, zero_copy=self.zero_copy,
+                                   copy_buffer_size=self.copy_buffer_size, sha256=self.sha256, control=self.control)
+            try:
+                yield shards
+            finally:
+                shards.close()
+            return
+        if not self.pipeline:
+            yield None
+            return
+        pipeline = Pipeline(self.worker_zip, self.extract_member, self.metrics, self.max_workers,
+                            zero_copy=self.zero_copy, initializer=self.profiler.start_thread if self.profiler else None,
+                            sha256=self.sha256, control=self.control, sink=self.sink)
+        try:
+            yield pipeline
+        finally:
+            pipeline.close()
+
+    def extract_files(self):
+        # Read every central directory once, this drives both the progress totals and the extraction
+        with self.metrics.timed('central_directory'):
+            self.manifest = manifest = Manifest(self.zip_files, self.member_filter, self.zip_index)
+        self.total_files = total_files = len(manifest)
+        self.total_bytes = total_bytes = manifest.total_size
+        processed_entries = 0
+        processed_bytes = 0
+
+        # Errors from an earlier run must not be processed again. This run's errors are written to
+        # error_log.csv as they happen and retried once the first pass is done.
+        error_log_file = os.path.join(self.output_folder, 'error_log.csv')
+        if os.path.exists(error_log_file):
+            os.remove(error_log_file)
+        self.errors = errors = ErrorRecords(self.output_folder, compact=self.low_memory)
+
+        # Pick up what earlier runs into this output folder already extracted
+        with self.metrics.timed('checkpoint'):
+            checkpoint = Checkpoint(self.output_folder, reset=not self.resume, zip_files=self.zip_files)
+            recorded = None if self.low_memory else checkpoint.load()
+        self.path_index = PathIndex(self.output_folder, self.sink.path_limits,
+                                    merge=self.sink.local and has_content(self.output_folder, ignore=OUTPUT_LOG_FILES),
+                                    spill_path=os.path.join(self.output_folder, PATH_INDEX_FILE_NAME)
+                                    if self.low_memory else None, create_dirs=self.sink.local,
+                                    clean_temp=self.sink.local)
+        if recorded is None:
+            for dest_path in checkpoint.destinations():
+                self.path_index.claim(dest_path)
+        else:
+            for record in recorded.values():
+                self.path_index.claim(record[3])
+        with self.metrics.timed('reserve_folders'):
+            self.reserve_folders()
+
+        # Destination paths are planned here, in order, and the copies are handed to the worker pool.
+        # Results are drained in the same order so the CSV logs match a serial run.
+        pending = collections.deque()
+        max_pending = self.max_workers * (PROCESS_SHARD_SIZE * 2 if self.processes else 4)
+
+        # Content seen so far and the extractions still in flight, when deduplicating
+        duplicates = DuplicateIndex() if self.dedup else None
+        futures = {}
+        submitted = {}  # Entry -> destination, while its extraction is in flight
+
+        # Log status for each file
+        with open_status_writer(self.output_folder, self.status_format, hashed=self.sha256) as status_log, \
+                self.worker_pool() as executor, self.extraction_stages() as stages:
+
+            def drain_one():
+                nonlocal processed_entries, processed_bytes
+                zip_file, entry, file_status, result = pending.popleft()
+
+                # ZIP file errors
+                if file_status is None:
+                    errors.append({'zip_file': zip_file, 'file': '', 'error_message': result})
+                    self.files_errors += 1
+                    self.update_file_progress()
+                    return
+
+                file = manifest.names[entry]
+                futures.pop(entry, None)
+                dest_path = submitted.pop(entry, None)
+                if result is ALREADY_EXTRACTED:
+                    self.files_skipped += 1
+                    file_status[MOVED] = 'True'
+                    file_status[REASON] = 'Already extracted'
+                elif result is DUPLICATE_SKIPPED:
+                    self.duplicates_skipped += 1
+                    self.duplicate_bytes_saved += manifest.file_size[entry]
+                    file_status[MOVED] = 'True'
+                    file_status[REASON] = f"Duplicate of {file_status[SANITIZED_DEST]}, skipped"
+                else:
+                    try:
+                        if isinstance(result, Exception):
+                            raise result
+                        start = time.perf_counter()
+                        sha256 = result.result()
+                        self.metrics.add('wait_for_workers', time.perf_counter() - start)
+                        if isinstance(sha256, tuple):
+                            # Linked to the first copy
+                            source_path, link_method, sha256 = sha256
+                            self.duplicates_linked += 1
+                            if link_method != 'copy':
+                                self.duplicate_bytes_saved += manifest.file_size[entry]
+                            file_status[REASON] = f"Duplicate of {source_path}, {link_method}"
+                        checkpoint.record_done(zip_file, manifest.member[entry], sha256)
+                        self.files_processed += 1
+                        file_status[MOVED] = 'True'
+                        if self.sha256:
+                            file_status[SHA256] = sha256
+                    except Cancelled:
+                        raise
+                    except Exception as e:
+                        errors.append({'zip_file': zip_file, 'file': file, 'error_message': str(e), 'entry': entry,
+                                       'dest_path': dest_path})
+                        self.files_errors += 1
+                        file_status[MOVED] = 'False'
+                        file_status[REASON] = str(e)
+
+                # Log the file status
+                start = time.perf_counter()
+                status_log.add(file_status)
+                self.metrics.add('status_logging', time.perf_counter() - start)
+
+                # Update progress
+                processed_entries += 1
+                processed_bytes += manifest.file_size[entry]
+                if self.progress.due():
+                    self.update_extract_progress(processed_entries, total_files, processed_bytes, total_bytes)
+                    self.update_file_progress()
+
+            try:
+                for archive_index, zip_file in enumerate(manifest.zip_files):
+                    if archive_index in manifest.zip_errors:
+                        pending.append((zip_file, None, None, manifest.zip_errors[archive_index]))
+                        continue
+
+                    try:
+                        entries = manifest.entries(archive_index)
+                        for chunk_start in range(entries.start, entries.stop, PLAN_CHUNK_SIZE):
+                            self.control.wait()
+                            start = time.perf_counter()
+                            chunk = range(chunk_start, min(chunk_start + PLAN_CHUNK_SIZE, entries.stop))
+                            chunk_recorded = recorded
+                            if chunk_recorded is None:
+                                chunk_recorded = checkpoint.load_range(zip_file, manifest.member[chunk[0]],
+                                                                       manifest.member[chunk[-1]])
+                            planned = []
+                            for entry in chunk:
+                                planned.append((entry,) + self.plan_entry(zip_file, entry, chunk_recorded,
+                                                                          duplicates))
+                            self.metrics.add('planning', time.perf_counter() - start)
+                            with self.metrics.timed('create_dirs'):
+                                failed_dirs = self.path_index.create_pending_dirs()
+
+                            # Destinations are committed to the checkpoint before anything is written to them
+                            with self.metrics.timed('checkpoint'):
+                                checkpoint.record_planned(
+                                    (zip_file, manifest.member[entry], manifest.names[entry], manifest.crc[entry],
+                                     manifest.file_size[entry], dest_path)
+                                    for entry, _, dest_path, _ in planned if isinstance(dest_path, str))
+
+                            # Small members are extracted in runs of neighbours in the archive. The runs go to
+                            # the pool first: links to their files wait for them, and must not wait in front of them.
+                            small = {}
+                            if self.small_files:
+                                members = [(entry, dest_path, concurrent.futures.Future())
+                                           for entry, _, dest_path, duplicate in planned
+                                           if isinstance(dest_path, str) and duplicate is None and
+                                           os.path.dirname(dest_path) not in failed_dirs and is_small(manifest, entry)]
+                                small = {entry: future for entry, _, future in members}
+                                for run in small_runs(manifest, members):
+                                    executor.submit(self.extract_small_run, zip_file, run)
+
+                            # Start the largest files of the chunk first, so no worker is left with a big file
+                            # at the end while the others wait. Results are still drained in plan order. The
+                            # archives stay in part order: planning follows it, and so do the names chosen.
+                            results = {}
+                            for entry, file_status, dest_path, duplicate in sorted(
+                                    planned, key=lambda item: -manifest.file_size[item[0]]):
+                                if isinstance(dest_path, str) and os.path.dirname(dest_path) in failed_dirs:
+                                    results[entry] = failed_dirs[os.path.dirname(dest_path)]
+                                elif isinstance(dest_path, str):
+                                    submitted[entry] = dest_path
+                                    if duplicate is not None:
+                                        # Link to the first copy once it has been written
+                                        source_path, source_entry = duplicate[1:]
+                                        future = executor.submit(self.link_member, zip_file, manifest.member[entry],
+                                                                 dest_path, source_path, futures.get(source_entry),
+                                                                 unpack_date_time(manifest.date_time[source_entry]))
+                                    elif entry in small:
+                                        # Already in a run
+                                        future = small[entry]
+                                    elif stages is None:
+                                        # Extract the file
+                                        future = executor.submit(self.extract_member, zip_file,
+                                                                 manifest.member[entry], dest_path)
+                                    else:
+                                        # Read, decompress and write it in the pipeline's stages, or in a
+                                        # shard for the worker processes
+                                        future = stages.submit(zip_file, manifest.member[entry], dest_path)
+                                    if duplicates is not None:
+                                        futures[entry] = future
+                                    results[entry] = future
+                                else:
+                                    results[entry] = dest_path
+                            if self.processes:
+                                # The chunk's members go out in shards before any of them is waited for
+                                stages.flush()
+
+                            for entry, file_status, _, _ in planned:
+                                pending.append((zip_file, entry, file_status, results[entry]))
+                                while len(pending) > max_pending:
+                                    drain_one()
+
+                    except Cancelled:
+                        raise
+                    except Exception as e:
+                        pending.append((zip_file, None, None, f"Error processing ZIP file: {str(e)}"))
+
+                while pending:
+                    drain_one()
+            finally:
+                checkpoint.close()
+                errors.close()
+
+        # Final counters
+        self.update_extract_progress(processed_entries, total_files, processed_bytes, total_bytes)
+        self.update_file_progress()
+        self.progress.flush()
+
+    def plan(self):
+        # Plans every member like extract_files() without writing anything to the output folder.
+        # Yields (zip file, entry, file status, destination, duplicate) in extraction order, with
+        # entry and file status None for ZIP files that could not be read; the destination is a path,
+        # ALREADY_EXTRACTED, DUPLICATE_SKIPPED or the exception that keeps the member from being extracted.
+        self.manifest = manifest = Manifest(self.zip_files, self.member_filter, self.zip_index)
+        self.total_files = len(manifest)
+        self.total_bytes = manifest.total_size
+
+        recorded = {}
+        if self.resume and os.path.exists(os.path.join(self.output_folder, CHECKPOINT_FILE_NAME)):
+            checkpoint = Checkpoint(self.output_folder, zip_files=self.zip_files, read_only=True)
+            recorded = checkpoint.load()
+            checkpoint.close()
+        self.path_index = PathIndex(self.output_folder, self.sink.path_limits,
+                                    merge=self.sink.local and has_content(self.output_folder, ignore=OUTPUT_LOG_FILES))
+        for record in recorded.values():
+            self.path_index.claim(record[3])
+        self.reserve_folders()
+
+        duplicates = DuplicateIndex() if self.dedup else None
+        for archive_index, zip_file in enumerate(manifest.zip_files):
+            if archive_index in manifest.zip_errors:
+                yield zip_file, None, None, Exception(manifest.zip_errors[archive_index]), None
+                continue
+            for entry in manifest.entries(archive_index):
+                yield (zip_file, entry) + self.plan_entry(zip_file, entry, recorded, duplicates)
+
+    def reserve_folders(self):
+        # Claim every folder of the manifest before any file is planned, so a file named like
+        # a folder next to it is renamed instead of blocking the folder
+        folders = set()
+        for folder in self.manifest.names.folders:
+            folders.add(self.normalize_member_name(folder).rpartition('/')[0])
+        folders.discard('')
+        for folder in sorted(folders):
+            sanitized_folder, _ = self.sanitizer.sanitize_folder(folder)
+            self.path_index.names_in(os.path.normpath(os.path.join(self.output_folder, sanitized_folder)))
+
+    def plan_entry(self, zip_file, entry, recorded, duplicates):
+        # Returns (file status, destination or marker, duplicate) for one manifest entry
+        manifest = self.manifest
+        file = manifest.names[entry]
+        crc = manifest.crc[entry]
+        size = manifest.file_size[entry]
+        logical_path = self.normalize_member_name(file)
+
+        record = recorded.get(Checkpoint.key(zip_file, manifest.member[entry]))
+        if record and record[:3] == (file, crc, size):
+            # Same member as last time, keep its destination
+            dest_path = record[3]
+            file_status = self.resumed_status(file, dest_path)
+            if record[4] and self.sink.exists(dest_path, size):
+                if self.sha256:
+                    file_status[SHA256] = record[5] or ''
+                if duplicates is not None:
+                    duplicates.add(logical_path, crc, size, dest_path, entry)
+                return file_status, ALREADY_EXTRACTED, None
+            duplicate = duplicates.find(logical_path, crc, size) if duplicates is not None else None
+        else:
+            duplicate = duplicates.find(logical_path, crc, size) if duplicates is not None else None
+            if duplicate is not None and duplicate[0]:
+                # Identical content at the same path, nothing to write
+                return self.resumed_status(file, duplicate[1]), DUPLICATE_SKIPPED, duplicate
+            file_status, dest_path = self.plan_destination(file)
+
+        if duplicates is not None and isinstance(dest_path, str):
+            duplicates.add(logical_path, crc, size, dest_path, entry)
+        return file_status, dest_path, duplicate
+
+    @staticmethod
+    def normalize_member_name(file):
+        # Remove any leading drive letters and slashes, replace backslashes
+        return logical_path(file)
+
+    def resumed_status(self, file, dest_path):
+        # File status for a member whose destination was planned by an earlier run
+        file_status = new_status(file, self.sha256)
+        file_status[SANITIZED_NAME] = os.path.basename(dest_path)
+        file_status[ORIGINAL_DEST] = os.path.join(self.output_folder, self.normalize_member_name(file))
+        file_status[SANITIZED_DEST] = dest_path
+        return file_status
+
+    def plan_destination(self, file):
+        # Initialize file status dictionary
+        file_status = new_status(file, self.sha256)
+        file_norm = self.normalize_member_name(file)
+
+        # Sanitize the path (including trailing spaces)
+        sanitized_file_mapped = self.sanitize_path(file_norm)
+
+        # Update file status
+        file_status[SANITIZED_NAME] = os.path.basename(sanitized_file_mapped)
+        file_status[ORIGINAL_DEST] = os.path.join(self.output_folder, file_norm)
+        file_status[SANITIZED_DEST] = os.path.join(self.output_folder, sanitized_file_mapped)
+
+        # Set destination path, claiming a free name in its folder
+        original_dest_path = os.path.normpath(file_status[SANITIZED_DEST])
+        start = time.perf_counter()
+        dest_path = self.path_index.resolve(original_dest_path)
+        self.metrics.add('collision_resolution', time.perf_counter() - start)
+
+        # Update sanitized path and file status if changed
+        if dest_path != original_dest_path:
+            self.metrics.count('collisions_renamed')
+            file_status[SANITIZED_DEST] = dest_path
+            file_status[SANITIZED_NAME] = os.path.basename(dest_path)
+
+        # Make sure path length is within the limit
+        if self.sanitizer.limits.length(dest_path) > self.sanitizer.max_path_length:
+            # Shorten the path if needed
+            try:
+                dest_path = self.shorten_path(dest_path, sanitized_file_mapped)
+            except Exception as e:
+                return file_status, e
+
+        return file_status, dest_path
+
+    def worker_zip(self, zip_file):
+        # Runs on a worker thread, each worker keeps its own handle per ZIP file
+        if self.low_memory:
+            return self.shared_zip(zip_file)
+        handles = getattr(self.worker_local, 'zips', None)
+        if handles is None:
+            handles = self.worker_local.zips = {}
+            with self.worker_zips_lock:
+                self.worker_zips.append(handles)
+
+        handle = handles.get(zip_file)
+        if handle is None:
+            zf = zipfile.ZipFile(zip_file, 'r')
+            handle = handles[zip_file] = (zf, zf.infolist())
+        return handle
+
+    def shared_zip(self, zip_file):
+        # Low-memory mode: all workers share one handle per ZIP file, so each central directory is
+        # parsed once, and members are opened from the manifest instead of the handle's member list.
+        # ZipFile locks the reads of a shared handle; its file object is ours, so zipfile cannot
+        # close it while another worker still reads.
+        with self.worker_zips_lock:
+            if not self.worker_zips:
+                self.worker_zips.append({})
+            handles = self.worker_zips[0]
+            handle = handles.get(zip_file)
+            if handle is None:
+                zf = zipfile.ZipFile(open(zip_file, 'rb'))
+                zf.filelist = []
+                zf.NameToInfo = {}
+                handle = handles[zip_file] = (zf, MemberInfos(self.manifest, self.manifest.zip_files.index(zip_file)))
+        return handle
+
+    def worker_buffer(self):
+        # Runs on a worker thread, each worker reuses one copy buffer for all its files
+        buffer = getattr(self.worker_local, 'buffer', None)
+        if buffer is None:
+            buffer = self.worker_local.buffer = bytearray(self.copy_buffer_size)
+        return buffer
+
+    def worker_folders(self):
+        # Runs on a worker thread, each worker keeps its own folder descriptors for small files
+        writer = getattr(self.worker_local, 'folders', None)
+        if writer is None:
+            writer = self.worker_local.folders = FolderWriter()
+            with self.worker_zips_lock:
+                self.worker_folders_open.append(writer)
+        return writer
+
+    def extract_member(self, zip_file, member_index, dest_path):
+        # Returns the file's SHA-256 when hashing, otherwise None
+        self.control.wait()
+        start = time.perf_counter()
+        digest = hashlib.sha256() if self.sha256 else None
+        pace = self.control.pace
+        zf, infolist = self.worker_zip(zip_file)
+        info = infolist[member_index]
+        copy_start = time.perf_counter()
+        if self.zero_copy and self.sink.copy_raw(zf, info, dest_path, pace):
+            # Into an archive as it is stored in the ZIP file, still compressed
+            self.metrics.add('zero_copy', time.perf_counter() - copy_start, info.file_size)
+            self.metrics.add_file(zip_file, start, time.perf_counter(), info.file_size, info.compress_size)
+            return None
+
+        with self.sink.writing(dest_path, info) as target:
+            # Stored members need no decompression, copy their bytes straight from the archive
+            copy_start = time.perf_counter()
+            if self.zero_copy and self.sink.local and can_copy_raw(info) and \
+                    copy_raw(zf.fp.fileno(), info, target.fileno(), pace):
+                self.metrics.add('zero_copy', time.perf_counter() - copy_start, info.file_size)
+            else:
+                with zf.open(info) as source:
+                    written, read_seconds, write_seconds = copy_stream(source, target, self.worker_buffer(), digest,
+                                                                       pace)
+                self.metrics.add('decompress', read_seconds, info.compress_size)
+                self.metrics.add('write', write_seconds, written)
+                if written != info.file_size:
+                    # Preallocated for a different size than the member really has
+                    target.truncate(written)
+        self.metrics.add_file(zip_file, start, time.perf_counter(), info.file_size, info.compress_size)
+        return digest.hexdigest() if digest is not None else None
+
+    def extract_small_run(self, zip_file, run):
+        # Runs on a worker thread: small members that lie close together in the archive, (entry, destination,
+        # Future) in archive order. Sets each member's Future like extract_member() would return or raise.
+        manifest = self.manifest
+        done = 0
+        try:
+            self.control.wait()
+            start = time.perf_counter()
+            zf, infolist = self.worker_zip(zip_file)
+            infos = [infolist[manifest.member[entry]] for entry, _, _ in run]
+            reader = RunReader(zf.fp.fileno(), infos)
+            read_done = time.perf_counter()
+            self.metrics.add('read', read_done - start, len(reader.data))
+            self.metrics.count('small_file_runs')
+
+            decompress_seconds = write_seconds = 0.0
+            written = 0
+            writer = self.worker_folders()
+            for info, (entry, dest_path, future) in zip(infos, run):
+                member_start = time.perf_counter()
+                try:
+                    data = reader.member(info)
+                    sha256 = hashlib.sha256(data).hexdigest() if self.sha256 else None
+                    decompressed = time.perf_counter()
+                    writer.write(dest_path, data)
+                    member_done = time.perf_counter()
+                except Exception:
+                    # Whatever the run trips over is extracted, or reported, the usual way
+                    try:
+                        future.set_result(self.extract_member(zip_file, manifest.member[entry], dest_path))
+                    except Cancelled:
+                        raise
+                    except Exception as e:
+                        future.set_exception(e)
+                    done += 1
+                    continue
+                decompress_seconds += decompressed - member_start
+                write_seconds += member_done - decompressed
+                written += len(data)
+                self.metrics.add_file(zip_file, member_start, member_done, info.file_size, info.compress_size)
+                future.set_result(sha256)
+                done += 1
+                self.control.pace(len(data))
+            self.metrics.add('decompress', decompress_seconds, sum(info.compress_size for info in infos))
+            self.metrics.add('write', write_seconds, written)
+        except BaseException as e:
+            # The member being extracted and the ones after it fail with the run
+            for _, _, future in run[done:]:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+    def link_member(self, zip_file, member_index, dest_path, source_path, source_future, source_date_time):
+        # Duplicate content: link to the first copy instead of decompressing it again.
+        # Returns (first copy, how it was linked, SHA-256 or None), or the SHA-256 if it had to be extracted.
+        try:
+            sha256 = source_future.result() if source_future is not None else None
+            if self.dedup_verify:
+                zf, infolist = self.worker_zip(zip_file)
+                with zf.open(infolist[member_index]) as source:
+                    sha256 = hash_stream(source)
+                if sha256 != hash_file(source_path):
+                    raise ValueError("Content differs from the first copy")
+            if self.sha256 and sha256 is None:
+                # The first copy was extracted by an earlier run (only on disk, other sinks extract this one)
+                sha256 = hash_file(source_path)
+            with self.metrics.timed('link'):
+                link_method = self.sink.link(source_path, dest_path, self.dedup, source_date_time)
+            return source_path, link_method, sha256 if self.sha256 else None
+        except Cancelled:
+            raise
+        except Exception:
+            # The first copy failed or only shares its CRC, extract this one normally
+            return self.extract_member(zip_file, member_index, dest_path)
+
+    def close_worker_zips(self):
+        with self.worker_zips_lock:
+            for handles in self.worker_zips:
+                for zf, _ in handles.values():
+                    fp = zf.fp
+                    zf.close()
+                    fp.close()
+            self.worker_zips = []
+            for writer in self.worker_folders_open:
+                writer.close()
+            self.worker_folders_open = []
+        self.worker_local = threading.local()
+
+    def sanitize_path(self, file_path):
+        start = time.perf_counter()
+        try:
+            return self.sanitizer.sanitize(file_path)
+        finally:
+            self.metrics.add('sanitize', time.perf_counter() - start)
+
+    def shorten_path(self, full_path, sanitized_parts):
+        with self.metrics.timed('shorten_path'):
+            return self.sanitizer.shorten_path(full_path, sanitized_parts)
+
+    def update_extract_progress(self, processed_entries, total_files, processed_bytes, total_bytes):
+        if self.progress_by_bytes:
+            progress = processed_bytes / total_bytes * 100 if total_bytes else 100
+            self.notify(('update_progress', progress))
+            self.notify(('update_progress_label_extracting',
+                         f"Extracting files: {format_size(processed_bytes)} of {format_size(total_bytes)}"))
+        else:
+            progress = processed_entries / total_files * 100 if total_files else 100
+            self.notify(('update_progress', progress))
+            self.notify(('update_progress_label_extracting',
+                         f"Extracting files: {processed_entries} of {total_files}"))
+
+    def update_file_progress(self):
+        # Put progress updates into the queue
+        self.notify(('update_file_progress', {
+            'total_files': self.total_files,
+            'files_processed': self.files_processed,
+            'files_errors': self.files_errors
+        }))
+
+    def process_errors(self, errors):
+        # Retries the files the first pass could not extract, from its error records, which are in
+        # archive order. Every round of RECOVERY_STRATEGIES plans a new destination for the files still
+        # failing, through the same path index as the first pass, and extracts them on the worker pool.
+        # Records are taken RECOVERY_BATCH_SIZE at a time, so only one batch is held in memory.
+        manifest = self.manifest
+
+        total_errors = len(errors)
+        self.total_errors = total_errors
+        errors_fixed = 0
+        errors_failed = 0
+
+        # Fixed and final errors are logged as they are found
+        fixed_log = CsvLog(os.path.join(self.output_folder, 'fixed_errors.csv'), FIXED_ERROR_FIELDS)
+        final_log = CsvLog(os.path.join(self.output_folder, 'final_errors.csv'), ERROR_FIELDS)
+
+        # Append file statuses to the status log, and record recovered files for later runs
+        checkpoint = Checkpoint(self.output_folder)
+        records = iter(errors)
+        status_log = open_status_writer(self.output_folder, self.status_format, append=True, hashed=self.sha256)
+        with status_log, self.worker_pool() as executor, fixed_log, final_log:
+            try:
+                while True:
+                    batch = list(itertools.islice(records, RECOVERY_BATCH_SIZE))
+                    if not batch:
+                        break
+
+                    # Errors that are not related to files (e.g., zip file errors) cannot be retried
+                    remaining = []
+                    for error in batch:
+                        if error.get('entry') is None:
+                            final_log.add(error)
+                            errors_failed += 1
+                        else:
+                            remaining.append((error, None, error['error_message']))
+
+                    for strategy, path_method in RECOVERY_STRATEGIES:
+                        if not remaining:
+                            break
+                        self.control.wait()
+
+                        planned = [(error,) + self.plan_recovery(error['file'], path_method)
+                                   for error, _, _ in remaining]
+                        failed_dirs = self.path_index.create_pending_dirs()
+                        checkpoint.record_planned(
+                            (error['zip_file'], manifest.member[error['entry']], error['file'],
+                             manifest.crc[error['entry']], manifest.file_size[error['entry']], dest_path)
+                            for error, _, dest_path in planned if isinstance(dest_path, str))
+
+                        attempts = []
+                        for error, file_status, dest_path in planned:
+                            if isinstance(dest_path, str) and os.path.dirname(dest_path) in failed_dirs:
+                                dest_path = failed_dirs[os.path.dirname(dest_path)]
+                            if isinstance(dest_path, str):
+                                result = executor.submit(self.recover_member, error['zip_file'],
+                                                         manifest.member[error['entry']], dest_path,
+                                                         error.get('dest_path'))
+                            else:
+                                result = dest_path
+                            attempts.append((error, file_status, result))
+
+                        remaining = []
+                        for error, file_status, result in attempts:
+                            try:
+                                if isinstance(result, Exception):
+                                    raise result
+                                sha256 = result.result()
+                            except Cancelled:
+                                raise
+                            except Exception as e:
+                                remaining.append((error, file_status, str(e)))
+                                continue
+
+                            checkpoint.record_done(error['zip_file'], manifest.member[error['entry']], sha256)
+                            errors_fixed += 1
+                            file_status[MOVED] = 'True'
+                            file_status[REASON] = f"Recovered with a {strategy}"
+                            if self.sha256:
+                                file_status[SHA256] = sha256
+
+                            # Log fixed error
+                            fixed_log.add({
+                                'zip_file': error['zip_file'],
+                                'original_file': error['file'],
+                                'sanitized_file': os.path.relpath(file_status[SANITIZED_DEST], self.output_folder),
+                                'status': f"Fixed ({strategy})"
+                            })
+
+                            # Log the file status
+                            status_log.add(file_status)
+
+                            # Update progress
+                            if self.progress.due():
+                                self.notify(('update_progress_label_errors',
+                                             f"Processing errors: {errors_fixed + errors_failed}/{total_errors}, "
+                                             f"Fixed: {errors_fixed}, Failed: {errors_failed}"))
+
+                    # Out of strategies
+                    for error, file_status, error_message in remaining:
+                        errors_failed += 1
+                        # Log final error
+                        final_log.add({
+                            'zip_file': error['zip_file'],
+                            'file': error['file'],
+                            'error_message': error_message
+                        })
+
+                        # Update file status
+                        if file_status is None:
+                            file_status = new_status(error['file'], self.sha256)
+                        file_status[MOVED] = 'False'
+                        file_status[REASON] = error_message
+
+                        # Log the file status
+                        status_log.add(file_status)
+            finally:
+                checkpoint.close()
+
+        # Update class variables
+        self.errors_fixed = errors_fixed
+        self.errors_failed = errors_failed
+
+        # Update final progress
+        self.notify(('update_progress_label_errors',
+                     f"Error processing complete. Total errors: {total_errors}, "
+                     f"Fixed: {errors_fixed}, Failed: {errors_failed}"))
+        self.progress.flush()
+
+    def plan_recovery(self, file, path_method):
+        # Like plan_destination(), with a recovery path from the sanitizer
+        file_status = new_status(file, self.sha256)
+        file_norm = self.normalize_member_name(file)
+        file_status[ORIGINAL_DEST] = os.path.join(self.output_folder, file_norm)
+        try:
+            recovery_path = getattr(self.sanitizer, path_method)(file_norm)
+            dest_path = self.path_index.resolve(os.path.normpath(os.path.join(self.output_folder, recovery_path)))
+            file_status[SANITIZED_NAME] = os.path.basename(dest_path)
+            file_status[SANITIZED_DEST] = dest_path
+            if self.sanitizer.limits.length(os.path.abspath(dest_path)) > self.sanitizer.max_path_length:
+                raise Exception(f"Path too long: {dest_path}")
+        except Exception as e:
+            return file_status, e
+        return file_status, dest_path
+
+    def recover_member(self, zip_file, member_index, dest_path, failed_path):
+        # Runs on a worker thread. Leaves no partial files behind, neither from the failed
+        # attempt of the first pass nor from this one.
+        for path in (failed_path, dest_path):
+            if path:
+                self.sink.remove(path)
+        try:
+            return self.extract_member(zip_file, member_index, dest_path)
+        except Exception:
+            self.sink.remove(dest_path)
+            raise
+
+    def write_metrics(self):
+        data = self.metrics.snapshot()
+        data['counters'].update({
+            'total_files': self.total_files,
+            'total_bytes': self.total_bytes,
+            'files_processed': self.files_processed,
+            'files_errors': self.files_errors,
+            'files_skipped': self.files_skipped,
+            'files_filtered': self.manifest.filtered if self.manifest else 0,
+            'duplicates_skipped': self.duplicates_skipped,
+            'duplicates_linked': self.duplicates_linked,
+            'errors_fixed': self.errors_fixed,
+            'errors_failed': self.errors_failed,
+        })
+        data['workers'] = self.max_workers
+        write_json(os.path.join(self.output_folder, METRICS_FILE_NAME), data)
+        if self.prometheus_file:
+            write_prometheus(self.prometheus_file, data)
+
+    def write_processing_summary(self):
+        summary_file = os.path.join(self.output_folder, 'processing_summary.txt')
+        with open(summary_file, 'w', encoding='utf-8') as file:
+            file.write(f"Total files processed: {self.total_files}\n")
+            file.write(f"Files successfully extracted: {self.files_processed}\n")
+            file.write(f"Files with errors: {self.files_errors}\n")
+            if not self.sink.local:
+                file.write(f"Files written to: {self.sink.location}\n")
+            if self.cancelled:
+                file.write("Cancelled before all files were extracted, run again to continue\n")
+            if self.files_skipped > 0:
+                file.write(f"Files already extracted by an earlier run: {self.files_skipped}\n")
+            if self.member_filter is not None:
+                file.write(f"Files left out by the filters: {self.manifest.filtered if self.manifest else 0}\n")
+            if any(export_set.timestamp for export_set in self.export_sets):
+                file.write(f"\nExport Sets:\n")
+                for export_set in self.export_sets:
+                    file.write(f"{export_set}\n")
+                    missing = export_set.missing_parts()
+                    if missing:
+                        file.write(f"  Missing parts: {', '.join(f'{part:03d}' for part in missing)}\n")
+            if self.dedup:
+                file.write(f"\nDeduplication Summary:\n")
+                file.write(f"Duplicates skipped (same path): {self.duplicates_skipped}\n")
+                file.write(f"Duplicates linked ({self.dedup}): {self.duplicates_linked}\n")
+                file.write(f"Space saved: {format_size(self.duplicate_bytes_saved)}\n")
+            if self.total_errors > 0:
+                file.write(f"\nError Processing Summary:\n")
+                file.write(f"Total errors: {self.total_errors}\n")
+                file.write(f"Errors fixed: {self.errors_fixed}\n")
+                file.write(f"Errors failed: {self.errors_failed}\n")
+
+            # Where the time went, the details are in extraction_metrics.json
+            timing = self.metrics.snapshot()
+            wall = timing['wall_seconds']
+            slowest = sorted(timing['stages'].items(), key=lambda item: -item[1]['seconds'])[:3]
+            file.write(f"\nTiming Summary:\n")
+            file.write(f"Elapsed: {wall:.1f} s ({format_size(int(self.total_bytes / wall) if wall else 0)}/s)\n")
+            file.write("Slowest stages (summed over workers): " +
+                       ", ".join(f"{stage} {values['seconds']:.2f} s" for stage, values in slowest) + "\n")
@@ -0,0 +1,82 @@
+import csv
+import os
+from array import array
+
+from .manifest import PathList
+
+ERROR_FIELDS = ['zip_file', 'file', 'error_message']
+FIXED_ERROR_FIELDS = ['zip_file', 'original_file', 'sanitized_file', 'status']
+
+
+# A CSV log of dicts, written as records arrive. The file is only created with the first record.
+class CsvLog:
+    def __init__(self, path, fieldnames):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.file = None
+        self.writer = None
+        self.count = 0
+
+    def add(self, record):
+        if self.file is None:
+            self.file = open(self.path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction='ignore')
+            self.writer.writeheader()
+        self.writer.writerow(record)
+        self.count += 1
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# The first pass's error records, written to error_log.csv as they happen. Every record is kept
+# for the recovery pass, or with compact=True only its manifest entry and failed destination,
+# and iterating reads the rest back from error_log.csv.
+class ErrorRecords:
+    def __init__(self, output_folder, compact=False):
+        self.log = CsvLog(os.path.join(output_folder, 'error_log.csv'), ERROR_FIELDS)
+        self.compact = compact
+        self.records = []
+        self.entries = array('q')  # -1 for errors that are not about one file
+        self.dest_paths = PathList()
+
+    def append(self, record):
+        self.log.add(record)
+        if not self.compact:
+            self.records.append(record)
+            return
+        entry = record.get('entry')
+        self.entries.append(-1 if entry is None else entry)
+        self.dest_paths.append(record.get('dest_path') or '')
+
+    def close(self):
+        self.log.close()
+
+    def __len__(self):
+        return self.log.count
+
+    def __iter__(self):
+        if not self.compact:
+            yield from self.records
+            return
+        if not self.log.count:
+            return
+        self.log.flush()
+        with open(self.log.path, 'r', newline='', encoding='utf-8') as csvfile:
+            for i, record in enumerate(csv.DictReader(csvfile)):
+                entry = self.entries[i]
+                record['entry'] = None if entry < 0 else entry
+                record['dest_path'] = self.dest_paths[i] or None
+                yield record
@@ -0,0 +1,166 @@
+import contextlib
+import itertools
+import os
+import re
+import struct
+import sys
+import time
+import zipfile
+import zlib
+
+COPY_BUFFER_SIZE = 1024 * 1024         # Bytes read and written at a time, one buffer per worker
+PREALLOCATE_MIN_SIZE = 1024 * 1024     # Smaller files are not worth the extra syscall
+ZERO_COPY_MIN_SIZE = 64 * 1024         # Smaller stored members go through zipfile as usual
+PACED_COPY_SIZE = 8 * 1024 * 1024      # Bytes the kernel copies at a time when the copy is paced
+
+# Files are written under a short temporary name in their folder and renamed once complete. A run
+# that is killed leaves them behind, the next run into the folder removes them (see PathIndex).
+TEMP_NAMES = itertools.count()
+TEMP_NAME_PATTERN = re.compile(r'\.~[0-9a-f]+\.part')
+
+# Local file header: signature, then the name and extra field lengths at offset 26
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+# Ways to copy a byte range between two files without passing it through Python,
+# each called as copy(src_fd, dst_fd, count, src_offset) and returning the bytes copied
+KERNEL_COPIES = []
+if hasattr(os, 'copy_file_range'):
+    KERNEL_COPIES.append(lambda src_fd, dst_fd, count, offset: os.copy_file_range(src_fd, dst_fd, count, offset))
+if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+    # Only Linux can sendfile() into a regular file
+    KERNEL_COPIES.append(lambda src_fd, dst_fd, count, offset: os.sendfile(dst_fd, src_fd, offset, count))
+
+ZERO_COPY_SUPPORTED = bool(KERNEL_COPIES) and hasattr(os, 'pread')
+
+
+def preallocate(fd, size):
+    # Reserve the whole file up front so large files are not written in fragments
+    if size < PREALLOCATE_MIN_SIZE or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError:
+        # Not supported by this filesystem, the file just grows as it is written
+        pass
+
+
+def open_temp(dest_path):
+    # A new file in dest_path's folder to write dest_path's content to: (unbuffered file, its path).
+    # The name is short, to stay within path length limits, and never replaces an existing file.
+    # It is opened for reading too, so copy_raw() can check what the kernel copied into it.
+    folder = os.path.dirname(dest_path)
+    while True:
+        temp_path = os.path.join(folder, temp_name())
+        try:
+            return open(temp_path, 'xb+', buffering=0), temp_path
+        except FileExistsError:
+            continue
+        except OSError as e:
+            raise dest_error(e, dest_path)
+
+
+def temp_name():
+    return f'.~{next(TEMP_NAMES):x}.part'
+
+
+def commit_temp(temp_path, dest_path):
+    # Moves a closed temporary file to its destination in one step, replacing what was there
+    try:
+        os.replace(temp_path, dest_path)
+    except OSError as e:
+        discard_temp(temp_path)
+        raise dest_error(e, dest_path)
+
+
+def discard_temp(temp_path):
+    with contextlib.suppress(OSError):
+        os.remove(temp_path)
+
+
+def dest_error(error, dest_path):
+    # The error about the temporary file as if it was about the destination, as errors are logged by file
+    return type(error)(error.errno, error.strerror, dest_path)
+
+
+def copy_stream(source, target, buffer, digest=None, pace=None):
+    # Like shutil.copyfileobj(), but reads into a buffer the caller keeps between files, and feeds
+    # the bytes to a hashlib digest on the way if one is given. pace is called with the size of
+    # every buffer written, see jobs.JobControl.pace().
+    # Returns the bytes written and the seconds spent reading (decompressing) and writing.
+    view = memoryview(buffer)
+    written = 0
+    read_seconds = write_seconds = 0.0
+    clock = time.perf_counter
+    while True:
+        start = clock()
+        n = source.readinto(view)
+        read_done = clock()
+        read_seconds += read_done - start
+        if not n:
+            return written, read_seconds, write_seconds
+        if digest is not None:
+            digest.update(view[:n])
+        target.write(view[:n])
+        write_seconds += clock() - read_done
+        written += n
+        if pace is not None:
+            pace(n)
+
+
+def can_copy_raw(info):
+    # Stored, unencrypted members are the same bytes in the archive as on disk
+    return ZERO_COPY_SUPPORTED and info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1 and \
+        info.compress_size == info.file_size >= ZERO_COPY_MIN_SIZE
+
+
+def data_offset(info, header):
+    # Where the member's data starts: after its local header (the LOCAL_HEADER_SIZE bytes at
+    # info.header_offset), whose extra field may differ from the one in the central directory
+    if len(header) != LOCAL_HEADER_SIZE or header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    return info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+
+
+def copy_raw(zip_fd, info, dst_fd, pace=None):
+    # Copies a stored member straight from the archive to dst_fd inside the kernel, PACED_COPY_SIZE
+    # at a time when pace is given, then checks the CRC of what landed in dst_fd, which must be open
+    # for reading too. Returns False, before writing anything, when the kernel cannot copy between
+    # these two files.
+    offset = data_offset(info, os.pread(zip_fd, LOCAL_HEADER_SIZE, info.header_offset))
+    count = info.file_size
+    dst_offset = os.lseek(dst_fd, 0, os.SEEK_CUR)
+    for copy in KERNEL_COPIES:
+        done = 0
+        try:
+            while done < count:
+                sent = copy(zip_fd, dst_fd, count - done if pace is None else min(count - done, PACED_COPY_SIZE),
+                            offset + done)
+                if not sent:
+                    raise zipfile.BadZipFile(f"Archive ends inside {info.filename}")
+                done += sent
+                if pace is not None:
+                    pace(sent)
+        except OSError:
+            if done:
+                raise
+            continue
+        check_crc(dst_fd, dst_offset, info)
+        return True
+    return False
+
+
+def check_crc(fd, offset, info):
+    # Reads a member's content back from fd, still in the page cache right after it was written, and
+    # checks it against the CRC in the archive like ZipExtFile does
+    crc = 0
+    done = 0
+    while done < info.file_size:
+        data = os.pread(fd, min(COPY_BUFFER_SIZE, info.file_size - done), offset + done)
+        if not data:
+            raise zipfile.BadZipFile(f"Archive ends inside {info.filename}")
+        crc = zlib.crc32(data, crc)
+        done += len(data)
+    if crc != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
@@ -0,0 +1,52 @@
+import fnmatch
+import re
+
+from .zipindex import pack_date_time
+
+
+def logical_path(name):
+    # A member name as a relative path: no leading drive letter or slashes, forward slashes only
+    name = re.sub(r'^[a-zA-Z]:', '', name)
+    name = name.lstrip('/\\')
+    return name.replace('\\', '/')
+
+
+# Which members to extract. Globs and regular expressions are matched against the member's path in
+# the export, e.g. "My Drive/Photos/2023/img.jpg": globs case-insensitively and against the whole
+# path (* also matches /), regular expressions anywhere in the path. A member is kept when it matches
+# an include pattern (or there are none), no exclude pattern, and the size and date bounds.
+class MemberFilter:
+    def __init__(self, include=(), exclude=(), include_regex=(), exclude_regex=(), min_size=None, max_size=None,
+                 modified_after=None, modified_before=None):
+        self.include = [re.compile(fnmatch.translate(pattern), re.IGNORECASE) for pattern in include]
+        self.include += [re.compile(pattern) for pattern in include_regex]
+        self.exclude = [re.compile(fnmatch.translate(pattern), re.IGNORECASE) for pattern in exclude]
+        self.exclude += [re.compile(pattern) for pattern in exclude_regex]
+        self.globs = len(include), len(exclude)  # The first patterns of each list must match the whole path
+        self.min_size = min_size
+        self.max_size = max_size
+        # Dates compared as ZIP timestamps, which have no time zone: datetime -> packed date_time
+        self.modified_after = pack_date_time(modified_after.timetuple()[:6]) if modified_after else None
+        self.modified_before = pack_date_time(modified_before.timetuple()[:6]) if modified_before else None
+
+    def matches(self, name, size, date_time):
+        # name as stored in the archive, date_time packed like the manifest's
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.modified_after is not None and date_time < self.modified_after:
+            return False
+        if self.modified_before is not None and date_time >= self.modified_before:
+            return False
+        path = logical_path(name)
+        if self.include and not self.search(self.include, self.globs[0], path):
+            return False
+        return not self.search(self.exclude, self.globs[1], path)
+
+    @staticmethod
+    def search(patterns, globs, path):
+        for i, pattern in enumerate(patterns):
+            if (pattern.match(path) if i < globs else pattern.search(path)):
+                return True
+        return False
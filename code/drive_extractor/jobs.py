@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import threading
+import time
+
+IO_BURST_SECONDS = 0.25  # Unused I/O budget a throttled job may catch up on at once
+
+
+class Cancelled(Exception):
+    pass
+
+
+# Pause, resume and cancel for one extraction, and an optional limit on the bytes it writes per second.
+# The extractor calls wait() between steps and its workers call pace() for every buffer they write,
+# so a paused job stops within one buffer and a cancelled one raises Cancelled there.
+class JobControl:
+    def __init__(self, io_limit=None):
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = threading.Event()
+        self.io_limit = io_limit  # Bytes per second, shared by all workers of the job; None for no limit
+        self.io_lock = threading.Lock()
+        self.io_next = time.monotonic()
+
+    @property
+    def paused(self):
+        return not self.running.is_set() and not self.cancelled.is_set()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.running.set()  # Wake up whoever waits for resume()
+
+    def wait(self):
+        # Blocks while the job is paused, raises Cancelled once it is cancelled
+        if not self.running.is_set():
+            self.running.wait()
+        if self.cancelled.is_set():
+            raise Cancelled("Extraction cancelled")
+
+    def pace(self, num_bytes):
+        # Called after writing num_bytes, sleeps as long as it takes to stay under io_limit
+        self.wait()
+        if not self.io_limit:
+            return
+        with self.io_lock:
+            now = time.monotonic()
+            self.io_next = max(self.io_next, now - IO_BURST_SECONDS) + num_bytes / self.io_limit
+            delay = self.io_next - now
+        if delay > 0:
+            # Returns early when cancelled
+            self.cancelled.wait(delay)
+            self.wait()
+
+
+# One extraction queued in a JobScheduler
+class Job:
+    QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+    def __init__(self, extractor, priority):
+        self.extractor = extractor
+        self.control = extractor.control
+        self.priority = priority
+        self.state = Job.QUEUED
+        self.error = None
+        self.finished = threading.Event()
+
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
+
+    def cancel(self):
+        self.control.cancel()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+
+# Runs extractions one after another on a worker thread, lowest priority number first and in
+# submission order within a priority. Each job's extractor uses its own worker pool. The thread is
+# not a daemon: shutdown() lets the running job finish, or cancels it, and the job still closes its
+# logs and checkpoint, so the program never exits in the middle of writing a file.
+class JobScheduler:
+    def __init__(self, on_finished=None):
+        self.on_finished = on_finished  # Called with each job when it ends, on the scheduler thread
+        self.queue = []
+        self.order = itertools.count()
+        self.lock = threading.Condition()
+        self.current = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='extraction-scheduler')
+        self.thread.start()
+
+    def submit(self, extractor, priority=0):
+        job = Job(extractor, priority)
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("The scheduler is shut down")
+            heapq.heappush(self.queue, (priority, next(self.order), job))
+            self.lock.notify()
+        return job
+
+    def jobs(self):
+        # The running job, then the queued ones in the order they will run
+        with self.lock:
+            queued = [job for _, _, job in sorted(self.queue)]
+            return ([self.current] if self.current is not None else []) + queued
+
+    def shutdown(self, cancel=False, wait=True):
+        # No new jobs; queued jobs are dropped, the running one is cancelled if asked
+        with self.lock:
+            self.closed = True
+            dropped = [job for _, _, job in self.queue]
+            self.queue = []
+            if cancel and self.current is not None:
+                self.current.cancel()
+            self.lock.notify()
+        for job in dropped:
+            self.finish(job, Job.CANCELLED)
+        if wait:
+            self.thread.join()
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.queue and not self.closed:
+                    self.lock.wait()
+                if not self.queue:
+                    return
+                job = self.current = heapq.heappop(self.queue)[2]
+                job.state = Job.RUNNING
+            try:
+                job.extractor.process_zips()
+                self.finish(job, Job.CANCELLED if job.extractor.cancelled else Job.DONE)
+            except Exception as e:
+                job.error = e
+                self.finish(job, Job.FAILED)
+            finally:
+                with self.lock:
+                    self.current = None
+
+    def finish(self, job, state):
+        job.state = state
+        job.finished.set()
+        if self.on_finished is not None:
+            self.on_finished(job)
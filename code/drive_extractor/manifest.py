@@ -0,0 +1,135 @@
+import bisect
+import zipfile
+from array import array
+
+from .zipindex import MEMBER_COLUMNS, ArchiveMembers, read_members, unpack_date_time
+
+
+# A list of paths that stores every folder once: each path is the index of its folder, up to and
+# including the last '/' or '\\', plus the rest of the name. Thousands of files in one folder cost
+# one copy of the folder's path instead of thousands.
+class PathList:
+    def __init__(self):
+        self.folders = []
+        self.folder_ids = {}
+        self.folder = array('L')
+        self.names = []
+
+    def append(self, path):
+        split = max(path.rfind('/'), path.rfind('\\')) + 1
+        folder = path[:split]
+        folder_id = self.folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = self.folder_ids[folder] = len(self.folders)
+            self.folders.append(folder)
+        self.folder.append(folder_id)
+        self.names.append(path[split:])
+
+    def __getitem__(self, i):
+        return self.folders[self.folder[i]] + self.names[i]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        folders = self.folders
+        for folder_id, name in zip(self.folder, self.names):
+            yield folders[folder_id] + name
+
+
+# Every file member of a set of ZIP files, read from each central directory once.
+# Sizes, CRCs and member positions live in typed arrays instead of one object per member,
+# so a manifest of a few hundred thousand entries stays small. Entries are in archive order:
+# entry i is member[i] of the infolist() of zip_files[archive[i]]. The arrays hold enough
+# to open a member without the archive's own infolist(), see zip_info().
+class Manifest:
+    def __init__(self, zip_files=(), member_filter=None, use_index=False):
+        self.zip_files = []
+        self.zip_errors = {}           # Archive index -> error message for ZIP files that could not be read
+        self.archive_start = array('Q')  # First entry of each archive, plus one past the last entry
+        self.member_filter = member_filter  # Only members it matches are entries, see filters.MemberFilter
+        self.use_index = use_index     # Read central directories through the index files next to the ZIPs
+        self.filtered = 0              # Members left out by member_filter
+
+        self.archive = array('L')
+        self.member = array('Q')
+        self.compress_size = array('Q')
+        self.file_size = array('Q')
+        self.crc = array('L')
+        self.header_offset = array('Q')
+        self.compress_type = array('H')
+        self.flag_bits = array('H')
+        self.date_time = array('L')    # Packed, see zipindex.pack_date_time()
+        self.names = PathList()
+        self.orig_names = {}           # Entry -> name as stored in the archive, where zipfile changed it
+
+        self.archive_start.append(0)
+        for zip_file in zip_files:
+            self.add_archive(zip_file)
+
+    def add_archive(self, zip_file):
+        archive_index = len(self.zip_files)
+        self.zip_files.append(zip_file)
+        try:
+            members = read_members(zip_file, self.use_index)
+        except Exception as e:
+            self.zip_errors[archive_index] = f"Error processing ZIP file: {str(e)}"
+            members = ArchiveMembers()
+
+        keep = range(len(members))
+        if self.member_filter is not None:
+            columns = members.columns
+            keep = [i for i, name in enumerate(members.names)
+                    if self.member_filter.matches(name, columns['file_size'][i], columns['date_time'][i])]
+            self.filtered += len(members) - len(keep)
+
+        first_entry = len(self.names)
+        self.archive.extend(array('L', [archive_index]) * len(keep))
+        for name, _, _ in MEMBER_COLUMNS:
+            column = members.columns[name]
+            if len(keep) != len(column):
+                column = array(column.typecode, [column[i] for i in keep])
+            getattr(self, name).extend(column)
+        for entry, i in enumerate(keep, first_entry):
+            if i in members.orig_names:
+                self.orig_names[entry] = members.orig_names[i]
+            self.names.append(members.names[i])
+
+        self.archive_start.append(len(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def entries(self, archive_index):
+        return range(self.archive_start[archive_index], self.archive_start[archive_index + 1])
+
+    def zip_info(self, entry):
+        # The ZipInfo of an entry, enough for ZipFile.open() and fastcopy
+        info = zipfile.ZipInfo(self.orig_names.get(entry, self.names[entry]))
+        info.header_offset = self.header_offset[entry]
+        info.compress_type = self.compress_type[entry]
+        info.flag_bits = self.flag_bits[entry]
+        info.compress_size = self.compress_size[entry]
+        info.file_size = self.file_size[entry]
+        info.CRC = self.crc[entry]
+        info.date_time = unpack_date_time(self.date_time[entry])
+        return info
+
+    @property
+    def total_size(self):
+        return sum(self.file_size)
+
+
+# Stands in for the infolist() of one archive, built from the manifest: members[i] is the
+# ZipInfo of infolist()[i], for the file members the manifest holds.
+class MemberInfos:
+    def __init__(self, manifest, archive_index):
+        self.manifest = manifest
+        self.entries = manifest.entries(archive_index)
+
+    def __getitem__(self, member_index):
+        member = self.manifest.member
+        entry = bisect.bisect_left(member, member_index, self.entries.start, self.entries.stop)
+        if entry == self.entries.stop or member[entry] != member_index:
+            raise IndexError(f"No file member {member_index} in this archive")
+        return self.manifest.zip_info(entry)
@@ -0,0 +1,233 @@
+import bisect
+import cProfile
+import contextlib
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+METRICS_FILE_NAME = 'extraction_metrics.json'
+
+# Upper bounds, in seconds, of the per-file latency histogram
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# Timings, byte counts and per-file latencies of one run. Every thread adds to its own shard,
+# so workers never wait on each other to record, and the shards are merged when reporting.
+class Metrics:
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def start(self):
+        with self.lock:
+            self.local = threading.local()
+            self.shards = []
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = {'stages': {}, 'counters': {}, 'latency': [0] * (len(LATENCY_BUCKETS) + 1),
+                                        'latency_sum': 0.0, 'archives': {}}
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def merge(self, shard):
+        # A shard recorded somewhere else, e.g. by a worker process
+        with self.lock:
+            self.shards.append(shard)
+
+    @contextlib.contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds, num_bytes=0):
+        stages = self.shard()['stages']
+        totals = stages.get(stage)
+        if totals is None:
+            totals = stages[stage] = [0.0, 0, 0]
+        totals[0] += seconds
+        totals[1] += 1
+        totals[2] += num_bytes
+
+    def count(self, counter, n=1):
+        counters = self.shard()['counters']
+        counters[counter] = counters.get(counter, 0) + n
+
+    def add_file(self, zip_file, start, end, file_size, compress_size):
+        # One extracted file: latency histogram and throughput of its archive
+        shard = self.shard()
+        seconds = end - start
+        shard['latency'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        shard['latency_sum'] += seconds
+        archive = shard['archives'].get(zip_file)
+        if archive is None:
+            archive = shard['archives'][zip_file] = [0, 0, 0, 0.0, start, end]
+        archive[0] += 1
+        archive[1] += file_size
+        archive[2] += compress_size
+        archive[3] += seconds
+        archive[4] = min(archive[4], start)
+        archive[5] = max(archive[5], end)
+
+    def snapshot(self):
+        stages = {}
+        counters = {}
+        latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        latency_sum = 0.0
+        archives = {}
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            for stage, (seconds, calls, num_bytes) in list(shard['stages'].items()):
+                totals = stages.setdefault(stage, [0.0, 0, 0])
+                totals[0] += seconds
+                totals[1] += calls
+                totals[2] += num_bytes
+            for counter, n in list(shard['counters'].items()):
+                counters[counter] = counters.get(counter, 0) + n
+            latency = [a + b for a, b in zip(latency, shard['latency'])]
+            latency_sum += shard['latency_sum']
+            for zip_file, values in list(shard['archives'].items()):
+                totals = archives.get(zip_file)
+                if totals is None:
+                    archives[zip_file] = list(values)
+                else:
+                    for i in range(4):
+                        totals[i] += values[i]
+                    totals[4] = min(totals[4], values[4])
+                    totals[5] = max(totals[5], values[5])
+
+        wall = (self.finished or time.perf_counter()) - self.started
+        return {
+            'wall_seconds': round(wall, 4),
+            'stages': {stage: {'seconds': round(seconds, 4), 'calls': calls, 'bytes': num_bytes}
+                       for stage, (seconds, calls, num_bytes) in sorted(stages.items())},
+            'counters': counters,
+            'file_seconds': {
+                'buckets': list(LATENCY_BUCKETS),
+                'counts': latency,
+                'sum': round(latency_sum, 4),
+                'count': sum(latency),
+            },
+            'archives': [{
+                'zip_file': zip_file,
+                'files': files,
+                'bytes': num_bytes,
+                'compressed_bytes': compressed_bytes,
+                'worker_seconds': round(worker_seconds, 4),
+                'wall_seconds': round(end - start, 4),
+                'mb_per_second': round(num_bytes / (1024 * 1024) / (end - start), 2) if end > start else None,
+            } for zip_file, (files, num_bytes, compressed_bytes, worker_seconds, start, end) in archives.items()],
+        }
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=2)
+        file.write('\n')
+
+
+def archive_label(archive):
+    # ZIP file name as a Prometheus label value
+    name = os.path.basename(archive['zip_file'])
+    return name.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus(path, data):
+    # Text exposition format for the node_exporter textfile collector. Written to a temporary
+    # file and renamed, so the collector never reads half a file.
+    lines = [
+        '# HELP drive_extractor_wall_seconds Duration of the last extraction run.',
+        '# TYPE drive_extractor_wall_seconds gauge',
+        f"drive_extractor_wall_seconds {data['wall_seconds']}",
+        '# HELP drive_extractor_stage_seconds Time spent per stage, summed over all workers.',
+        '# TYPE drive_extractor_stage_seconds gauge',
+    ]
+    lines += [f'drive_extractor_stage_seconds{{stage="{stage}"}} {values["seconds"]}'
+              for stage, values in data['stages'].items()]
+    lines += ['# HELP drive_extractor_stage_calls Calls per stage.', '# TYPE drive_extractor_stage_calls gauge']
+    lines += [f'drive_extractor_stage_calls{{stage="{stage}"}} {values["calls"]}'
+              for stage, values in data['stages'].items()]
+    lines += ['# HELP drive_extractor_stage_bytes Bytes handled per stage.', '# TYPE drive_extractor_stage_bytes gauge']
+    lines += [f'drive_extractor_stage_bytes{{stage="{stage}"}} {values["bytes"]}'
+              for stage, values in data['stages'].items() if values['bytes']]
+    lines += ['# HELP drive_extractor_count Run counters: files by result, renamed collisions, bytes.',
+              '# TYPE drive_extractor_count gauge']
+    lines += [f'drive_extractor_count{{counter="{counter}"}} {n}' for counter, n in data['counters'].items()]
+
+    histogram = data['file_seconds']
+    lines += ['# HELP drive_extractor_file_seconds Time to extract one file.',
+              '# TYPE drive_extractor_file_seconds histogram']
+    cumulative = 0
+    for bound, n in zip(list(histogram['buckets']) + ['+Inf'], histogram['counts']):
+        cumulative += n
+        lines.append(f'drive_extractor_file_seconds_bucket{{le="{bound}"}} {cumulative}')
+    lines += [f"drive_extractor_file_seconds_sum {histogram['sum']}",
+              f"drive_extractor_file_seconds_count {histogram['count']}"]
+
+    lines += ['# HELP drive_extractor_archive_bytes Uncompressed bytes extracted per ZIP file.',
+              '# TYPE drive_extractor_archive_bytes gauge']
+    lines += [f'drive_extractor_archive_bytes{{archive="{archive_label(a)}"}} {a["bytes"]}' for a in data['archives']]
+    lines += ['# HELP drive_extractor_archive_wall_seconds Time from the first to the last file of a ZIP file.',
+              '# TYPE drive_extractor_archive_wall_seconds gauge']
+    lines += [f'drive_extractor_archive_wall_seconds{{archive="{archive_label(a)}"}} {a["wall_seconds"]}'
+              for a in data['archives']]
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+    os.replace(temp_path, path)
+
+
+# Opt-in cProfile of the calling thread and of every worker thread, merged into one pstats file.
+# Before Python 3.12 cProfile only sees the thread that enabled it, so each worker starts its own
+# profile. From 3.12 it hooks into sys.monitoring, which sees every thread but takes one profiler
+# at a time: the calling thread's profile covers the workers, which start none.
+PROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+
+class Profiler:
+    def __init__(self, path):
+        self.path = path
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def start_thread(self):
+        with self.lock:
+            if self.profiles and not PROFILE_PER_THREAD:
+                return
+            profile = cProfile.Profile()
+            profile.enable()
+            self.profiles.append(profile)
+
+    def stop(self):
+        # Call once the workers have exited; only the calling thread's profile is still running
+        with self.lock:
+            profiles, self.profiles = self.profiles, []
+        for profile in profiles:
+            profile.disable()
+            profile.create_stats()
+        # A worker that never ran anything recorded nothing, which pstats refuses
+        profiles = [profile for profile in profiles if profile.stats]
+        if not profiles:
+            return
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(self.path)
@@ -0,0 +1,56 @@
+import os
+import re
+
+# Google Drive names the parts of one download <name>-<timestamp>-NNN.zip,
+# e.g. drive-download-20240101T000000Z-001.zip
+PART_NAME = re.compile(r'^(?P<name>.+)-(?P<timestamp>\d{8}T\d{6}Z)-(?P<part>\d{3,})\.zip$', re.IGNORECASE)
+
+
+# The ZIP files of one Google Drive download. ZIP files that are not named like a part
+# are a set of their own.
+class ExportSet:
+    def __init__(self, name, timestamp=None):
+        self.name = name
+        self.timestamp = timestamp
+        self.parts = []  # (part number, path), None as the number outside a download
+
+    def add(self, part, zip_file):
+        self.parts.append((part, zip_file))
+
+    @property
+    def zip_files(self):
+        return [zip_file for _, zip_file in sorted(self.parts, key=lambda part: (part[0] or 0, part[1]))]
+
+    def missing_parts(self):
+        # Gaps in the part numbers; parts after the last one selected cannot be noticed
+        numbers = {part for part, _ in self.parts if part is not None}
+        if not numbers:
+            return []
+        return [part for part in range(1, max(numbers)) if part not in numbers]
+
+    def sort_key(self):
+        return self.name.casefold(), self.timestamp or '', self.zip_files[0]
+
+    def __str__(self):
+        if self.timestamp is None:
+            return self.name
+        return f"{self.name}-{self.timestamp} ({len(self.parts)} part{'s' if len(self.parts) != 1 else ''})"
+
+
+def group_parts(zip_files):
+    # Export sets of the given ZIP files, each in part order, and the sets ordered by name,
+    # so the order the files were picked in does not matter. A file picked twice counts once.
+    sets = {}
+    for zip_file in dict.fromkeys(zip_files):
+        match = PART_NAME.match(os.path.basename(zip_file))
+        if match:
+            key = (match['name'], match['timestamp'].upper())
+            export_set = sets.get(key)
+            if export_set is None:
+                export_set = sets[key] = ExportSet(*key)
+            export_set.add(int(match['part']), zip_file)
+        else:
+            export_set = sets[zip_file] = ExportSet(os.path.basename(zip_file))
+            export_set.add(None, zip_file)
+    return sorted(sets.values(), key=ExportSet.sort_key)
+
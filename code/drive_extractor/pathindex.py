@@ -0,0 +1,173 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+
+from .fastcopy import TEMP_NAME_PATTERN
+
+PATH_INDEX_FILE_NAME = 'extraction_path_index.sqlite'
+SPILL_BATCH_SIZE = 10000  # Names held in memory before they are written to the SQLite file
+
+
+# In-memory view of the output tree: which directories exist or are about to be created and
+# which names are claimed in each of them. Names are compared case-insensitively, as they
+# would be on Windows and macOS, and each (directory, name) pair keeps a collision counter so
+# repeated collisions do not retry suffixes from 1. Folder names are claimed in their parent,
+# so a file cannot take the name of a folder. The filesystem is only read when merging into an
+# output folder that already has content, and then once per directory. With spill_path, the
+# names live in an SQLite file there instead of in memory, see NameSpill. Without create_dirs the
+# directories are only tracked, for sinks that do not write to the output folder. With clean_temp,
+# the temporary files a killed run left behind are removed from the directories read when merging.
+class PathIndex:
+    def __init__(self, root, limits, merge=False, spill_path=None, create_dirs=True, clean_temp=False):
+        self.root_key = os.path.normpath(root).casefold()
+        self.limits = limits  # sanitize.PathLimits, for the names of renamed files
+        self.merge = merge
+        self.create_dirs = create_dirs
+        self.clean_temp = clean_temp
+        self.dirs = {}          # Case-folded directory -> set of case-folded names in it
+        self.counters = {}      # (case-folded directory, case-folded name) -> last collision count used
+        self.pending_dirs = []  # Directories to create before the next batch of files is written
+        self.spill = NameSpill(spill_path) if spill_path else None
+
+    def names_in(self, dest_dir):
+        key = dest_dir.casefold()
+        names = self.dirs.get(key)
+        if names is None:
+            names = self.dirs[key] = set() if self.spill is None else SpilledNames(self.spill, len(self.dirs))
+            if self.merge and os.path.isdir(dest_dir or os.curdir):
+                names.update(name.casefold() for name in self.list_dir(dest_dir or os.curdir))
+            elif dest_dir:
+                self.pending_dirs.append(dest_dir)
+
+            # The folder's own name is taken in its parent
+            parent, name = os.path.split(dest_dir)
+            if key != self.root_key and name and parent != dest_dir:
+                self.names_in(parent).add(name.casefold())
+        return names
+
+    def list_dir(self, dest_dir):
+        names = os.listdir(dest_dir)
+        if not self.clean_temp:
+            return names
+        kept = []
+        for name in names:
+            if TEMP_NAME_PATTERN.fullmatch(name):
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(dest_dir, name))
+            else:
+                kept.append(name)
+        return kept
+
+    def claim(self, path):
+        dest_dir, name = os.path.split(path)
+        self.names_in(dest_dir).add(name.casefold())
+
+    def resolve(self, dest_path):
+        # Claim dest_path, or the first free "<name>_<hash><ext>" variant of it
+        dest_dir, name = os.path.split(dest_path)
+        names = self.names_in(dest_dir)
+        key = name.casefold()
+        if key not in names:
+            names.add(key)
+            return dest_path
+
+        # Avoid filename collisions with hashes
+        filename, ext = os.path.splitext(name)
+        counter_key = (dest_dir.casefold(), key)
+        collision_count = self.counters.get(counter_key, 0)
+        while True:
+            collision_count += 1
+            hash_input = f"{filename}_{collision_count}"
+            short_hash = hashlib.md5(hash_input.encode()).hexdigest()[:8]
+
+            # Adjust filename length based on hash and extension
+            max_filename_length = max(1, self.limits.max_name_length - self.limits.length(ext) - len(short_hash) - 1)
+            candidate = f"{self.limits.fit(filename, max_filename_length)}_{short_hash}{ext}"
+            if candidate.casefold() not in names:
+                break
+
+        self.counters[counter_key] = collision_count
+        names.add(candidate.casefold())
+        return os.path.join(dest_dir, candidate)
+
+    def create_pending_dirs(self):
+        # Parents sort before their children, so each directory is created once.
+        # Returns the directories that could not be created, with the error.
+        failed = {}
+        pending_dirs, self.pending_dirs = sorted(self.pending_dirs), []
+        if not self.create_dirs:
+            return failed
+        for dest_dir in pending_dirs:
+            try:
+                os.makedirs(dest_dir, exist_ok=True)
+            except OSError as e:
+                failed[dest_dir] = e
+        return failed
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+
+# Names claimed in the directories of a PathIndex, kept in an SQLite file for runs with millions of
+# files. Recent names wait in a set and are written in batches; lookups check both. The file is
+# scratch space: it is recreated by every run and deleted when the index is closed.
+class NameSpill:
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=OFF')
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.execute('CREATE TABLE names (dir INTEGER NOT NULL, name TEXT NOT NULL, '
+                          'PRIMARY KEY (dir, name)) WITHOUT ROWID')
+        self.pending = set()
+
+    def contains(self, dir_id, name):
+        if (dir_id, name) in self.pending:
+            return True
+        row = self.conn.execute('SELECT 1 FROM names WHERE dir = ? AND name = ?', (dir_id, name)).fetchone()
+        return row is not None
+
+    def add(self, dir_id, name):
+        self.pending.add((dir_id, name))
+        if len(self.pending) >= SPILL_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.conn.executemany('INSERT OR IGNORE INTO names VALUES (?, ?)', self.pending)
+            self.conn.commit()
+            self.pending = set()
+
+    def close(self):
+        self.conn.close()
+        os.remove(self.path)
+
+
+# The set of names in one directory, stored in a NameSpill
+class SpilledNames:
+    def __init__(self, spill, dir_id):
+        self.spill = spill
+        self.dir_id = dir_id
+
+    def __contains__(self, name):
+        return self.spill.contains(self.dir_id, name)
+
+    def add(self, name):
+        self.spill.add(self.dir_id, name)
+
+    def update(self, names):
+        for name in names:
+            self.spill.add(self.dir_id, name)
+
+
+def has_content(folder, ignore=()):
+    # Whether folder holds anything besides the given names, i.e. a run would merge into it
+    try:
+        return any(name not in ignore for name in os.listdir(folder))
+    except FileNotFoundError:
+        return False
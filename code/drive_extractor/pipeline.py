@@ -0,0 +1,262 @@
+import concurrent.futures
+import hashlib
+import queue
+import threading
+import time
+import zipfile
+import zlib
+
+from .fastcopy import LOCAL_HEADER_SIZE, can_copy_raw, data_offset
+from .sinks import LocalSink
+
+PIPELINE_CHUNK_SIZE = 1024 * 1024   # Compressed bytes read, and decompressed bytes passed on, at a time
+READ_AHEAD_CHUNKS = 4               # Compressed chunks read ahead per inflate worker
+WRITE_QUEUE_CHUNKS = 8              # Decompressed chunks waiting per writer
+PIPELINE_WRITERS = 2
+
+END = object()  # Last message of a job
+
+
+class PipelineJob:
+    def __init__(self, zip_file, member_index, dest_path):
+        self.zip_file = zip_file
+        self.member_index = member_index
+        self.dest_path = dest_path
+        self.future = concurrent.futures.Future()
+        self.start = time.perf_counter()
+        self.info = None
+        self.chunks = queue.SimpleQueue()
+        self.read_done = False
+        self.target = None
+        self.sha256 = None
+
+
+# Extraction split into stages connected by bounded queues: one reader thread reads the compressed
+# bytes of each member from the archives, inflate threads decompress them (zlib releases the GIL)
+# and writer threads commit the files. A reader that runs ahead waits for read-ahead budget, and
+# inflate threads wait for room in the writer queues, so memory stays capped however large the
+# members are. submit() returns a Future like ThreadPoolExecutor.submit(), so results are drained
+# in the same order as with the worker pool. The Future's result is the file's SHA-256 when
+# sha256 is set, computed as it is decompressed.
+class Pipeline:
+    def __init__(self, open_zip, fallback, metrics, inflate_workers, writers=PIPELINE_WRITERS, zero_copy=True,
+                 chunk_size=PIPELINE_CHUNK_SIZE, initializer=None, sha256=False, control=None, sink=None):
+        self.open_zip = open_zip      # zip_file -> (ZipFile, infolist) for the member infos and the fallback
+        self.fallback = fallback      # Extracts a member the pipeline cannot handle, on an inflate thread
+        self.metrics = metrics
+        self.zero_copy = zero_copy
+        self.sha256 = sha256
+        self.chunk_size = chunk_size
+        self.initializer = initializer  # Called first on every stage thread, like ThreadPoolExecutor's
+        self.control = control          # jobs.JobControl: pause, cancel and I/O limit
+        self.sink = sink if sink is not None else LocalSink()  # Where files are written, see sinks
+
+        self.read_jobs = queue.SimpleQueue()
+        self.inflate_jobs = queue.SimpleQueue()
+        self.read_budget = threading.Semaphore(READ_AHEAD_CHUNKS * inflate_workers)
+        self.write_queues = [queue.Queue(WRITE_QUEUE_CHUNKS) for _ in range(max(1, writers))]
+
+        self.inflate_workers = inflate_workers
+        self.threads = [self.stage_thread('pipeline-reader', self.read_loop)]
+        self.threads += [self.stage_thread(f'pipeline-inflate-{i}', self.inflate_loop) for i in range(inflate_workers)]
+        self.threads += [self.stage_thread(f'pipeline-writer-{i}', self.write_loop, write_queue, inflate_workers)
+                         for i, write_queue in enumerate(self.write_queues)]
+        for thread in self.threads:
+            thread.start()
+
+    def stage_thread(self, name, loop, *args):
+        def run():
+            if self.initializer is not None:
+                self.initializer()
+            loop(*args)
+        return threading.Thread(target=run, name=name, daemon=True)
+
+    def submit(self, zip_file, member_index, dest_path):
+        job = PipelineJob(zip_file, member_index, dest_path)
+        self.read_jobs.put(job)
+        return job.future
+
+    def close(self):
+        # Finishes the jobs already submitted, then stops every stage
+        self.read_jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def read_loop(self):
+        # Reads through its own file objects, the ZipFile handles may be shared with other threads
+        files = {}
+        try:
+            self.read_jobs_from(files)
+        finally:
+            for file in files.values():
+                file.close()
+        for _ in range(self.inflate_workers):
+            self.inflate_jobs.put(None)
+
+    def read_jobs_from(self, files):
+        while True:
+            job = self.read_jobs.get()
+            if job is None:
+                break
+            # Handed to the inflate stage before its chunks are read, so a job always has a consumer
+            self.inflate_jobs.put(job)
+            try:
+                if self.control is not None:
+                    self.control.wait()
+                info = job.info = self.open_zip(job.zip_file)[1][job.member_index]
+                if not self.can_pipeline(info):
+                    job.chunks.put(END)
+                    continue
+                start = time.perf_counter()
+                source = files.get(job.zip_file)
+                if source is None:
+                    source = files[job.zip_file] = open(job.zip_file, 'rb')
+                source.seek(info.header_offset)
+                source.seek(data_offset(info, source.read(LOCAL_HEADER_SIZE)))
+                remaining = info.compress_size
+                while remaining:
+                    self.read_budget.acquire()
+                    chunk = source.read(min(remaining, self.chunk_size))
+                    if not chunk:
+                        self.read_budget.release()
+                        raise zipfile.BadZipFile(f"Archive ends inside {info.filename}")
+                    job.chunks.put(chunk)
+                    remaining -= len(chunk)
+                self.metrics.add('read', time.perf_counter() - start, info.compress_size)
+                job.chunks.put(END)
+            except Exception as e:
+                job.chunks.put(e)
+
+    def can_pipeline(self, info):
+        # Encrypted members and other compression methods go through zipfile, and stored members
+        # the kernel can copy are left to the zero-copy path
+        if info.flag_bits & 0x1 or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            return False
+        return not (self.zero_copy and can_copy_raw(info))
+
+    def inflate_loop(self):
+        while True:
+            job = self.inflate_jobs.get()
+            if job is None:
+                break
+            write_queue = self.write_queues[job.member_index % len(self.write_queues)]
+            try:
+                self.inflate(job, write_queue)
+            except Exception as e:
+                # Drop the rest of the member, the writer closes the file and fails the job
+                while not job.read_done:
+                    self.next_chunk(job)
+                write_queue.put((job, e))
+
+        for write_queue in self.write_queues:
+            write_queue.put(None)
+
+    def next_chunk(self, job):
+        chunk = job.chunks.get()
+        if chunk is END or isinstance(chunk, Exception):
+            job.read_done = True
+        else:
+            self.read_budget.release()
+        return chunk
+
+    def inflate(self, job, write_queue):
+        chunk = self.next_chunk(job)
+        if isinstance(chunk, Exception):
+            raise chunk
+        info = job.info
+        if not self.can_pipeline(info):
+            self.run_fallback(job)
+            return
+
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if info.compress_type == zipfile.ZIP_DEFLATED else None
+        digest = hashlib.sha256() if self.sha256 else None
+        crc = 0
+        size = 0
+        seconds = 0.0
+        while chunk is not END:
+            if isinstance(chunk, Exception):
+                raise chunk
+            data = chunk
+            while data:
+                start = time.perf_counter()
+                if decompressor is None:
+                    piece, data = data, b''
+                else:
+                    # Bounded output, so a highly compressed chunk cannot blow up in memory
+                    piece = decompressor.decompress(data, self.chunk_size)
+                    data = decompressor.unconsumed_tail
+                crc = zlib.crc32(piece, crc)
+                if digest is not None:
+                    digest.update(piece)
+                seconds += time.perf_counter() - start
+                if piece:
+                    size += len(piece)
+                    write_queue.put((job, piece))
+            chunk = self.next_chunk(job)
+
+        while decompressor is not None and not decompressor.eof:
+            # Output still held back by the size bound
+            piece = decompressor.decompress(b'', self.chunk_size)
+            if not piece:
+                break
+            crc = zlib.crc32(piece, crc)
+            if digest is not None:
+                digest.update(piece)
+            size += len(piece)
+            write_queue.put((job, piece))
+        self.metrics.add('decompress', seconds, info.compress_size)
+        if size != info.file_size:
+            raise zipfile.BadZipFile(f"Wrong size for {info.filename}: {size} instead of {info.file_size}")
+        if crc != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+        if digest is not None:
+            job.sha256 = digest.hexdigest()
+        write_queue.put((job, END))
+
+    def run_fallback(self, job):
+        try:
+            job.future.set_result(self.fallback(job.zip_file, job.member_index, job.dest_path))
+        except Exception as e:
+            job.future.set_exception(e)
+
+    def write_loop(self, write_queue, producers):
+        # Every inflate thread ends its writers' queues with None
+        while producers:
+            message = write_queue.get()
+            if message is None:
+                producers -= 1
+                continue
+            job, data = message
+            if job.future.done():
+                # Writing this file already failed
+                continue
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                if job.target is None:
+                    # Committed once complete, e.g. renamed from a temporary name
+                    job.target = self.sink.open(job.dest_path, job.info)
+                if data is END:
+                    target, job.target = job.target, None
+                    self.sink.commit(target)
+                    info = job.info
+                    self.metrics.add_file(job.zip_file, job.start, time.perf_counter(), info.file_size,
+                                          info.compress_size)
+                    job.future.set_result(job.sha256)
+                else:
+                    start = time.perf_counter()
+                    job.target.write(data)
+                    self.metrics.add('write', time.perf_counter() - start, len(data))
+                    if self.control is not None:
+                        self.control.pace(len(data))
+            except Exception as e:
+                if job.target is not None:
+                    target, job.target = job.target, None
+                    self.sink.discard(target)
+                job.future.set_exception(e)
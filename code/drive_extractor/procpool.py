@@ -0,0 +1,221 @@
+import concurrent.futures
+import hashlib
+import multiprocessing
+import time
+import zipfile
+import zlib
+
+from .fastcopy import COPY_BUFFER_SIZE, LOCAL_HEADER_SIZE, can_copy_raw, copy_raw, copy_stream, data_offset
+from .jobs import Cancelled, JobControl
+from .manifest import MemberInfos
+from .metrics import Metrics
+from .sinks import LocalSink
+
+PROCESS_SHARD_SIZE = 32  # Members handed to a worker process at a time
+
+worker = None  # This process's ShardWorker, in a worker process
+
+
+class MemberFailed(Exception):
+    # A member a worker process could not extract, with the message of the error it ran into there
+    pass
+
+
+# Extraction on worker processes instead of threads, for exports of many small compressed members
+# where one core is the limit: zlib releases the GIL, but the Python work around every member does not.
+# The extractor still plans every destination, against its path index; submit() collects the planned
+# members of a chunk and flush() deals them out to shards of about PROCESS_SHARD_SIZE, largest first
+# in turn, so every shard gets its share of the large ones. A shard names its archive and, for each
+# member, its central directory fields from the manifest, so a process never reads a central
+# directory; it opens its own handle per archive, writes the files through a LocalSink and returns
+# one (SHA-256, error message) tuple per member, plus its metrics. submit() returns a Future like
+# ThreadPoolExecutor.submit(), resolved when its shard comes back. Pause and cancel take effect
+# between shards, and the I/O limit is split evenly between the processes.
+class ProcessShards:
+    def __init__(self, manifest, metrics, processes, zero_copy=True, copy_buffer_size=COPY_BUFFER_SIZE,
+                 sha256=False, control=None, shard_size=PROCESS_SHARD_SIZE):
+        self.manifest = manifest
+        self.metrics = metrics
+        self.processes = processes
+        self.shard_size = shard_size
+        self.control = control if control is not None else JobControl()
+        self.members = {}  # zip_file -> MemberInfos
+        self.queued = []   # (zip_file, member fields, Future) submitted since the last flush()
+        self.sent = set()  # Shards not back yet
+
+        # Spawned, not forked: the extractor already runs threads, whose locks a fork could copy while held
+        io_limit = self.control.io_limit / processes if self.control.io_limit else None
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn'), initializer=start_worker,
+            initargs=(zero_copy, copy_buffer_size, sha256, io_limit))
+
+    def submit(self, zip_file, member_index, dest_path):
+        infos = self.members.get(zip_file)
+        if infos is None:
+            infos = self.members[zip_file] = MemberInfos(self.manifest, self.manifest.zip_files.index(zip_file))
+        info = infos[member_index]
+        future = concurrent.futures.Future()
+        self.queued.append((zip_file, (info.orig_filename, info.header_offset, info.compress_type, info.flag_bits,
+                                       info.compress_size, info.file_size, info.CRC, dest_path), future))
+        return future
+
+    def flush(self):
+        # Sends the members submitted so far, one archive's at a time
+        queued, self.queued = self.queued, []
+        by_archive = {}
+        for zip_file, member, future in queued:
+            by_archive.setdefault(zip_file, []).append((member, future))
+        for zip_file, members in by_archive.items():
+            count = -(-len(members) // self.shard_size)
+            for i in range(count):
+                self.send(zip_file, members[i::count])
+
+    def send(self, zip_file, members):
+        self.control.wait()
+        shard = self.executor.submit(extract_shard, zip_file, [member for member, _ in members])
+        self.sent.add(shard)
+        shard.add_done_callback(lambda shard: self.resolve(members, shard))
+
+    def resolve(self, members, shard):
+        # Runs on the executor's thread once a shard is back
+        self.sent.discard(shard)
+        if shard.cancelled():
+            error = Cancelled("Extraction cancelled")
+        else:
+            error = shard.exception()
+        if error is not None:
+            for _, future in members:
+                future.set_exception(error)
+            return
+
+        results, metrics = shard.result()
+        self.metrics.merge(metrics)
+        for (_, future), (sha256, error_message) in zip(members, results):
+            if error_message is None:
+                future.set_result(sha256)
+            else:
+                future.set_exception(MemberFailed(error_message))
+
+    def close(self):
+        # Finishes the shards already sent, or drops them and what is still queued when cancelled
+        cancelled = self.control.cancelled.is_set()
+        if cancelled:
+            for _, _, future in self.queued:
+                future.set_exception(Cancelled("Extraction cancelled"))
+            self.queued = []
+            # Shards that have not started yet (shutdown() only takes cancel_futures from Python 3.9)
+            for shard in list(self.sent):
+                shard.cancel()
+        else:
+            self.flush()
+        self.executor.shutdown()
+
+
+def start_worker(zero_copy, copy_buffer_size, sha256, io_limit):
+    global worker
+    worker = ShardWorker(zero_copy, copy_buffer_size, sha256, io_limit)
+
+
+def extract_shard(zip_file, members):
+    # Runs in a worker process, see ProcessShards
+    return worker.extract_shard(zip_file, members)
+
+
+# The extraction side of ProcessShards, one per worker process. Stored and deflated members are read
+# and inflated straight from the archive, other members go through a ZipFile of their own.
+class ShardWorker:
+    def __init__(self, zero_copy, copy_buffer_size, sha256, io_limit):
+        self.zero_copy = zero_copy
+        self.sha256 = sha256
+        self.buffer = bytearray(copy_buffer_size)
+        self.pace = JobControl(io_limit).pace if io_limit else None
+        self.sink = LocalSink()
+        self.files = {}  # zip_file -> file object
+        self.zips = {}   # zip_file -> ZipFile, only for members of other compression methods
+
+    def extract_shard(self, zip_file, members):
+        metrics = Metrics()
+        results = []
+        for member in members:
+            try:
+                results.append((self.extract(zip_file, member, metrics), None))
+            except Exception as e:
+                results.append((None, str(e)))
+        return results, metrics.shard()
+
+    def extract(self, zip_file, member, metrics):
+        start = time.perf_counter()
+        name, header_offset, compress_type, flag_bits, compress_size, file_size, crc, dest_path = member
+        info = zipfile.ZipInfo(name)
+        info.header_offset = header_offset
+        info.compress_type = compress_type
+        info.flag_bits = flag_bits
+        info.compress_size = compress_size
+        info.file_size = file_size
+        info.CRC = crc
+
+        source = self.files.get(zip_file)
+        if source is None:
+            source = self.files[zip_file] = open(zip_file, 'rb')
+        digest = hashlib.sha256() if self.sha256 else None
+        with self.sink.writing(dest_path, info) as target:
+            copy_start = time.perf_counter()
+            if self.zero_copy and can_copy_raw(info) and copy_raw(source.fileno(), info, target.fileno(), self.pace):
+                metrics.add('zero_copy', time.perf_counter() - copy_start, file_size)
+            else:
+                if flag_bits & 0x1 or compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                    zf = self.zips.get(zip_file)
+                    if zf is None:
+                        zf = self.zips[zip_file] = zipfile.ZipFile(zip_file)
+                    with zf.open(info) as stream:
+                        written, read_seconds, write_seconds = copy_stream(stream, target, self.buffer, digest,
+                                                                           self.pace)
+                else:
+                    written, read_seconds, write_seconds = self.inflate(source, info, target, digest)
+                metrics.add('decompress', read_seconds, compress_size)
+                metrics.add('write', write_seconds, written)
+        metrics.add_file(zip_file, start, time.perf_counter(), file_size, compress_size)
+        return digest.hexdigest() if digest is not None else None
+
+    def inflate(self, source, info, target, digest):
+        # Reads a stored or deflated member through the process's own file object and checks its size and
+        # CRC, like ZipExtFile does. Returns the bytes written and the seconds spent reading and writing.
+        clock = time.perf_counter
+        start = clock()
+        source.seek(info.header_offset)
+        source.seek(data_offset(info, source.read(LOCAL_HEADER_SIZE)))
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if info.compress_type == zipfile.ZIP_DEFLATED else None
+        bound = len(self.buffer)
+        remaining = info.compress_size
+        crc = 0
+        written = 0
+        write_seconds = 0.0
+        while remaining:
+            data = source.read(min(remaining, bound))
+            if not data:
+                raise zipfile.BadZipFile(f"Archive ends inside {info.filename}")
+            remaining -= len(data)
+            while True:
+                if decompressor is None:
+                    piece, data = data, b''
+                else:
+                    # Bounded output, so a highly compressed member cannot blow up in memory. Output held
+                    # back by the bound comes out of the next calls, until there is none left.
+                    piece = decompressor.decompress(data, bound)
+                    data = decompressor.unconsumed_tail
+                if not piece:
+                    break
+                crc = zlib.crc32(piece, crc)
+                if digest is not None:
+                    digest.update(piece)
+                write_start = clock()
+                target.write(piece)
+                write_seconds += clock() - write_start
+                written += len(piece)
+                if self.pace is not None:
+                    self.pace(len(piece))
+        if written != info.file_size:
+            raise zipfile.BadZipFile(f"Wrong size for {info.filename}: {written} instead of {info.file_size}")
+        if crc != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+        return written, clock() - start - write_seconds, write_seconds
@@ -0,0 +1,37 @@
+import threading
+import time
+
+PROGRESS_INTERVAL = 0.1  # Seconds between progress updates sent to the GUI
+
+
+# Coalesces progress messages for the GUI queue. Only the latest message of each type is kept,
+# and they are put on the queue at most once per interval, so a run over many small files does
+# not flood the Tk event loop. Without a queue (headless) everything is dropped.
+class ProgressChannel:
+    def __init__(self, queue, interval=PROGRESS_INTERVAL):
+        self.queue = queue
+        self.interval = interval
+        self.latest = {}
+        self.next_flush = 0.0
+        self.lock = threading.Lock()
+
+    def due(self):
+        # Whether the next post would be sent, so callers can skip building messages
+        return self.queue is not None and time.monotonic() >= self.next_flush
+
+    def post(self, msg):
+        if self.queue is None:
+            return
+        with self.lock:
+            self.latest[msg[0]] = msg
+        if time.monotonic() >= self.next_flush:
+            self.flush()
+
+    def flush(self):
+        if self.queue is None:
+            return
+        with self.lock:
+            for msg in self.latest.values():
+                self.queue.put(msg)
+            self.latest.clear()
+            self.next_flush = time.monotonic() + self.interval
@@ -0,0 +1,216 @@
+import functools
+import hashlib
+import os
+import sys
+
+MAX_FOLDER_NAME_LENGTH = 50  # Max length for each folder name segment
+MAX_PATH_LENGTH = 260        # Max length for the entire path
+SANITIZE_CACHE_SIZE = 65536  # Sanitized folder prefixes kept in memory
+RECOVERY_NAME_LENGTH = 8     # Length of folder and file names in recovery paths
+
+# Replace characters Windows does not allow in names
+INVALID_CHARS = '<>:"/\\|?*'
+INVALID_CHARS_TABLE = str.maketrans({char: '_' for char in INVALID_CHARS})
+
+# Names abspath() would rewrite on Windows
+WINDOWS_RESERVED_NAMES = {'CON', 'PRN', 'AUX', 'NUL', 'CONIN$', 'CONOUT$'} | \
+                         {f'{name}{i}' for name in ('COM', 'LPT') for i in range(1, 10)}
+
+
+# Longest name and path a target accepts. Windows counts characters; POSIX filesystems and S3 count
+# the bytes of the UTF-8 encoded name, so a name is cut between characters, never inside one.
+class PathLimits:
+    def __init__(self, max_name_length, max_path_length, in_bytes=False):
+        self.max_name_length = max_name_length
+        self.max_path_length = max_path_length
+        self.in_bytes = in_bytes
+
+    def length(self, text):
+        if not self.in_bytes or text.isascii():
+            return len(text)
+        return len(text.encode('utf-8', 'surrogatepass'))
+
+    def fit(self, text, length):
+        # text cut to at most length
+        if not self.in_bytes or len(text) * 4 <= length:
+            return text[:length]
+        return text.encode('utf-8', 'surrogatepass')[:length].decode('utf-8', 'ignore')
+
+
+# 'windows' keeps every folder and file name to 50 characters and paths to 260, so the tree can be
+# opened and copied anywhere on Windows. The others only enforce what the target itself allows.
+PATH_LIMITS = {
+    'windows': PathLimits(MAX_FOLDER_NAME_LENGTH, MAX_PATH_LENGTH),
+    'macos': PathLimits(255, 1023, in_bytes=True),
+    'posix': PathLimits(255, 4095, in_bytes=True),
+    's3': PathLimits(255, 1024, in_bytes=True),  # Object keys are at most 1024 bytes
+}
+NATIVE_PATH_LIMITS = 'windows' if os.name == 'nt' else 'macos' if sys.platform == 'darwin' else 'posix'
+
+
+# Maps ZIP member paths to safe paths under the output folder, within the given PathLimits (by default
+# Windows'). With relative, the path limit applies to the path below the output folder, for sinks that
+# store files by their relative path (an archive, an object store). Every folder prefix is sanitized
+# once and cached (LRU), so the files of a folder only pay for their own name. Paths the cache cannot
+# handle exactly (too long, '.' or '..' segments, names Windows rewrites) go through the full,
+# uncached algorithm, so the results are always the same.
+class PathSanitizer:
+    def __init__(self, output_folder, cache_size=SANITIZE_CACHE_SIZE, limits=PATH_LIMITS['windows'], relative=False):
+        self.output_folder = output_folder
+        self.output_folder_abs = os.path.abspath(output_folder)
+        self.limits = limits
+        self.max_name_length = limits.max_name_length
+        self.root_length = limits.length(self.output_folder_abs) + 1
+        # Paths are measured with the output folder in front; a relative limit is moved up by as much
+        self.max_path_length = limits.max_path_length + (self.root_length if relative else 0)
+        self.sanitize_folder = functools.lru_cache(maxsize=cache_size)(self._sanitize_folder)
+
+    @staticmethod
+    def sanitize_part(part):
+        # Remove leading and trailing spaces, then invalid characters
+        return part.strip().translate(INVALID_CHARS_TABLE)
+
+    def sanitize_name(self, part):
+        part = self.sanitize_part(part)
+
+        # Preserve the extension
+        filename, ext = os.path.splitext(part)
+
+        # Ensure total filename length does not exceed the name limit
+        max_filename_length = self.max_name_length - self.limits.length(ext)
+        if max_filename_length < 1:
+            filename = hashlib.md5(filename.encode()).hexdigest()[:8]
+        else:
+            filename = self.limits.fit(filename, max_filename_length)
+
+        return filename + ext
+
+    @staticmethod
+    def is_plain(part):
+        # Whether abspath() leaves this segment untouched
+        if not part or part in ('.', '..'):
+            return False
+        if os.name == 'nt':
+            return not part.endswith('.') and part.split('.')[0].upper() not in WINDOWS_RESERVED_NAMES
+        return True
+
+    def _sanitize_folder(self, folder):
+        # folder uses '/' separators; returns (sanitized folder path, whether it is plain)
+        parent, _, part = folder.rpartition('/')
+        part = self.limits.fit(self.sanitize_part(part), self.max_name_length)
+        if not parent:
+            return part, self.is_plain(part)
+        sanitized_parent, plain = self.sanitize_folder(parent)
+        return os.path.join(sanitized_parent, part), plain and self.is_plain(part)
+
+    def sanitize(self, file_path):
+        # Replace backslashes with slashes
+        file_path = file_path.replace('\\', '/')
+        folder, _, name = file_path.rpartition('/')
+        name = self.sanitize_name(name)
+
+        if folder:
+            sanitized_folder, plain = self.sanitize_folder(folder)
+            sanitized_path = os.path.join(sanitized_folder, name)
+        else:
+            plain = True
+            sanitized_path = name
+
+        if plain and self.is_plain(name) and \
+                self.root_length + self.limits.length(sanitized_path) <= self.max_path_length:
+            return sanitized_path
+        return self.sanitize_uncached(file_path)
+
+    def sanitize_uncached(self, file_path):
+        # Replace backslashes with slashes
+        file_path = file_path.replace('\\', '/')
+
+        # Split into parts
+        parts = file_path.split('/')
+
+        sanitized_parts = []
+        for i, part in enumerate(parts):
+            if i == len(parts) - 1:
+                part = self.sanitize_name(part)
+            else:
+                # Truncate directory names
+                part = self.limits.fit(self.sanitize_part(part), self.max_name_length)
+
+            sanitized_parts.append(part)
+
+        # Reconstruct the path
+        sanitized_path = os.path.join(*sanitized_parts)
+
+        # Ensure total path length does not exceed the path limit
+        full_path = os.path.abspath(os.path.join(self.output_folder, sanitized_path))
+        if self.limits.length(full_path) > self.max_path_length:
+            # Shorten the path
+            try:
+                full_path = self.shorten_path(full_path, sanitized_parts)
+            except Exception as e:
+                raise Exception(f"Cannot shorten path: {sanitized_path}. Error: {e}")
+
+        return os.path.relpath(full_path, self.output_folder)
+
+    def short_path(self, file_path):
+        # First recovery fallback: every folder cut to 8 characters, the file name to 8 plus its extension
+        parts = file_path.replace('\\', '/').split('/')
+        folders = [self.sanitize_part(part)[:RECOVERY_NAME_LENGTH] for part in parts[:-1]]
+        filename, ext = os.path.splitext(self.sanitize_name(parts[-1]))
+        name = (filename[:RECOVERY_NAME_LENGTH] or '_') + ext[:RECOVERY_NAME_LENGTH + 1]
+        if name in ('.', '..'):
+            name = '_'
+        return os.path.join(*[part for part in folders if part not in ('', '.', '..')], name)
+
+    def hashed_path(self, file_path):
+        # Last recovery fallback: the folder and the file name replaced by hashes, only the extension kept
+        folder, _, name = file_path.replace('\\', '/').rpartition('/')
+        ext = os.path.splitext(self.sanitize_name(name))[1][:RECOVERY_NAME_LENGTH + 1]
+        name = hashlib.md5(name.encode()).hexdigest()[:RECOVERY_NAME_LENGTH] + ext
+        if not folder:
+            return name
+        return os.path.join(hashlib.md5(folder.encode()).hexdigest()[:RECOVERY_NAME_LENGTH], name)
+
+    def shorten_path(self, full_path, sanitized_parts):
+        # Ensure total path length does not exceed the path limit
+        max_total_length = self.max_path_length
+        length = self.limits.length
+
+        # If the full path is already within the limit, just return it
+        if length(full_path) <= max_total_length:
+            return full_path
+
+        # Start shortening file names from the deepest directory going up
+        for i in range(len(sanitized_parts)-1, -1, -1):
+            part = sanitized_parts[i]
+            if i == len(sanitized_parts) - 1:
+                # Preserve the extension
+                filename, ext = os.path.splitext(part)
+                if len(filename) > 8:
+                    filename = filename[:8]
+                else:
+                    filename = filename[:max(1, len(filename) - 1)]
+                sanitized_parts[i] = filename + ext
+            else:
+                # Shorten directory names
+                if len(sanitized_parts[i]) > 8:
+                    sanitized_parts[i] = sanitized_parts[i][:8]
+                else:
+                    sanitized_parts[i] = sanitized_parts[i][:max(1, len(sanitized_parts[i]) - 1)]
+
+            # Reconstruct the path and check its length
+            new_full_path = os.path.abspath(os.path.join(self.output_folder, *sanitized_parts))
+            if length(new_full_path) <= max_total_length:
+                return new_full_path
+
+        # If we reach here, we couldn't shorten the path sufficiently
+        # As a last resort, we can hash parts of the path
+        for i in range(len(sanitized_parts)):
+            hashed_part = hashlib.md5(sanitized_parts[i].encode()).hexdigest()[:6]
+            sanitized_parts[i] = hashed_part
+            new_full_path = os.path.abspath(os.path.join(self.output_folder, *sanitized_parts))
+            if length(new_full_path) <= max_total_length:
+                return new_full_path
+
+        # If still too long, raise an exception
+        raise Exception("Cannot shorten path to acceptable length.")
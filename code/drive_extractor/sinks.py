@@ -0,0 +1,528 @@
+import collections
+import concurrent.futures
+import contextlib
+import io
+import os
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+
+from .dedup import link_file
+from .fastcopy import LOCAL_HEADER_SIZE, commit_temp, data_offset, discard_temp, open_temp, preallocate
+from .sanitize import NATIVE_PATH_LIMITS, PATH_LIMITS
+
+ARCHIVE_BUFFER_SIZE = 4 * 1024 * 1024  # Members up to this size are prepared by their worker, larger ones streamed in
+ARCHIVE_FORMATS = {'.zip': 'zip', '.tar': 'tar', '.tar.gz': 'tar.gz', '.tgz': 'tar.gz'}  # By file name ending
+RAW_COPY_CHUNK_SIZE = 1024 * 1024      # Compressed bytes copied at a time between ZIP files
+TAR_ENCODING = 'utf-8'
+
+S3_PART_SIZE = 8 * 1024 * 1024         # Files up to this size are uploaded in one request
+S3_MIN_PART_SIZE = 5 * 1024 * 1024     # Smallest part S3 accepts, except for the last one
+S3_MAX_PARTS = 10000
+S3_PARTS_IN_FLIGHT = 2                 # Parts of one file being uploaded while the next is read
+
+
+# Where the extracted files go. The extractor plans every destination as a path under the output
+# folder, which always holds the logs and the checkpoint, and hands each file's content to its sink:
+# open(dest_path, info) returns a target to write() to, which is then committed, or discarded when
+# anything goes wrong, so no file is ever left with partial content. Sinks that are not local store
+# each file under its path relative to the output folder.
+class Sink:
+    local = False             # Files are written to the output folder itself
+    resumable = True          # Files written by an earlier run are still there for the next one
+    concurrent_writes = True  # Several files can be written at the same time
+    path_limits = PATH_LIMITS['posix']
+    location = ''             # Where the files went, for the processing summary
+
+    def attach(self, output_folder, max_workers):
+        self.root = output_folder
+
+    def key(self, dest_path):
+        return os.path.relpath(dest_path, self.root).replace(os.sep, '/')
+
+    @contextlib.contextmanager
+    def writing(self, dest_path, info):
+        # Commits the target when the block ends, discards it when the block raises: an error, a cancelled
+        # job or a crash never leaves a file with partial content
+        target = self.open(dest_path, info)
+        try:
+            yield target
+        except BaseException:
+            self.discard(target)
+            raise
+        self.commit(target)
+
+    def exists(self, dest_path, size):
+        # Whether an earlier run's file is still in place, for resuming
+        return False
+
+    def link(self, source_path, dest_path, mode, date_time=None):
+        # Stores dest_path with the content of an already written file, returns how it was done.
+        # date_time is the already written file's, as in ZipInfo, for sinks that store one.
+        raise OSError("Files cannot be linked in this output")
+
+    def copy_raw(self, zf, info, dest_path, pace=None):
+        # Stores a member without decompressing it, when the sink can; False to extract it normally
+        return False
+
+    def remove(self, dest_path):
+        pass
+
+    def close(self):
+        pass
+
+
+# Files in the output folder, within the limits of this platform or the ones asked for. Each file
+# is written under a temporary name in its folder and renamed once complete.
+class LocalSink(Sink):
+    local = True
+
+    def __init__(self, path_limits=NATIVE_PATH_LIMITS):
+        self.path_limits = PATH_LIMITS[path_limits]
+
+    def attach(self, output_folder, max_workers):
+        self.root = self.location = output_folder
+
+    def open(self, dest_path, info):
+        file, temp_path = open_temp(dest_path)
+        preallocate(file.fileno(), info.file_size)
+        return LocalTarget(file, temp_path, dest_path)
+
+    def commit(self, target):
+        try:
+            target.file.close()
+        except BaseException:
+            discard_temp(target.temp_path)
+            raise
+        commit_temp(target.temp_path, target.dest_path)
+
+    def discard(self, target):
+        with contextlib.suppress(OSError):
+            target.file.close()
+        discard_temp(target.temp_path)
+
+    def exists(self, dest_path, size):
+        return os.path.isfile(dest_path) and os.path.getsize(dest_path) == size
+
+    def link(self, source_path, dest_path, mode, date_time=None):
+        return link_file(source_path, dest_path, mode)
+
+    def remove(self, dest_path):
+        with contextlib.suppress(OSError):
+            os.remove(dest_path)
+
+
+class LocalTarget:
+    def __init__(self, file, temp_path, dest_path):
+        self.file = file
+        self.temp_path = temp_path
+        self.dest_path = dest_path
+        self.write = file.write
+        self.fileno = file.fileno
+        self.truncate = file.truncate
+
+
+def archive_format(path):
+    for ending, name in ARCHIVE_FORMATS.items():
+        if path.lower().endswith(ending):
+            return name
+    raise ValueError(f"Cannot tell the archive format from {path!r}, use a name ending in "
+                     f"{', '.join(ARCHIVE_FORMATS)}")
+
+
+# All files in one archive instead of a folder: a ZIP file, with ZIP64 records where sizes need them,
+# or a tar file, optionally gzip-compressed, written as one stream to a file or to standard output
+# ('-'), without temporary files. Members up to buffer_size are read (and for ZIP compressed) by their
+# worker and appended under a lock; larger ones keep the lock while they are streamed in. ZIP members
+# can also be copied as they are stored in the downloaded parts, without decompressing and compressing
+# them again (copy_raw). Entries are in the order their files finish. A member that fails halfway is
+# cut off again; on a pipe a ZIP member's bytes stay but the central directory never lists them, and
+# a tar member is filled up with zeros. The archive is complete once the sink is closed.
+class ArchiveSink(Sink):
+    resumable = False  # Every run writes a new archive
+    concurrent_writes = False
+
+    def __init__(self, path, format=None, path_limits='posix', buffer_size=ARCHIVE_BUFFER_SIZE):
+        self.format = format or archive_format(path)
+        if self.format not in ARCHIVE_FORMATS.values():
+            raise ValueError(f"format must be one of {sorted(set(ARCHIVE_FORMATS.values()))}, not {self.format!r}")
+        self.path = self.location = path
+        self.path_limits = PATH_LIMITS[path_limits]
+        self.buffer_size = buffer_size
+        self.lock = threading.Lock()
+        self.file = None
+        self.seekable = False
+        self.zip = None
+        self.tar = None
+
+    def start(self):
+        # Called with the lock held, the archive is created by its first member or when it is closed
+        if self.file is not None:
+            return
+        self.file = sys.stdout.buffer if self.path == '-' else open(self.path, 'wb')
+        self.seekable = self.file.seekable()
+        if self.format == 'zip':
+            self.zip = zipfile.ZipFile(self.file, 'w', allowZip64=True)
+        else:
+            mode = 'w|gz' if self.format == 'tar.gz' else 'w' if self.seekable else 'w|'
+            self.tar = tarfile.open(fileobj=self.file, mode=mode, format=tarfile.PAX_FORMAT, encoding=TAR_ENCODING)
+
+    def open(self, dest_path, info):
+        entry = ArchiveEntry(self.key(dest_path), info)
+        if info.file_size <= self.buffer_size:
+            entry.buffer = io.BytesIO()
+            entry.write = entry.buffer.write
+            return entry
+
+        self.lock.acquire()
+        try:
+            self.start()
+            if self.zip is not None:
+                entry.zinfo = self.zip_info(entry.name, info, info.compress_type)
+                entry.stream = self.zip.open(entry.zinfo, 'w')
+                entry.write = entry.stream.write
+            else:
+                entry.tarinfo = self.tar_info(entry.name, info.file_size, info.date_time)
+                entry.offset = self.tar.offset
+                header = entry.tarinfo.tobuf(self.tar.format, self.tar.encoding, self.tar.errors)
+                self.tar.fileobj.write(header)
+                self.tar.offset += len(header)
+                entry.fileobj = self.tar.fileobj
+                entry.write = entry.write_tar
+        except BaseException:
+            self.lock.release()
+            raise
+        return entry
+
+    def commit(self, entry):
+        if entry.buffer is not None:
+            self.append(entry)
+            return
+        try:
+            if self.zip is not None:
+                entry.stream.close()
+            else:
+                if entry.written != entry.tarinfo.size:
+                    raise OSError(f"{entry.name}: {entry.written} bytes instead of {entry.tarinfo.size}")
+                self.pad_tar(entry.written)
+        except BaseException:
+            self.cut_off(entry)
+            raise
+        finally:
+            self.lock.release()
+
+    def discard(self, entry):
+        if entry.buffer is not None:
+            return
+        try:
+            self.cut_off(entry)
+        finally:
+            self.lock.release()
+
+    def cut_off(self, entry):
+        # Called with the lock held: removes a streamed member that failed
+        if self.zip is not None:
+            with contextlib.suppress(Exception):
+                entry.stream.close()
+            if self.zip.filelist and self.zip.filelist[-1] is entry.zinfo:
+                self.zip.filelist.pop()
+                self.zip.NameToInfo.pop(entry.name, None)
+            self.rewind_zip(entry.zinfo.header_offset)
+        elif self.seekable and self.tar.fileobj is self.file:
+            self.file.seek(entry.offset)
+            self.file.truncate()
+            self.tar.offset = entry.offset
+        else:
+            self.tar.fileobj.write(bytes(entry.tarinfo.size - entry.written))
+            self.pad_tar(entry.tarinfo.size)
+
+    def append(self, entry):
+        # A buffered member, compressed (ZIP) or framed (tar) before the lock is taken
+        data = entry.buffer.getbuffer()
+        if self.format == 'zip':
+            zinfo = self.zip_info(entry.name, entry.info, zipfile.ZIP_STORED)
+            zinfo.CRC = zlib.crc32(data)
+            if entry.info.compress_type == zipfile.ZIP_DEFLATED:
+                compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+                compressed = compressor.compress(data) + compressor.flush()
+                if len(compressed) < len(data):
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    data = compressed
+            zinfo.compress_size = len(data)
+            with self.lock, self.zip_member(zinfo) as fp:
+                fp.write(data)
+        else:
+            tarinfo = self.tar_info(entry.name, len(data), entry.info.date_time)
+            header = tarinfo.tobuf(tarfile.PAX_FORMAT, TAR_ENCODING, 'surrogateescape')
+            padding = bytes(-len(data) % tarfile.BLOCKSIZE)
+            with self.lock:
+                self.start()
+                self.tar.fileobj.write(header + data + padding)
+                self.tar.offset += len(header) + len(data) + len(padding)
+
+    def copy_raw(self, zf, info, dest_path, pace=None):
+        # ZIP members are copied into the new archive as they are stored in the old one. The CRC is
+        # not checked here, but the copy keeps it, so any ZIP reader checks it on extraction.
+        if self.format != 'zip' or not hasattr(os, 'pread') or info.flag_bits & 0x1 or \
+                info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            return False
+        zip_fd = zf.fp.fileno()
+        offset = data_offset(info, os.pread(zip_fd, LOCAL_HEADER_SIZE, info.header_offset))
+        zinfo = self.zip_info(self.key(dest_path), info, info.compress_type)
+        zinfo.CRC = info.CRC
+        zinfo.compress_size = info.compress_size
+        if info.compress_size <= self.buffer_size:
+            data = read_at(zip_fd, info.compress_size, offset, info)
+            with self.lock, self.zip_member(zinfo) as fp:
+                fp.write(data)
+            return True
+
+        with self.lock, self.zip_member(zinfo) as fp:
+            done = 0
+            while done < info.compress_size:
+                data = read_at(zip_fd, min(RAW_COPY_CHUNK_SIZE, info.compress_size - done), offset + done, info)
+                fp.write(data)
+                done += len(data)
+                if pace is not None:
+                    pace(len(data))
+        return True
+
+    @contextlib.contextmanager
+    def zip_member(self, zinfo):
+        # Called with the lock held: writes zinfo's local header, the caller its data, then lists it
+        self.start()
+        zf = self.zip
+        zinfo.header_offset = zf.start_dir
+        try:
+            zf.fp.write(zinfo.FileHeader())
+            yield zf.fp
+        except BaseException:
+            self.rewind_zip(zinfo.header_offset)
+            raise
+        zf.start_dir = zf.fp.tell()
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+
+    def rewind_zip(self, offset):
+        if self.seekable:
+            self.file.seek(offset)
+            self.file.truncate()
+        self.zip.start_dir = self.zip.fp.tell()
+
+    def pad_tar(self, size):
+        padding = -size % tarfile.BLOCKSIZE
+        self.tar.fileobj.write(bytes(padding))
+        self.tar.offset += size + padding
+
+    @staticmethod
+    def zip_info(name, info, compress_type):
+        zinfo = zipfile.ZipInfo(name, info.date_time)
+        zinfo.compress_type = compress_type
+        zinfo.file_size = info.file_size
+        zinfo.external_attr = 0o644 << 16
+        return zinfo
+
+    @staticmethod
+    def tar_info(name, size, date_time):
+        tarinfo = tarfile.TarInfo(name)
+        tarinfo.size = size
+        tarinfo.mtime = int(time.mktime(tuple(date_time) + (0, 0, -1)))
+        tarinfo.mode = 0o644
+        return tarinfo
+
+    def link(self, source_path, dest_path, mode, date_time=None):
+        # tar has hard links; in a ZIP file the member is stored again. A link has the time of the file
+        # it links to, so the same input always gives the same archive.
+        if self.format == 'zip':
+            return super().link(source_path, dest_path, mode)
+        tarinfo = self.tar_info(self.key(dest_path), 0, date_time)
+        tarinfo.type = tarfile.LNKTYPE
+        tarinfo.linkname = self.key(source_path)
+        header = tarinfo.tobuf(tarfile.PAX_FORMAT, TAR_ENCODING, 'surrogateescape')
+        with self.lock:
+            self.start()
+            self.tar.fileobj.write(header)
+            self.tar.offset += len(header)
+        return 'hardlink'
+
+    def close(self):
+        with self.lock:
+            self.start()
+            if self.zip is not None:
+                self.zip.close()
+            else:
+                self.tar.close()
+            if self.file is sys.stdout.buffer:
+                self.file.flush()
+            else:
+                self.file.close()
+
+
+# One member on its way into an ArchiveSink
+class ArchiveEntry:
+    def __init__(self, name, info):
+        self.name = name
+        self.info = info
+        self.buffer = None   # Buffered content, None when streamed
+        self.write = None
+        self.zinfo = None
+        self.stream = None
+        self.tarinfo = None
+        self.fileobj = None
+        self.offset = 0      # Where a streamed tar member starts
+        self.written = 0
+
+    def write_tar(self, data):
+        if self.written + len(data) > self.tarinfo.size:
+            raise OSError(f"{self.name}: more data than the {self.tarinfo.size} bytes in its header")
+        self.fileobj.write(data)
+        self.written += len(data)
+
+    def truncate(self, size):
+        # The archive only ever holds what was written
+        pass
+
+
+def read_at(fd, count, offset, info):
+    data = os.pread(fd, count, offset)
+    if len(data) != count:
+        raise zipfile.BadZipFile(f"Archive ends inside {info.filename}")
+    return data
+
+
+def parse_s3_url(url):
+    # s3://bucket/prefix -> (bucket, prefix ending in / or empty)
+    if not url.startswith('s3://') or not url[5:].split('/', 1)[0]:
+        raise ValueError(f"Not an S3 URL: {url!r}, use s3://bucket/prefix")
+    bucket, _, prefix = url[5:].partition('/')
+    prefix = prefix.strip('/')
+    return bucket, prefix + '/' if prefix else ''
+
+
+# Files uploaded to an S3-compatible object store (AWS S3, MinIO, Ceph, ...) under s3://bucket/prefix,
+# straight from the ZIP files, without writing them to local disk. Files up to part_size go up in one
+# request, larger ones as multipart uploads whose parts are sent while the next part is read. Failed
+# and cancelled uploads are aborted, so an object only appears once it is complete. All workers share
+# one client, with a connection pool sized for them and their parts in flight. Credentials, region and
+# retries come from the usual boto3 configuration (environment variables, ~/.aws/config). boto3 is
+# only imported here, and not needed at all when a client of its own is given.
+class S3Sink(Sink):
+    path_limits = PATH_LIMITS['s3']
+
+    def __init__(self, url, endpoint_url=None, part_size=S3_PART_SIZE, path_limits='s3', client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("Uploading to S3 needs boto3 (pip install boto3)") from None
+        if part_size < S3_MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {S3_MIN_PART_SIZE} bytes")
+        self.bucket, self.prefix = parse_s3_url(url)
+        self.location = url
+        self.endpoint_url = endpoint_url
+        self.part_size = part_size
+        self.path_limits = PATH_LIMITS[path_limits]
+        self.client = client
+        self.uploads = None
+        self.objects = None  # Key -> size of the objects already under the prefix, listed once for resuming
+
+    def attach(self, output_folder, max_workers):
+        self.root = output_folder
+        if self.client is None:
+            import boto3
+            from botocore.config import Config
+            config = Config(max_pool_connections=max_workers * (S3_PARTS_IN_FLIGHT + 1))
+            self.client = boto3.session.Session().client('s3', endpoint_url=self.endpoint_url, config=config)
+        if self.uploads is None:
+            self.uploads = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers * S3_PARTS_IN_FLIGHT,
+                                                                 thread_name_prefix='s3-upload')
+
+    def key(self, dest_path):
+        return self.prefix + super().key(dest_path)
+
+    def open(self, dest_path, info):
+        return S3Upload(self, self.key(dest_path), info.file_size)
+
+    def commit(self, upload):
+        try:
+            if upload.upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=upload.key, Body=bytes(upload.buffer))
+                return
+            if upload.buffer:
+                upload.send_part(bytes(upload.buffer))
+            parts = [part.result() for part in upload.parts]
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=upload.key, UploadId=upload.upload_id,
+                                                  MultipartUpload={'Parts': parts})
+        except BaseException:
+            self.discard(upload)
+            raise
+
+    def discard(self, upload):
+        for part in upload.parts:
+            part.cancel()
+        concurrent.futures.wait(upload.parts)
+        if upload.upload_id is not None:
+            with contextlib.suppress(Exception):
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=upload.key, UploadId=upload.upload_id)
+
+    def exists(self, dest_path, size):
+        if self.objects is None:
+            self.objects = {}
+            for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix):
+                for item in page.get('Contents', ()):
+                    self.objects[item['Key']] = item['Size']
+        return self.objects.get(self.key(dest_path)) == size
+
+    def link(self, source_path, dest_path, mode, date_time=None):
+        # Copied inside the object store, nothing is uploaded again (up to 5 GiB, larger copies fail
+        # and the file is extracted normally)
+        self.client.copy_object(Bucket=self.bucket, Key=self.key(dest_path),
+                                CopySource={'Bucket': self.bucket, 'Key': self.key(source_path)})
+        return 'copy'
+
+    def close(self):
+        if self.uploads is not None:
+            self.uploads.shutdown()
+
+
+# One object being uploaded: written bytes are collected into parts, at most S3_PARTS_IN_FLIGHT
+# of which are held in memory at a time
+class S3Upload:
+    def __init__(self, sink, key, size):
+        self.sink = sink
+        self.key = key
+        # S3 allows at most S3_MAX_PARTS parts per object, larger files get larger parts
+        self.part_size = max(sink.part_size, -(-size // S3_MAX_PARTS))
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []  # Futures of the parts sent, in part order
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self.send_part(part)
+        return len(data)
+
+    def send_part(self, data):
+        sink = self.sink
+        if self.upload_id is None:
+            self.upload_id = sink.client.create_multipart_upload(Bucket=sink.bucket, Key=self.key)['UploadId']
+        in_flight = collections.deque(part for part in self.parts if not part.done())
+        while len(in_flight) >= S3_PARTS_IN_FLIGHT:
+            in_flight.popleft().result()
+        part_number = len(self.parts) + 1
+        self.parts.append(sink.uploads.submit(self.upload_part, part_number, data))
+
+    def upload_part(self, part_number, data):
+        response = self.sink.client.upload_part(Bucket=self.sink.bucket, Key=self.key, UploadId=self.upload_id,
+                                                PartNumber=part_number, Body=data)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def truncate(self, size):
+        # The object only ever holds what was written
+        pass
@@ -0,0 +1,137 @@
+import contextlib
+import os
+import zipfile
+import zlib
+
+from .fastcopy import LOCAL_HEADER_SIZE, data_offset, dest_error, temp_name
+
+SMALL_FILE_SIZE = 64 * 1024          # Members up to this size are extracted in runs
+SMALL_RUN_FILES = 64                 # Members in one run at most
+SMALL_RUN_BYTES = 4 * 1024 * 1024    # Archive bytes one run reads at most
+SMALL_RUN_GAP = 64 * 1024            # Bytes of other members a run may read past
+FOLDER_DESCRIPTORS = 128             # Folders a worker keeps open at most
+
+# Runs are read with pread() and written relative to folder descriptors, which Windows has neither of
+SMALL_FILES_SUPPORTED = hasattr(os, 'pread') and os.open in os.supports_dir_fd and os.rename in os.supports_dir_fd
+
+WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_CLOEXEC', 0)
+FOLDER_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_CLOEXEC', 0)
+
+
+def is_small(manifest, entry):
+    # Small, unencrypted, stored or deflated: members a run can read and inflate itself
+    return manifest.file_size[entry] <= SMALL_FILE_SIZE and manifest.compress_size[entry] <= SMALL_FILE_SIZE and \
+        not manifest.flag_bits[entry] & 0x1 and \
+        manifest.compress_type[entry] in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+
+def small_runs(manifest, members):
+    # Splits small members, (entry, ...) tuples of one archive, into runs of members that lie close
+    # together in the archive, in archive order
+    runs = []
+    run = []
+    run_start = run_end = 0
+    for member in sorted(members, key=lambda member: manifest.header_offset[member[0]]):
+        entry = member[0]
+        offset = manifest.header_offset[entry]
+        end = offset + LOCAL_HEADER_SIZE + manifest.compress_size[entry]
+        if run and (len(run) >= SMALL_RUN_FILES or offset - run_end > SMALL_RUN_GAP
+                    or end - run_start > SMALL_RUN_BYTES):
+            runs.append(run)
+            run = []
+        if not run:
+            run_start = offset
+        run.append(member)
+        run_end = end
+    if run:
+        runs.append(run)
+    return runs
+
+
+# The archive bytes of a run of members, read with one pread() from the first local header to past
+# the last member's data. A member whose local header holds more than expected reads the rest then.
+class RunReader:
+    def __init__(self, fd, infos):
+        self.fd = fd
+        self.start = infos[0].header_offset
+        last = infos[-1]
+        end = last.header_offset + LOCAL_HEADER_SIZE + len(last.orig_filename.encode()) + last.compress_size
+        self.data = os.pread(fd, end - self.start, self.start)
+
+    def read(self, offset, size):
+        stop = offset - self.start + size
+        if stop > len(self.data):
+            self.data += os.pread(self.fd, stop - len(self.data), self.start + len(self.data))
+            if stop > len(self.data):
+                raise zipfile.BadZipFile("Archive ends inside a member")
+        return self.data[offset - self.start:stop]
+
+    def member(self, info):
+        # The member's content, checked against its size and CRC like ZipExtFile does
+        data = self.read(data_offset(info, self.read(info.header_offset, LOCAL_HEADER_SIZE)), info.compress_size)
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            # Bounded by the size the central directory gives, a lying member cannot blow up in memory
+            data = zlib.decompressobj(-zlib.MAX_WBITS).decompress(data, info.file_size + 1)
+        if len(data) != info.file_size:
+            raise zipfile.BadZipFile(f"Wrong size for {info.filename}: {len(data)} instead of {info.file_size}")
+        if zlib.crc32(data) != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+        return data
+
+
+# Writes whole small files relative to a descriptor per folder, so no path is looked up again for
+# every file. Each worker keeps one, with the folders it wrote to last open, up to max_folders. A
+# folder is only opened for its second file, files of folders written to once go by their path.
+# Each file is written under a temporary name and renamed into place like LocalSink does, without
+# checking whether its name is taken: the path index already made it unique.
+class FolderWriter:
+    def __init__(self, max_folders=FOLDER_DESCRIPTORS):
+        self.max_folders = max_folders
+        self.folders = {}  # Folder -> descriptor, least recently opened first
+        self.seen = set()  # Folders written to once, forgotten now and then
+
+    def write(self, dest_path, data):
+        folder, name = os.path.split(dest_path)
+        folder_fd = self.folders.get(folder)
+        try:
+            if folder_fd is None and folder in self.seen:
+                if len(self.folders) >= self.max_folders:
+                    os.close(self.folders.pop(next(iter(self.folders))))
+                folder_fd = self.folders[folder] = os.open(folder, FOLDER_FLAGS)
+            elif folder_fd is None:
+                if len(self.seen) >= self.max_folders * 4:
+                    self.seen.clear()
+                self.seen.add(folder)
+                name = dest_path
+            while True:
+                temp_path = temp_name()
+                if folder_fd is None:
+                    temp_path = os.path.join(folder, temp_path)
+                try:
+                    fd = os.open(temp_path, WRITE_FLAGS, 0o666, dir_fd=folder_fd)
+                    break
+                except FileExistsError:
+                    continue
+        except OSError as e:
+            raise dest_error(e, dest_path)
+
+        try:
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+            os.rename(temp_path, name, src_dir_fd=folder_fd, dst_dir_fd=folder_fd)
+        except BaseException as e:
+            with contextlib.suppress(OSError):
+                os.unlink(temp_path, dir_fd=folder_fd)
+            if isinstance(e, OSError):
+                raise dest_error(e, dest_path)
+            raise
+
+    def close(self):
+        for folder_fd in self.folders.values():
+            os.close(folder_fd)
+        self.folders = {}
+        self.seen = set()
@@ -0,0 +1,28 @@
+import os
+import sys
+
+from .statuslog import columnar_to_csv
+
+USAGE = "usage: python -m drive_extractor.statuscsv file_status.bin [file_status.csv]"
+
+
+# Converts the file_status.bin of a run with --status-format columnar to CSV, next to it unless a
+# destination is given. A module of its own: the package imports statuslog, which therefore cannot
+# be run with -m without a warning.
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 2) or argv[0].startswith('-'):
+        print(USAGE, file=sys.stderr)
+        return 2
+    source_path = argv[0]
+    dest_path = argv[1] if len(argv) == 2 else os.path.splitext(source_path)[0] + '.csv'
+    try:
+        columnar_to_csv(source_path, dest_path)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import csv
+import os
+import struct
+import zlib
+
+STATUS_FIELDS = ['Original File Path', 'Original File Name', 'Sanitized File Name', 'Original Destination Path',
+                 'Sanitized Destination Path', 'Moved', 'Reason']
+
+# Positions in a file status row
+ORIGINAL_PATH, ORIGINAL_NAME, SANITIZED_NAME, ORIGINAL_DEST, SANITIZED_DEST, MOVED, REASON = range(len(STATUS_FIELDS))
+
+# Extra column when files are hashed while they are extracted
+HASH_FIELD = 'SHA-256'
+SHA256 = len(STATUS_FIELDS)
+
+STATUS_FORMATS = ('csv', 'columnar')
+STATUS_FILE_NAMES = {'csv': 'file_status.csv', 'columnar': 'file_status.bin'}
+STATUS_BATCH_SIZE = 4096          # Rows buffered before they are written
+STATUS_BUFFER_SIZE = 1024 * 1024  # Bytes buffered by the file itself
+
+COLUMNAR_MAGIC = b'GDZSTAT1'
+
+
+def new_status(file, hashed=False):
+    # One row of file_status, filled in as the file is planned and extracted
+    row = [file, os.path.basename(file), '', '', '', 'False', '']
+    if hashed:
+        row.append('')
+    return row
+
+
+# Writes file status rows in large batches instead of one csv.DictWriter call per file.
+class StatusWriter:
+    def __init__(self, path, append=False, batch_size=STATUS_BATCH_SIZE, fields=STATUS_FIELDS):
+        self.batch_size = batch_size
+        self.fields = fields
+        self.rows = []
+        new_file = not append or not os.path.exists(path)
+        self.file = self.open_file(path, 'a' if append else 'w')
+        if new_file:
+            self.write_header()
+
+    def open_file(self, path, mode):
+        file = open(path, mode, newline='', encoding='utf-8', buffering=STATUS_BUFFER_SIZE)
+        self.writer = csv.writer(file)
+        return file
+
+    def write_header(self):
+        self.writer.writerow(self.fields)
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.write_rows(self.rows)
+            self.rows = []
+        self.file.flush()
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Same rows in a compact binary layout for very large runs: each batch stores every column as one
+# zlib-compressed block of NUL-separated values, so the long, repetitive paths compress well.
+# Convert it with columnar_to_csv() or `python -m drive_extractor.statuscsv file_status.bin`.
+class ColumnarStatusWriter(StatusWriter):
+    def __init__(self, path, append=False, batch_size=STATUS_BATCH_SIZE * 4, fields=STATUS_FIELDS):
+        super().__init__(path, append=append, batch_size=batch_size, fields=fields)
+
+    def open_file(self, path, mode):
+        return open(path, mode + 'b', buffering=STATUS_BUFFER_SIZE)
+
+    def write_header(self):
+        header = '\0'.join(self.fields).encode('utf-8')
+        self.file.write(COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header)
+
+    def write_rows(self, rows):
+        self.file.write(struct.pack('<I', len(rows)))
+        for column in zip(*rows):
+            block = zlib.compress('\0'.join(column).encode('utf-8', 'surrogatepass'), 1)
+            self.file.write(struct.pack('<Q', len(block)) + block)
+
+
+def open_status_writer(output_folder, status_format='csv', append=False, hashed=False):
+    path = os.path.join(output_folder, STATUS_FILE_NAMES[status_format])
+    fields = STATUS_FIELDS + [HASH_FIELD] if hashed else STATUS_FIELDS
+    if status_format == 'columnar':
+        return ColumnarStatusWriter(path, append=append, fields=fields)
+    return StatusWriter(path, append=append, fields=fields)
+
+
+def read_columnar(path):
+    # Yields the header, then every row, of a file written by ColumnarStatusWriter
+    with open(path, 'rb') as file:
+        if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"{path} is not a columnar file status log")
+        (length,) = struct.unpack('<I', file.read(4))
+        fields = file.read(length).decode('utf-8').split('\0')
+        yield fields
+        while True:
+            count = file.read(4)
+            if not count:
+                break
+            (count,) = struct.unpack('<I', count)
+            columns = []
+            for _ in fields:
+                (length,) = struct.unpack('<Q', file.read(8))
+                columns.append(zlib.decompress(file.read(length)).decode('utf-8', 'surrogatepass').split('\0'))
+            yield from zip(*columns)
+
+
+def columnar_to_csv(source_path, dest_path):
+    with open(dest_path, 'w', newline='', encoding='utf-8') as csvfile:
+        csv.writer(csvfile).writerows(read_columnar(source_path))
+
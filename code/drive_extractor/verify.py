@@ -0,0 +1,167 @@
+import collections
+import concurrent.futures
+import hashlib
+import os
+import threading
+import time
+import zlib
+
+from .checkpoint import CHECKPOINT_FILE_NAME, Checkpoint
+from .engine import DEFAULT_WORKERS, Extractor, format_size
+from .errorlog import CsvLog
+from .manifest import Manifest
+from .parts import group_parts
+
+VERIFY_REPORT_FILE_NAME = 'verify_report.csv'
+VERIFY_SUMMARY_FILE_NAME = 'verify_summary.txt'
+VERIFY_FIELDS = ['zip_file', 'file', 'dest_path', 'status']
+VERIFY_BUFFER_SIZE = 1024 * 1024
+
+# Outcomes of one member. A duplicate was skipped because the same content was extracted to
+# the same path from another member; that copy is checked on its own row.
+VERIFIED = 'verified'
+UNCHANGED = 'unchanged since last verification'
+DUPLICATE = 'duplicate'
+INTACT = (VERIFIED, UNCHANGED, DUPLICATE)
+MISSING = 'missing'
+NOT_EXTRACTED = 'not extracted'
+SIZE_MISMATCH = 'size mismatch'
+CRC_MISMATCH = 'CRC mismatch'
+SHA256_MISMATCH = 'SHA-256 mismatch'
+ZIP_ERROR = 'ZIP error'
+
+
+# Checks an output folder against the ZIP files it was extracted from, without extracting again:
+# the checkpoint says where each member went, and each file is compared with the size and CRC32
+# from the archive's central directory, and with the SHA-256 recorded when it was extracted with
+# hashing on. Files are checked in parallel, and files a previous verify run found intact are
+# only re-hashed when their size or mtime changed since (or with rehash=True).
+class Verifier:
+    def __init__(self, zip_files, output_folder, max_workers=DEFAULT_WORKERS, rehash=False, member_filter=None,
+                 zip_index=False):
+        self.zip_files = [zip_file for export_set in group_parts(zip_files) for zip_file in export_set.zip_files]
+        self.output_folder = output_folder
+        self.max_workers = max(1, max_workers)
+        self.rehash = rehash
+        self.member_filter = member_filter  # Only verify the members it matches, as for a filtered extraction
+        self.zip_index = zip_index
+        self.worker_local = threading.local()
+
+        self.counts = collections.Counter()
+        self.bytes_hashed = 0
+        self.elapsed = 0.0
+
+    @property
+    def failed(self):
+        return sum(count for status, count in self.counts.items() if status not in INTACT)
+
+    def verify(self):
+        if not os.path.exists(os.path.join(self.output_folder, CHECKPOINT_FILE_NAME)):
+            raise FileNotFoundError(f"No extraction checkpoint in {self.output_folder}")
+        start = time.perf_counter()
+        report_file = os.path.join(self.output_folder, VERIFY_REPORT_FILE_NAME)
+        if os.path.exists(report_file):
+            os.remove(report_file)
+        manifest = Manifest(self.zip_files, self.member_filter, self.zip_index)
+        checkpoint = Checkpoint(self.output_folder, zip_files=self.zip_files)
+        report = CsvLog(report_file, VERIFY_FIELDS)
+        try:
+            records = checkpoint.load()
+            known = {} if self.rehash else checkpoint.load_verified()
+            # Extracted content by logical path, for members skipped as duplicates of another one
+            extracted = {(Extractor.normalize_member_name(member), crc, size): dest
+                         for member, crc, size, dest, done, _ in records.values() if done}
+
+            intact = []
+            failed = []
+            pending = collections.deque()
+            max_pending = self.max_workers * 4
+
+            def drain_one():
+                zip_file, member_index, file, dest_path, result = pending.popleft()
+                if isinstance(result, concurrent.futures.Future):
+                    status, size, mtime_ns, hashed = result.result()
+                    self.bytes_hashed += hashed
+                    if status in INTACT:
+                        intact.append((zip_file, member_index, size, mtime_ns))
+                    else:
+                        failed.append((zip_file, member_index))
+                else:
+                    status = result
+                self.counts[status] += 1
+                report.add({'zip_file': zip_file, 'file': file, 'dest_path': dest_path, 'status': status})
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for archive_index, zip_file in enumerate(manifest.zip_files):
+                    if archive_index in manifest.zip_errors:
+                        pending.append((zip_file, '', '', '', ZIP_ERROR))
+                        continue
+                    for entry in manifest.entries(archive_index):
+                        file = manifest.names[entry]
+                        crc = manifest.crc[entry]
+                        size = manifest.file_size[entry]
+                        key = Checkpoint.key(zip_file, manifest.member[entry])
+                        record = records.get(key)
+                        if record and record[:3] == (file, crc, size) and record[4]:
+                            dest_path = record[3]
+                            result = executor.submit(self.check_file, dest_path, size, crc, record[5],
+                                                     known.get(key))
+                        else:
+                            dest_path = extracted.get((Extractor.normalize_member_name(file), crc, size), '')
+                            result = DUPLICATE if dest_path else NOT_EXTRACTED
+                        pending.append((zip_file, manifest.member[entry], file, dest_path, result))
+                        while len(pending) > max_pending:
+                            drain_one()
+                while pending:
+                    drain_one()
+
+            checkpoint.record_verified(intact, failed)
+        finally:
+            report.close()
+            checkpoint.close()
+        self.elapsed = time.perf_counter() - start
+        self.write_summary()
+
+    def check_file(self, dest_path, size, crc, sha256, known):
+        # Runs on a worker thread. Returns (status, size, mtime_ns, bytes hashed).
+        try:
+            stat = os.stat(dest_path)
+        except OSError:
+            return MISSING, None, None, 0
+        if stat.st_size != size:
+            return SIZE_MISMATCH, None, None, 0
+        if known == (stat.st_size, stat.st_mtime_ns):
+            return UNCHANGED, stat.st_size, stat.st_mtime_ns, 0
+
+        # zlib and hashlib release the GIL on large buffers, so workers hash in parallel
+        file_crc = 0
+        digest = hashlib.sha256() if sha256 else None
+        view = getattr(self.worker_local, 'view', None)
+        if view is None:
+            view = self.worker_local.view = memoryview(bytearray(VERIFY_BUFFER_SIZE))
+        with open(dest_path, 'rb', buffering=0) as file:
+            while True:
+                n = file.readinto(view)
+                if not n:
+                    break
+                file_crc = zlib.crc32(view[:n], file_crc)
+                if digest is not None:
+                    digest.update(view[:n])
+        if file_crc != crc:
+            return CRC_MISMATCH, None, None, size
+        if digest is not None and digest.hexdigest() != sha256:
+            return SHA256_MISMATCH, None, None, size
+        return VERIFIED, stat.st_size, stat.st_mtime_ns, size
+
+    def write_summary(self):
+        summary_file = os.path.join(self.output_folder, VERIFY_SUMMARY_FILE_NAME)
+        with open(summary_file, 'w', encoding='utf-8') as file:
+            file.write(f"Files checked: {sum(self.counts.values())}\n")
+            for status in INTACT:
+                file.write(f"{status.capitalize()}: {self.counts[status]}\n")
+            file.write(f"Failed: {self.failed}\n")
+            for status, count in sorted(self.counts.items()):
+                if status not in INTACT:
+                    file.write(f"  {status}: {count}\n")
+            file.write(f"Re-hashed: {format_size(self.bytes_hashed)} in {self.elapsed:.1f} s\n")
+            file.write(f"Details: {VERIFY_REPORT_FILE_NAME}\n")
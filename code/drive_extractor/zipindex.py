@@ -0,0 +1,139 @@
+import contextlib
+import json
+import os
+import struct
+import sys
+import zipfile
+import zlib
+from array import array
+
+ZIP_INDEX_SUFFIX = '.index'  # drive-download-...-001.zip.index, next to the ZIP file
+INDEX_MAGIC = b'DXZI1'
+INDEX_HEADER = struct.Struct('<5sQqQ')  # Magic, ZIP size, ZIP mtime_ns, number of members
+
+# Columns kept per file member: (name, type in memory, type in the index file). The file types have
+# the same size on every platform, 'L' does not.
+MEMBER_COLUMNS = [('member', 'Q', 'Q'), ('compress_size', 'Q', 'Q'), ('file_size', 'Q', 'Q'), ('crc', 'L', 'I'),
+                  ('header_offset', 'Q', 'Q'), ('compress_type', 'H', 'H'), ('flag_bits', 'H', 'H'),
+                  ('date_time', 'L', 'I')]
+
+
+def pack_date_time(date_time):
+    # A ZIP timestamp (year, month, day, hour, minute, second) as one integer that sorts the same way,
+    # laid out like the MS-DOS date and time fields it is stored as
+    year, month, day, hour, minute, second = date_time
+    return (year - 1980) << 25 | month << 21 | day << 16 | hour << 11 | minute << 5 | second // 2
+
+
+def unpack_date_time(packed):
+    return (1980 + (packed >> 25), packed >> 21 & 0xF, packed >> 16 & 0x1F, packed >> 11 & 0x1F, packed >> 5 & 0x3F,
+            (packed & 0x1F) * 2)
+
+
+# The file members of one ZIP file, column by column, as read from its central directory
+# or from the index file next to it
+class ArchiveMembers:
+    def __init__(self):
+        self.columns = {name: array(code) for name, code, _ in MEMBER_COLUMNS}
+        self.names = []
+        self.orig_names = {}  # Position -> name as stored in the archive, where zipfile changed it
+
+    def __len__(self):
+        return len(self.names)
+
+
+def scan_members(zip_file):
+    members = ArchiveMembers()
+    columns = members.columns
+    with zipfile.ZipFile(zip_file, 'r') as zf:
+        infolist = zf.infolist()
+    for member_index, info in enumerate(infolist):
+        # Skip folders
+        if info.filename.endswith('/'):
+            continue
+        columns['member'].append(member_index)
+        columns['compress_size'].append(info.compress_size)
+        columns['file_size'].append(info.file_size)
+        columns['crc'].append(info.CRC)
+        columns['header_offset'].append(info.header_offset)
+        columns['compress_type'].append(info.compress_type)
+        columns['flag_bits'].append(info.flag_bits)
+        columns['date_time'].append(pack_date_time(info.date_time))
+        if info.orig_filename != info.filename:
+            members.orig_names[len(members.names)] = info.orig_filename
+        members.names.append(info.filename)
+    return members
+
+
+def load_index(path, stat):
+    # The members recorded in an index file, None when there is none, it is damaged or the ZIP file
+    # changed since it was written
+    try:
+        with open(path, 'rb') as file:
+            magic, zip_size, zip_mtime_ns, count = INDEX_HEADER.unpack(file.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC or (zip_size, zip_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                return None
+            return parse_index(zlib.decompress(file.read()), count)
+    except (OSError, ValueError, struct.error, zlib.error):
+        return None
+
+
+def parse_index(data, count):
+    members = ArchiveMembers()
+    offset = 0
+    for name, code, file_code in MEMBER_COLUMNS:
+        column = array(file_code)
+        size = column.itemsize * count
+        column.frombytes(data[offset:offset + size])
+        offset += size
+        if len(column) != count:
+            raise ValueError("Index file ends early")
+        if sys.byteorder == 'big':
+            column.byteswap()
+        members.columns[name] = column if code == file_code else array(code, column)
+    names_size, = struct.unpack_from('<Q', data, offset)
+    offset += 8
+    members.names = data[offset:offset + names_size].decode('utf-8', 'surrogatepass').split('\0') if count else []
+    offset += names_size
+    members.orig_names = {int(position): name for position, name in json.loads(data[offset:]).items()}
+    if len(members.names) != count:
+        raise ValueError("Index file does not match its member count")
+    return members
+
+
+def save_index(path, stat, members):
+    # Written to a temporary file first, so a reader never sees half an index. Best effort:
+    # the ZIP files may be on read-only media.
+    parts = []
+    for name, code, file_code in MEMBER_COLUMNS:
+        column = members.columns[name]
+        column = column if code == file_code else array(file_code, column)
+        if sys.byteorder == 'big':
+            column = array(file_code, column)
+            column.byteswap()
+        parts.append(column.tobytes())
+    names = '\0'.join(members.names).encode('utf-8', 'surrogatepass')
+    parts += [struct.pack('<Q', len(names)), names, json.dumps(members.orig_names).encode('utf-8')]
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(members)))
+            file.write(zlib.compress(b''.join(parts), 1))
+        os.replace(temp_path, path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+
+
+def read_members(zip_file, use_index=False):
+    # The file members of zip_file; with use_index from its index file, which is (re)written when it
+    # is missing or older than the ZIP file
+    if not use_index:
+        return scan_members(zip_file)
+    stat = os.stat(zip_file)
+    path = zip_file + ZIP_INDEX_SUFFIX
+    members = load_index(path, stat)
+    if members is None:
+        members = scan_members(zip_file)
+        save_index(path, stat, members)
+    return members
@@ -4,19 +4,12 @@
 # In[2]:
 
 
-import os
-import zipfile
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import csv
-import shutil
-import threading
-import re
-import hashlib
 import queue
 
-MAX_FOLDER_NAME_LENGTH = 50  # Max length for each folder name segment
-MAX_PATH_LENGTH = 260        # Max length for the entire path
+from drive_extractor import DEFAULT_WORKERS, Extractor, group_parts
+from drive_extractor.jobs import Job, JobScheduler
 
 class App:
     def __init__(self, root):
@@ -25,21 +18,17 @@ class App:
 
         self.zip_files = []
         self.output_folder = ""
+        self.max_workers = DEFAULT_WORKERS
 
-        # Progress tracker
-        self.total_files = 0
-        self.files_processed = 0
-        self.files_errors = 0
-
-        # Error processing tracker
-        self.total_errors = 0
-        self.errors_fixed = 0
-        self.errors_failed = 0
-
-        self.sanitized_paths_set = set()
+        # Extraction runs in the engine on the scheduler's thread, progress comes back through the queue
+        self.extractor = None
+        self.job = None
         self.queue = queue.Queue()
+        self.scheduler = JobScheduler(on_finished=lambda job: self.queue.put(('job_finished', job)))
+
         self.create_widgets()
         self.root.after(100, self.process_queue)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
 
     def create_widgets(self):
         instruction_label = tk.Label(self.root, text="Select ZIP files and an output directory")
@@ -61,10 +50,31 @@ class App:
         self.output_folder_label = tk.Label(self.root, text="")
         self.output_folder_label.pack()
 
+        # Parallel workers
+        self.workers_label = tk.Label(self.root, text="Parallel Workers:")
+        self.workers_label.pack()
+        self.workers_var = tk.IntVar(value=self.max_workers)
+        self.workers_spinbox = tk.Spinbox(self.root, from_=1, to=64, width=5, textvariable=self.workers_var)
+        self.workers_spinbox.pack()
+
+        # Progress units
+        self.progress_by_bytes_var = tk.BooleanVar(value=False)
+        self.progress_by_bytes_check = tk.Checkbutton(self.root, text="Show progress in bytes",
+                                                      variable=self.progress_by_bytes_var)
+        self.progress_by_bytes_check.pack()
+
         # Start button
         self.start_button = tk.Button(self.root, text="Start Processing", command=self.start_processing)
         self.start_button.pack(pady=10)
 
+        # Pause and cancel buttons
+        job_buttons = tk.Frame(self.root)
+        job_buttons.pack()
+        self.pause_button = tk.Button(job_buttons, text="Pause", state=tk.DISABLED, command=self.toggle_pause)
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = tk.Button(job_buttons, text="Cancel", state=tk.DISABLED, command=self.cancel_processing)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
         # Progress tracker
         self.progress_label_extracting = tk.Label(self.root, text="")
         self.progress_label_extracting.pack()
@@ -79,11 +89,19 @@ class App:
     def select_zip_files(self):
         files = filedialog.askopenfilenames(title="Select ZIP files", filetypes=[("ZIP files", "*.zip")])
         if files:
-            self.zip_files = list(files)
+            # Parts of the same download are listed together, in part order
+            export_sets = group_parts(files)
+            self.zip_files = [file for export_set in export_sets for file in export_set.zip_files]
             self.zip_files_list.delete(0, tk.END)
             for file in self.zip_files:
                 self.zip_files_list.insert(tk.END, file)
 
+            missing = [f"{export_set}: part {', '.join(f'{part:03d}' for part in export_set.missing_parts())}"
+                       for export_set in export_sets if export_set.missing_parts()]
+            if missing:
+                messagebox.showwarning("Missing parts", "These downloads seem to be missing parts:\n" +
+                                       "\n".join(missing))
+
     def select_output_folder(self):
         folder = filedialog.askdirectory(title="Select Output Directory")
         if folder:
@@ -98,417 +116,54 @@ class App:
             messagebox.showerror("Error", "Please select an output folder.")
             return
 
+        try:
+            self.max_workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("Error", "Please enter a valid number of workers.")
+            return
+
         # Disable start button
         self.start_button.config(state=tk.DISABLED)
+        self.pause_button.config(state=tk.NORMAL, text="Pause")
+        self.cancel_button.config(state=tk.NORMAL)
+
+        self.extractor = Extractor(self.zip_files, self.output_folder, max_workers=self.max_workers,
+                                   queue=self.queue, progress_by_bytes=self.progress_by_bytes_var.get())
 
-        # Start processing in separate thread
-        threading.Thread(target=self.process_zips, daemon=True).start()
-
-    def process_zips(self):
-        # 1: Extract folder structure
-        self.queue.put(('update_progress_label_extracting', "Extracting files..."))
-        self.extract_files()
-
-        # 2: Process errors (if any)
-        error_log_file = os.path.join(self.output_folder, 'error_log.csv')
-        if os.path.exists(error_log_file):
-            self.queue.put(('update_progress_label_errors', "Processing errors..."))
-            self.process_errors(error_log_file)
-
-        # Write processing summary to text file
-        self.write_processing_summary()
-
-        # Enable start button
-        self.queue.put(('enable_start_button', None))
-
-    def extract_files(self):
-        errors = []
-        processed_entries = 0
-
-        # Calculate total number of files for progress tracking
-        total_files = 0
-        for zip_file in self.zip_files:
-            with zipfile.ZipFile(zip_file, 'r') as zf:
-                total_files += len([f for f in zf.namelist() if not f.endswith('/')])
-
-        self.total_files = total_files
-
-        # Log status for each file
-        csv_status_file = os.path.join(self.output_folder, 'file_status.csv')
-        fieldnames = ['Original File Path', 'Original File Name', 'Sanitized File Name', 'Original Destination Path',
-                      'Sanitized Destination Path', 'Moved', 'Reason']
-
-        with open(csv_status_file, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-
-            for zip_file in self.zip_files:
-                try:
-                    with zipfile.ZipFile(zip_file, 'r') as zf:
-                        all_files = zf.namelist()
-
-                        # Filter out folders
-                        all_files = [f for f in all_files if not f.endswith('/')]
-
-                        for file in all_files:
-                            processed_entries += 1
-                            # Update progress
-                            progress = processed_entries / total_files * 100
-                            self.queue.put(('update_progress', progress))
-                            self.queue.put(('update_progress_label_extracting',
-                                            f"Extracting files: {processed_entries} of {total_files}"))
-
-                            # Initialize file status dictionary
-                            file_status = {
-                                'Original File Path': file,
-                                'Original File Name': os.path.basename(file),
-                                'Sanitized File Name': '',
-                                'Original Destination Path': '',
-                                'Sanitized Destination Path': '',
-                                'Moved': 'False',
-                                'Reason': ''
-                            }
-
-                            # Remove any leading drive letters and slashes, replace backslashes
-                            file_norm = re.sub(r'^[a-zA-Z]:', '', file)
-                            file_norm = file_norm.lstrip('/\\')
-                            file_norm = file_norm.replace('\\', '/')
-
-                            # Sanitize the path (including trailing spaces)
-                            sanitized_file_mapped = self.sanitize_path(file_norm)
-
-                            # Update file status
-                            file_status['Sanitized File Name'] = os.path.basename(sanitized_file_mapped)
-                            file_status['Original Destination Path'] = os.path.join(self.output_folder, file_norm)
-                            file_status['Sanitized Destination Path'] = os.path.join(self.output_folder,
-                                                                                   sanitized_file_mapped)
-
-                            self.sanitized_paths_set.add(file_status['Sanitized Destination Path'])
-
-                            # Set destination path
-                            dest_path = os.path.normpath(file_status['Sanitized Destination Path'])
-                            dest_dir = os.path.dirname(dest_path)
-
-                            # Make sure dest_dir exists
-                            if not os.path.exists(dest_dir):
-                                os.makedirs(dest_dir, exist_ok=True)
-
-                            # Avoid filename collisions with hashes
-                            original_dest_path = dest_path
-                            collision_count = 0
-                            while dest_path in self.sanitized_paths_set or os.path.exists(dest_path):
-                                collision_count += 1
-                                filename, ext = os.path.splitext(os.path.basename(dest_path))
-                                hash_input = f"{filename}_{collision_count}"
-                                short_hash = hashlib.md5(hash_input.encode()).hexdigest()[:8]
-
-                                # Adjust filename length to based on hash and extension
-                                max_filename_length = MAX_FOLDER_NAME_LENGTH - len(ext) - len(short_hash) - 1
-                                if max_filename_length < 1:
-                                    max_filename_length = 1
-                                filename = filename[:max_filename_length]
-
-                                # Create new filename
-                                filename = f"{filename}_{short_hash}"
-                                dest_path = os.path.join(dest_dir, filename + ext)
-
-                            # Update sanitized path and file status if changed
-                            if dest_path != original_dest_path:
-                                file_status['Sanitized Destination Path'] = dest_path
-                                file_status['Sanitized File Name'] = os.path.basename(dest_path)
-
-                            self.sanitized_paths_set.add(dest_path)
-
-                            # Make sure path length is within the limit
-                            if len(dest_path) > MAX_PATH_LENGTH:
-                                # Shorten the path if needed
-                                try:
-                                    dest_path = self.shorten_path(dest_path, sanitized_file_mapped)
-                                except Exception as e:
-                                    errors.append(
-                                        {'zip_file': zip_file, 'file': file, 'error_message': str(e)})
-                                    self.files_errors += 1
-                                    file_status['Moved'] = 'False'
-                                    file_status['Reason'] = str(e)
-                                    writer.writerow(file_status)
-                                    self.update_file_progress()
-                                    continue
-
-                            # Extract the file
-                            try:
-                                with zf.open(file) as source, open(dest_path, 'wb') as target:
-                                    shutil.copyfileobj(source, target)
-                                self.files_processed += 1
-                                file_status['Moved'] = 'True'
-                            except Exception as e:
-                                errors.append({'zip_file': zip_file, 'file': file, 'error_message': str(e)})
-                                self.files_errors += 1
-                                file_status['Moved'] = 'False'
-                                file_status['Reason'] = str(e)
-                                writer.writerow(file_status)
-                                self.update_file_progress()
-                                continue
-
-                            # Write the file status to CSV
-                            writer.writerow(file_status)
-
-                            # Update progress
-                            self.update_file_progress()
-
-                except Exception as e:
-                    errors.append({'zip_file': zip_file, 'file': '', 'error_message': f"Error processing ZIP file: {str(e)}"})
-                    self.files_errors += 1
-                    self.update_file_progress()
-                    continue
-
-        # Write errors to CSV
-        if errors:
-            error_log_file = os.path.join(self.output_folder, 'error_log.csv')
-            with open(error_log_file, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=['zip_file', 'file', 'error_message'])
-                writer.writeheader()
-                for error in errors:
-                    writer.writerow(error)
-
-    def sanitize_path(self, file_path):
-        # Replace backslashes with slashes
-        file_path = file_path.replace('\\', '/')
-
-        # Split into parts
-        parts = file_path.split('/')
-
-        sanitized_parts = []
-        for i, part in enumerate(parts):
-            # Remove leading and trailing spaces
-            part = part.strip()
-
-            # Remove invalid characters
-            invalid_chars = r'<>:"/\\|?*'
-            part = re.sub(f'[{re.escape(invalid_chars)}]', '_', part)
-
-            if i == len(parts) - 1:
-                # Preserve the extension
-                filename, ext = os.path.splitext(part)
-
-                # Ensure total filename length does not exceed MAX_FOLDER_NAME_LENGTH
-                max_filename_length = MAX_FOLDER_NAME_LENGTH - len(ext)
-                if max_filename_length < 1:
-                    filename = hashlib.md5(filename.encode()).hexdigest()[:8]
-                else:
-                    filename = filename[:max_filename_length]
-
-                part = filename + ext
-            else:
-                # Truncate directory names
-                part = part[:MAX_FOLDER_NAME_LENGTH]
-
-            sanitized_parts.append(part)
-
-        # Reconstruct the path
-        sanitized_path = os.path.join(*sanitized_parts)
-
-        # Ensure total path length does not exceed MAX_PATH_LENGTH
-        full_path = os.path.abspath(os.path.join(self.output_folder, sanitized_path))
-        if len(full_path) > MAX_PATH_LENGTH:
-            # Shorten the path
-            try:
-                full_path = self.shorten_path(full_path, sanitized_parts)
-            except Exception as e:
-                raise Exception(f"Cannot shorten path: {sanitized_path}. Error: {e}")
-
-        return os.path.relpath(full_path, self.output_folder)
-
-    def shorten_path(self, full_path, sanitized_parts):
-        # Ensure total path length does not exceed MAX_PATH_LENGTH
-        max_total_length = MAX_PATH_LENGTH
-        output_folder_length = len(os.path.abspath(self.output_folder))
-        max_path_length = max_total_length - output_folder_length - 1  # Subtract 1 for the separator
-
-        # If the full path is already within the limit, just return it
-        if len(full_path) <= max_total_length:
-            return full_path
-
-        # Start shortening file names from the deepest directory going up
-        for i in range(len(sanitized_parts)-1, -1, -1):
-            part = sanitized_parts[i]
-            if i == len(sanitized_parts) - 1:
-                # Preserve the extension
-                filename, ext = os.path.splitext(part)
-                if len(filename) > 8:
-                    filename = filename[:8]
-                else:
-                    filename = filename[:max(1, len(filename) - 1)]
-                sanitized_parts[i] = filename + ext
-            else:
-                # Shorten directory names
-                if len(sanitized_parts[i]) > 8:
-                    sanitized_parts[i] = sanitized_parts[i][:8]
-                else:
-                    sanitized_parts[i] = sanitized_parts[i][:max(1, len(sanitized_parts[i]) - 1)]
-
-            # Reconstruct the path and check its length
-            new_full_path = os.path.abspath(os.path.join(self.output_folder, *sanitized_parts))
-            if len(new_full_path) <= max_total_length:
-                return new_full_path
-
-        # If we reach here, we couldn't shorten the path sufficiently
-        # As a last resort, we can hash parts of the path
-        for i in range(len(sanitized_parts)):
-            hashed_part = hashlib.md5(sanitized_parts[i].encode()).hexdigest()[:6]
-            sanitized_parts[i] = hashed_part
-            new_full_path = os.path.abspath(os.path.join(self.output_folder, *sanitized_parts))
-            if len(new_full_path) <= max_total_length:
-                return new_full_path
-
-        # If still too long, raise an exception
-        raise Exception("Cannot shorten path to acceptable length.")
-
-    def update_file_progress(self):
-        # Put progress updates into the queue
-        self.queue.put(('update_file_progress', {
-            'total_files': self.total_files,
-            'files_processed': self.files_processed,
-            'files_errors': self.files_errors
-        }))
-
-    def process_errors(self, error_log_file):
-        # Read the error_log.csv
-        with open(error_log_file, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            errors = list(reader)
-
-        # Prepare to log fixed and final errors
-        fixed_errors = []
-        final_errors = []
-
-        total_errors = len(errors)
-        self.total_errors = total_errors
-        errors_fixed = 0
-        errors_failed = 0
-
-        # Open the CSV file to append file statuses
-        csv_status_file = os.path.join(self.output_folder, 'file_status.csv')
-        with open(csv_status_file, 'a', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Original File Path', 'Original File Name', 'Sanitized File Name', 'Original Destination Path',
-                          'Sanitized Destination Path', 'Moved', 'Reason']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            for idx, error in enumerate(errors, 1):
-                zip_file = error['zip_file']
-                file = error['file']
-                error_message = error['error_message']
-
-                # Skip errors that are not related to files (e.g., zip file errors)
-                if not file:
-                    final_errors.append(error)
-                    errors_failed += 1
-                    continue
-
-                # Initialize dictionary
-                file_status = {
-                    'Original File Path': file,
-                    'Original File Name': os.path.basename(file),
-                    'Sanitized File Name': '',
-                    'Original Destination Path': '',
-                    'Sanitized Destination Path': '',
-                    'Moved': 'False',
-                    'Reason': ''
-                }
-
-                try:
-                    # Sanitize the path
-                    sanitized_file_mapped = self.sanitize_path(file)
-
-                    # Update file status
-                    file_status['Sanitized File Name'] = os.path.basename(sanitized_file_mapped)
-                    file_status['Original Destination Path'] = os.path.join(self.output_folder, file)
-                    file_status['Sanitized Destination Path'] = os.path.join(self.output_folder, sanitized_file_mapped)
-
-                    # Attempt to extract the file from zip_file
-                    dest_path = file_status['Sanitized Destination Path']
-                    dest_dir = os.path.dirname(dest_path)
-
-                    # Ensure dest_dir exists
-                    if not os.path.exists(dest_dir):
-                        os.makedirs(dest_dir, exist_ok=True)
-
-                    with zipfile.ZipFile(zip_file, 'r') as zf:
-                        with zf.open(file) as source, open(dest_path, 'wb') as target:
-                            shutil.copyfileobj(source, target)
-
-                    errors_fixed += 1
-                    file_status['Moved'] = 'True'
-
-                    # Log fixed error
-                    fixed_errors.append({
-                        'zip_file': zip_file,
-                        'original_file': file,
-                        'sanitized_file': sanitized_file_mapped,
-                        'status': 'Fixed'
-                    })
-
-                    # Write the file status to CSV
-                    writer.writerow(file_status)
-
-                except Exception as e:
-                    errors_failed += 1
-                    # Log final error
-                    final_errors.append({
-                        'zip_file': zip_file,
-                        'file': file,
-                        'error_message': str(e)
-                    })
-
-                    # Update file status
-                    file_status['Moved'] = 'False'
-                    file_status['Reason'] = str(e)
-
-                    # Write file status to CSV
-                    writer.writerow(file_status)
-                    continue
-
-                # Update progress
-                self.queue.put(('update_progress_label_errors', f"Processing errors: {idx}/{total_errors}, "
-                                                               f"Fixed: {errors_fixed}, Failed: {errors_failed}"))
-
-        # Update class variables
-        self.errors_fixed = errors_fixed
-        self.errors_failed = errors_failed
-
-        # Write fixed_errors.csv
-        if fixed_errors:
-            fixed_errors_file = os.path.join(self.output_folder, 'fixed_errors.csv')
-            with open(fixed_errors_file, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=['zip_file', 'original_file', 'sanitized_file', 'status'])
-                writer.writeheader()
-                for item in fixed_errors:
-                    writer.writerow(item)
-
-        # Write final_errors.csv
-        if final_errors:
-            final_errors_file = os.path.join(self.output_folder, 'final_errors.csv')
-            with open(final_errors_file, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=['zip_file', 'file', 'error_message'])
-                writer.writeheader()
-                for item in final_errors:
-                    writer.writerow(item)
-
-        # Update final progress
-        self.queue.put(('update_progress_label_errors',
-                        f"Error processing complete. Total errors: {total_errors}, "
-                        f"Fixed: {errors_fixed}, Failed: {errors_failed}"))
-
-    def write_processing_summary(self):
-        summary_file = os.path.join(self.output_folder, 'processing_summary.txt')
-        with open(summary_file, 'w', encoding='utf-8') as file:
-            file.write(f"Total files processed: {self.total_files}\n")
-            file.write(f"Files successfully extracted: {self.files_processed}\n")
-            file.write(f"Files with errors: {self.files_errors}\n")
-            if self.total_errors > 0:
-                file.write(f"\nError Processing Summary:\n")
-                file.write(f"Total errors: {self.total_errors}\n")
-                file.write(f"Errors fixed: {self.errors_fixed}\n")
-                file.write(f"Errors failed: {self.errors_failed}\n")
+        # Start processing on the scheduler's thread
+        self.job = self.scheduler.submit(self.extractor)
+
+    def toggle_pause(self):
+        if self.job is None:
+            return
+        if self.job.control.paused:
+            self.job.resume()
+            self.pause_button.config(text="Pause")
+        else:
+            self.job.pause()
+            self.pause_button.config(text="Resume")
+
+    def cancel_processing(self):
+        if self.job is None:
+            return
+        # Files being written are dropped, everything finished stays logged and is skipped next time
+        self.job.cancel()
+        self.pause_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_label_errors.config(text="Cancelling...")
+
+    def close(self):
+        # Cancel a running extraction and let it close its logs before the window goes away
+        self.scheduler.shutdown(cancel=True, wait=False)
+        if self.job is not None:
+            self.progress_label_errors.config(text="Cancelling...")
+        self.wait_and_close()
+
+    def wait_and_close(self):
+        if self.scheduler.thread.is_alive():
+            self.root.after(100, self.wait_and_close)
+        else:
+            self.root.destroy()
 
     def process_queue(self):
         try:
@@ -521,8 +176,13 @@ class App:
                 elif msg[0] == 'update_progress':
                     self.progress_bar["value"] = msg[1]
                     self.progress_bar.update_idletasks()
-                elif msg[0] == 'enable_start_button':
+                elif msg[0] == 'job_finished':
+                    self.job = None
                     self.start_button.config(state=tk.NORMAL)
+                    self.pause_button.config(state=tk.DISABLED, text="Pause")
+                    self.cancel_button.config(state=tk.DISABLED)
+                    if msg[1].state == Job.FAILED:
+                        messagebox.showerror("Error", f"Extraction failed: {msg[1].error}")
                 elif msg[0] == 'update_file_progress':
                     data = msg[1]
                     self.progress_label_extracting.config(text=f"Extracting files: Total files: {data['total_files']}, "
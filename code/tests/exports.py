@@ -0,0 +1,84 @@
+import csv
+import os
+import random
+import zipfile
+
+from drive_extractor import Extractor
+from drive_extractor.statuslog import ORIGINAL_DEST, SANITIZED_DEST
+
+EXPORT_NAME = 'drive-download-20240101T000000Z'
+LARGE_SIZE = 300 * 1024  # Stored members this large are copied by the kernel
+
+
+def make_export(folder, parts=3, small_files=60, seed=0):
+    # A Drive export split into parts: nested folders of small compressible files, a large stored
+    # video, the same name in several parts, identical content under other names, a name over 255
+    # bytes and characters Windows does not allow. Returns the ZIP files.
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    members = []
+    for i in range(small_files):
+        folder_name = f'My Drive/Projects/Folder {i % 7}/Sub {i % 3}'
+        members.append((f'{folder_name}/notes {i}.txt', (f'notes {i} ' * rng.randint(1, 400)).encode()))
+    video = rng.getrandbits(8 * LARGE_SIZE).to_bytes(LARGE_SIZE, 'little')
+    members.append(('My Drive/Videos/holiday.mp4', video))
+    members.append(('My Drive/Videos/holiday copy.mp4', video))
+    members.append(('My Drive/Shared/report.pdf', b'first report\n' * 50))
+    members.append(('My Drive/Shared/report.pdf', b'second report\n' * 50))
+    members.append(('My Drive/Shared/report again.pdf', b'first report\n' * 50))
+    members.append(('My Drive/Odd/what? a <name>: "quoted" | piped*.txt', b'odd name\n'))
+    members.append(('My Drive/Odd/' + 'long name ' * 30 + '.txt', b'long name\n'))
+
+    zip_files = []
+    for part in range(parts):
+        zip_file = os.path.join(folder, f'{EXPORT_NAME}-{part + 1:03}.zip')
+        with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in members[part::parts]:
+                zf.writestr(zipfile.ZipInfo(name, (2024, 1, 2, 3, 4, 6)), data,
+                            zipfile.ZIP_STORED if name.endswith('.mp4') else zipfile.ZIP_DEFLATED)
+        zip_files.append(zip_file)
+    return zip_files
+
+
+def corrupt(zip_file, name):
+    # Flips a byte in the middle of a member's data, so its CRC-32 no longer matches
+    with zipfile.ZipFile(zip_file) as zf:
+        info = zf.getinfo(name)
+    with open(zip_file, 'r+b') as file:
+        file.seek(info.header_offset + 30 + len(info.orig_filename.encode()) + info.compress_size // 2)
+        byte = file.read(1)[0]
+        file.seek(-1, os.SEEK_CUR)
+        file.write(bytes([byte ^ 0xff]))
+
+
+def extract(zip_files, output_folder, **options):
+    # One run into output_folder, created like the command line does
+    os.makedirs(output_folder, exist_ok=True)
+    extractor = Extractor(zip_files, str(output_folder), max_workers=4, **options)
+    extractor.process_zips()
+    return extractor
+
+
+def tree(output_folder):
+    # Relative path -> content of every extracted file, leaving out the logs next to them
+    output_folder = str(output_folder)
+    files = {}
+    for root, _, names in os.walk(output_folder):
+        if root == output_folder:
+            continue
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as file:
+                files[os.path.relpath(path, output_folder).replace(os.sep, '/')] = file.read()
+    return files
+
+
+def status(output_folder):
+    # The rows of file_status.csv in a stable order, destinations relative to the output folder
+    output_folder = str(output_folder)
+    with open(os.path.join(output_folder, 'file_status.csv'), newline='', encoding='utf-8') as file:
+        rows = list(csv.reader(file))[1:]
+    for row in rows:
+        for column in (ORIGINAL_DEST, SANITIZED_DEST):
+            row[column] = os.path.relpath(row[column], output_folder)
+    return sorted(rows)
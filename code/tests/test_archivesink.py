@@ -0,0 +1,38 @@
+import tarfile
+
+import pytest
+
+from drive_extractor.sinks import ArchiveSink
+
+from .exports import extract, make_export
+
+
+def archive(zip_files, tmp_path, name):
+    output_folder = tmp_path / name
+    extract(zip_files, output_folder, dedup='hardlink', sink=ArchiveSink(str(tmp_path / f'{name}.tar')))
+    with tarfile.open(tmp_path / f'{name}.tar') as tar:
+        return {member.name: member for member in tar.getmembers()}
+
+
+@pytest.fixture
+def zip_files(tmp_path):
+    return make_export(tmp_path / 'zips')
+
+
+def test_links_have_the_time_of_their_file(zip_files, tmp_path):
+    members = archive(zip_files, tmp_path, 'export')
+
+    links = [member for member in members.values() if member.islnk()]
+    assert links
+    for link in links:
+        assert link.mtime == members[link.linkname].mtime
+
+
+def test_same_input_same_entries(zip_files, tmp_path, monkeypatch):
+    first = archive(zip_files, tmp_path, 'first')
+    monkeypatch.setattr('time.time', lambda: 4102444800.0)  # Later runs happen at other times
+
+    second = archive(zip_files, tmp_path, 'second')
+
+    assert {name: member.get_info() for name, member in first.items()} == \
+        {name: member.get_info() for name, member in second.items()}
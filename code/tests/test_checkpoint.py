@@ -0,0 +1,53 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from drive_extractor.checkpoint import CHECKPOINT_FILE_NAME
+
+from .exports import extract, make_export, tree
+
+
+def test_resume_after_moving_the_archives(tmp_path):
+    zip_files = make_export(tmp_path / 'downloads')
+    output_folder = tmp_path / 'out'
+    first = extract(zip_files, output_folder)
+    extracted = tree(output_folder)
+
+    shutil.move(str(tmp_path / 'downloads'), str(tmp_path / 'moved'))
+    second = extract([str(tmp_path / 'moved' / os.path.basename(zip_file)) for zip_file in zip_files], output_folder)
+
+    assert second.files_skipped == first.files_processed == first.total_files
+    assert second.files_processed == 0
+    assert tree(output_folder) == extracted
+
+
+def test_other_export_with_the_same_names(tmp_path):
+    # Drive names the parts of every export after the time of the download, two exports can share them
+    first_export = make_export(tmp_path / 'first', small_files=60, seed=1)
+    second_export = make_export(tmp_path / 'second', small_files=90, seed=2)
+    output_folder = tmp_path / 'out'
+    extract(first_export, output_folder)
+
+    second = extract(second_export, output_folder)
+
+    assert second.files_skipped == 0
+    assert second.files_processed == second.total_files
+
+
+@pytest.mark.parametrize('older_key', [os.path.basename, os.path.abspath], ids=['name', 'path'])
+def test_older_checkpoints_are_taken_over(tmp_path, older_key):
+    zip_files = make_export(tmp_path / 'downloads')
+    output_folder = tmp_path / 'out'
+    first = extract(zip_files, output_folder)
+    with sqlite3.connect(str(output_folder / CHECKPOINT_FILE_NAME)) as conn:
+        for zip_file in zip_files:
+            conn.execute('UPDATE members SET zip_file = ? WHERE zip_file LIKE ?',
+                         (older_key(zip_file), os.path.basename(zip_file) + '/%'))
+    conn.close()
+
+    second = extract(zip_files, output_folder)
+
+    assert second.files_skipped == first.total_files
+    assert second.files_processed == 0
@@ -0,0 +1,53 @@
+import csv
+import io
+import os
+import sqlite3
+
+import pytest
+
+from drive_extractor.checkpoint import CHECKPOINT_FILE_NAME
+from drive_extractor.cli import main
+
+from .exports import extract, make_export
+
+
+def snapshot(folder):
+    # Every file under folder with its size and modification time
+    return {os.path.join(root, name): (os.stat(os.path.join(root, name)).st_size,
+                                       os.stat(os.path.join(root, name)).st_mtime_ns)
+            for root, _, names in os.walk(folder) for name in names}
+
+
+def plan(capsys, zip_files, output_folder):
+    assert main([*zip_files, '-o', str(output_folder), '--plan']) == 0
+    return list(csv.DictReader(io.StringIO(capsys.readouterr().out)))
+
+
+@pytest.mark.parametrize('older_checkpoint', [False, True], ids=['checkpoint', 'older-checkpoint'])
+def test_plan_writes_nothing(tmp_path, capsys, older_checkpoint):
+    zip_files = make_export(tmp_path / 'zips')
+    output_folder = tmp_path / 'out'
+    extractor = extract(zip_files, output_folder)
+    if older_checkpoint:
+        # Keyed by ZIP file name, and without the SHA-256 column
+        conn = sqlite3.connect(str(output_folder / CHECKPOINT_FILE_NAME))
+        with conn:
+            conn.execute("UPDATE members SET zip_file = substr(zip_file, 1, instr(zip_file, '/') - 1)")
+            conn.execute('ALTER TABLE members DROP COLUMN sha256')
+        conn.close()
+    before = snapshot(output_folder)
+
+    rows = plan(capsys, zip_files, output_folder)
+
+    assert len(rows) == extractor.total_files
+    assert {row['action'] for row in rows} == {'already extracted'}
+    assert snapshot(output_folder) == before
+
+
+def test_plan_into_a_new_folder(tmp_path, capsys):
+    zip_files = make_export(tmp_path / 'zips')
+
+    rows = plan(capsys, zip_files, tmp_path / 'out')
+
+    assert {row['action'] for row in rows} == {'extract'}
+    assert not os.path.exists(tmp_path / 'out')
@@ -0,0 +1,51 @@
+import os
+import zipfile
+
+import pytest
+
+from drive_extractor.statuslog import REASON
+
+from .exports import EXPORT_NAME, extract, make_export, status, tree
+
+
+@pytest.fixture
+def zip_files(tmp_path):
+    return make_export(tmp_path / 'zips')
+
+
+@pytest.mark.parametrize('mode', ['hardlink', 'reflink'])
+def test_dedup_writes_the_same_tree(zip_files, tmp_path, mode):
+    extract(zip_files, tmp_path / 'default')
+
+    extractor = extract(zip_files, tmp_path / mode, dedup=mode)
+
+    assert tree(tmp_path / mode) == tree(tmp_path / 'default')
+    # holiday copy.mp4 and report again.pdf repeat content written under another name
+    assert extractor.duplicates_linked == 2
+    linked = [row for row in status(tmp_path / mode) if row[REASON].startswith('Duplicate of ')]
+    assert len(linked) == 2
+    # Apart from the reason given for the links, the status is the same
+    assert [row[:REASON] for row in status(tmp_path / mode)] == [row[:REASON] for row in status(tmp_path / 'default')]
+
+
+def test_hardlinks_share_the_first_copy(zip_files, tmp_path):
+    extract(zip_files, tmp_path / 'out', dedup='hardlink')
+
+    videos = tmp_path / 'out' / 'My Drive' / 'Videos'
+    assert os.path.samefile(videos / 'holiday.mp4', videos / 'holiday copy.mp4')
+
+
+def test_repeated_file_is_skipped(tmp_path):
+    # Drive puts the same file into several parts of one download
+    zip_files = []
+    for part in (1, 2):
+        zip_file = str(tmp_path / f'{EXPORT_NAME}-{part:03}.zip')
+        with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('My Drive/same.txt', b'in both parts\n' * 100)
+            zf.writestr(f'My Drive/part {part}.txt', b'only here\n')
+        zip_files.append(zip_file)
+
+    extractor = extract(zip_files, tmp_path / 'out', dedup='hardlink')
+
+    assert extractor.duplicates_skipped == 1
+    assert sorted(tree(tmp_path / 'out')) == ['My Drive/part 1.txt', 'My Drive/part 2.txt', 'My Drive/same.txt']
@@ -0,0 +1,42 @@
+import os
+import zipfile
+
+import pytest
+
+from drive_extractor.fastcopy import ZERO_COPY_MIN_SIZE, ZERO_COPY_SUPPORTED, can_copy_raw, copy_raw, open_temp
+
+pytestmark = pytest.mark.skipif(not ZERO_COPY_SUPPORTED, reason="no kernel copy on this platform")
+
+CONTENT = os.urandom(ZERO_COPY_MIN_SIZE * 3)
+
+
+def stored_member(tmp_path, corrupt):
+    zip_file = tmp_path / 'export.zip'
+    with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('My Drive/video.mp4', CONTENT)
+    if corrupt:
+        data = bytearray(zip_file.read_bytes())
+        data[data.index(CONTENT) + len(CONTENT) // 2] ^= 0xff
+        zip_file.write_bytes(bytes(data))
+    zf = zipfile.ZipFile(zip_file)
+    info = zf.getinfo('My Drive/video.mp4')
+    assert can_copy_raw(info)
+    return zf, info
+
+
+def copy(tmp_path, corrupt):
+    zf, info = stored_member(tmp_path, corrupt)
+    target, temp_path = open_temp(str(tmp_path / 'video.mp4'))
+    with zf, target:
+        assert copy_raw(zf.fp.fileno(), info, target.fileno())
+    with open(temp_path, 'rb') as f:
+        return f.read()
+
+
+def test_copy_raw_copies_the_member(tmp_path):
+    assert copy(tmp_path, corrupt=False) == CONTENT
+
+
+def test_copy_raw_checks_the_crc(tmp_path):
+    with pytest.raises(zipfile.BadZipFile, match='Bad CRC-32'):
+        copy(tmp_path, corrupt=True)
@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+from drive_extractor.filters import MemberFilter
+from drive_extractor.zipindex import pack_date_time
+
+from .exports import extract, make_export, tree
+
+DATE = pack_date_time((2023, 6, 1, 12, 0, 0))
+
+
+def matches(name, size=1000, date_time=DATE, **options):
+    return MemberFilter(**options).matches(name, size, date_time)
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('My Drive/Photos/2023/img.JPG', True),
+    ('/My Drive/photos/img.jpg', True),    # Leading slashes and case do not matter
+    ('My Drive/Photos/notes.txt', False),
+    ('Shared/My Drive/Photos/img.jpg', False),  # Globs match the whole path
+])
+def test_include_glob(name, expected):
+    assert matches(name, include=['My Drive/Photos/*.jpg']) == expected
+
+
+def test_exclude_wins_over_include():
+    options = {'include': ['My Drive/*'], 'exclude': ['*.tmp']}
+    assert matches('My Drive/a/b.txt', **options)
+    assert not matches('My Drive/a/b.TMP', **options)
+
+
+def test_regexes_match_anywhere_and_keep_case():
+    assert matches('My Drive/Reports/2023 Q1.pdf', include_regex=[r'20\d\d Q[1-4]'])
+    assert not matches('My Drive/Reports/2023 q1.pdf', include_regex=[r'20\d\d Q[1-4]'])
+    assert not matches('My Drive/.git/config', exclude_regex=[r'(^|/)\.git/'])
+
+
+def test_size_bounds_are_inclusive():
+    assert matches('a', size=500, min_size=500, max_size=2000)
+    assert matches('a', size=2000, min_size=500, max_size=2000)
+    assert not matches('a', size=499, min_size=500)
+    assert not matches('a', size=2001, max_size=2000)
+
+
+def test_dates_after_inclusive_before_exclusive():
+    june = datetime.datetime(2023, 6, 1, 12, 0, 0)
+    assert matches('a', modified_after=june)
+    assert not matches('a', modified_before=june)
+    assert matches('a', modified_before=june + datetime.timedelta(seconds=2))
+    assert not matches('a', modified_after=june + datetime.timedelta(seconds=2))
+
+
+def test_filtered_extraction(tmp_path):
+    zip_files = make_export(tmp_path / 'zips')
+    member_filter = MemberFilter(include=['My Drive/Projects/*'], exclude=['*/Sub 1/*'], min_size=100)
+
+    extractor = extract(zip_files, tmp_path / 'out', member_filter=member_filter)
+
+    reference = tree(extract(zip_files, tmp_path / 'reference').output_folder)
+    expected = {path: data for path, data in reference.items()
+                if path.startswith('My Drive/Projects/') and '/Sub 1/' not in path and len(data) >= 100}
+    assert expected
+    assert tree(tmp_path / 'out') == expected
+    assert extractor.total_files == len(expected)
@@ -0,0 +1,77 @@
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from drive_extractor.fastcopy import TEMP_NAME_PATTERN
+from drive_extractor.jobs import JobControl
+from drive_extractor.sinks import LocalSink
+
+from .exports import extract, make_export, tree
+
+# Runs an extraction that kills itself without any cleanup once some files are written
+KILLED_RUN = '''
+import os, signal, sys
+from drive_extractor import Extractor
+from drive_extractor.sinks import LocalSink
+
+commit = LocalSink.commit
+def commit_then_die(sink, target, done=[]):
+    done.append(target)
+    if len(done) == 20:
+        os.kill(os.getpid(), signal.SIGKILL)
+    commit(sink, target)
+LocalSink.commit = commit_then_die
+Extractor(sys.argv[2:], sys.argv[1], max_workers=4).process_zips()
+'''
+
+
+def temp_files(output_folder):
+    return [name for _, _, names in os.walk(output_folder) for name in names if TEMP_NAME_PATTERN.fullmatch(name)]
+
+
+@pytest.fixture
+def export(tmp_path):
+    zip_files = make_export(tmp_path / 'zips')
+    return zip_files, tree(extract(zip_files, tmp_path / 'reference').output_folder)
+
+
+def test_cancel_and_resume(tmp_path, export, monkeypatch):
+    zip_files, reference = export
+    control = JobControl()
+    commit = LocalSink.commit
+    done = []
+
+    def commit_then_cancel(sink, target):
+        done.append(target)
+        if len(done) == 20:
+            control.cancel()
+        commit(sink, target)
+    monkeypatch.setattr(LocalSink, 'commit', commit_then_cancel)
+    cancelled = extract(zip_files, tmp_path / 'out', control=control)
+    monkeypatch.undo()
+
+    assert cancelled.cancelled
+    assert cancelled.files_processed < cancelled.total_files
+    assert temp_files(tmp_path / 'out') == []
+
+    resumed = extract(zip_files, tmp_path / 'out')
+    assert not resumed.cancelled
+    assert tree(tmp_path / 'out') == reference
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason="needs SIGKILL")
+def test_resume_after_kill(tmp_path, export):
+    zip_files, reference = export
+    output_folder = tmp_path / 'out'
+    output_folder.mkdir()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    killed = subprocess.run([sys.executable, '-c', KILLED_RUN, str(output_folder)] + zip_files, env=env)
+    assert killed.returncode == -signal.SIGKILL
+
+    extract(zip_files, output_folder)
+
+    assert temp_files(output_folder) == []
+    assert tree(output_folder) == reference
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from drive_extractor.jobs import JobControl
+from drive_extractor.pathindex import PATH_INDEX_FILE_NAME
+from drive_extractor.sinks import LocalSink
+
+from .exports import corrupt, extract, make_export, status, tree
+
+
+@pytest.fixture
+def zip_files(tmp_path):
+    zip_files = make_export(tmp_path / 'zips')
+    corrupt(zip_files[0], 'My Drive/Projects/Folder 3/Sub 0/notes 3.txt')
+    return zip_files
+
+
+def test_low_memory_writes_the_same_tree(zip_files, tmp_path):
+    extract(zip_files, tmp_path / 'default')
+
+    extract(zip_files, tmp_path / 'low', low_memory=True)
+
+    assert tree(tmp_path / 'low') == tree(tmp_path / 'default')
+    assert status(tmp_path / 'low') == status(tmp_path / 'default')
+    # The names spilled to disk are scratch space of the run
+    assert not os.path.exists(tmp_path / 'low' / PATH_INDEX_FILE_NAME)
+
+
+def test_low_memory_resume(zip_files, tmp_path, monkeypatch):
+    # Resuming reads the destinations back from the checkpoint instead of loading it whole
+    extract(zip_files, tmp_path / 'default')
+    control = JobControl()
+    commit = LocalSink.commit
+    done = []
+
+    def commit_then_cancel(sink, target):
+        done.append(target)
+        if len(done) == 20:
+            control.cancel()
+        commit(sink, target)
+    monkeypatch.setattr(LocalSink, 'commit', commit_then_cancel)
+    cancelled = extract(zip_files, tmp_path / 'low', low_memory=True, control=control)
+    monkeypatch.undo()
+    assert cancelled.cancelled
+
+    extract(zip_files, tmp_path / 'low', low_memory=True)
+
+    assert tree(tmp_path / 'low') == tree(tmp_path / 'default')
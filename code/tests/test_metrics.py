@@ -0,0 +1,19 @@
+import pstats
+
+import pytest
+
+from .exports import extract, make_export
+
+
+# Functions that only run on worker threads, in each mode
+@pytest.mark.parametrize('options, worker_function', [({}, 'extract_member'), ({'pipeline': True}, 'inflate_loop')],
+                         ids=['workers', 'pipeline'])
+def test_profile_covers_the_workers(tmp_path, options, worker_function):
+    zip_files = make_export(tmp_path / 'zips')
+    profile_file = str(tmp_path / 'extraction.prof')
+
+    extractor = extract(zip_files, tmp_path / 'out', profile_file=profile_file, **options)
+
+    assert extractor.files_errors == 0
+    assert extractor.files_processed == extractor.total_files
+    assert worker_function in {function for _, _, function in pstats.Stats(profile_file).stats}
@@ -0,0 +1,40 @@
+import zipfile
+
+from drive_extractor.parts import group_parts
+
+from .exports import extract, make_export, status, tree
+
+
+def test_parts_are_grouped_and_ordered():
+    sets = group_parts(['/b/drive-download-20240101T000000Z-003.zip', '/a/notes.zip',
+                        '/b/drive-download-20240101T000000Z-001.zip', '/b/drive-download-20240101t000000z-002.ZIP',
+                        '/b/drive-download-20240101T000000Z-001.zip', '/c/photos-20231224T120000Z-001.zip'])
+
+    assert [export_set.zip_files for export_set in sets] == [
+        ['/b/drive-download-20240101T000000Z-001.zip', '/b/drive-download-20240101t000000z-002.ZIP',
+         '/b/drive-download-20240101T000000Z-003.zip'],
+        ['/a/notes.zip'],
+        ['/c/photos-20231224T120000Z-001.zip']]
+    assert [str(export_set) for export_set in sets] == [
+        'drive-download-20240101T000000Z (3 parts)', 'notes.zip', 'photos-20231224T120000Z (1 part)']
+
+
+def test_missing_parts():
+    sets = group_parts([f'export-20240101T000000Z-{part:03}.zip' for part in (1, 2, 5, 7)])
+
+    assert sets[0].missing_parts() == [3, 4, 6]
+    assert group_parts(['notes.zip'])[0].missing_parts() == []
+
+
+def test_selection_order_does_not_change_the_result(tmp_path):
+    # Parts share a name (report.pdf): which one keeps it follows the part numbers
+    zip_files = make_export(tmp_path / 'zips')
+
+    extract(zip_files, tmp_path / 'in order')
+    extract(list(reversed(zip_files)), tmp_path / 'reversed')
+
+    assert tree(tmp_path / 'in order') == tree(tmp_path / 'reversed')
+    assert status(tmp_path / 'in order') == status(tmp_path / 'reversed')
+    with zipfile.ZipFile(zip_files[0]) as first_part:
+        kept = first_part.read('My Drive/Shared/report.pdf')
+    assert tree(tmp_path / 'reversed')['My Drive/Shared/report.pdf'] == kept
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from drive_extractor import pathindex
+from drive_extractor.pathindex import PathIndex
+from drive_extractor.sanitize import PATH_LIMITS
+
+# Paths resolved by every test below: the same name several times, case variants, a file with a
+# folder's name and a renamed name that itself comes again
+NAMES = ['a/report.pdf', 'a/report.pdf', 'a/Report.PDF', 'a/report.pdf', 'a/b/notes.txt', 'a/b',
+         'a/B', 'a/b/notes.txt', 'c/file', 'c/file', 'c/FILE']
+
+
+def resolve_all(index, root, names):
+    return [os.path.relpath(index.resolve(os.path.join(root, name)), root).replace(os.sep, '/') for name in names]
+
+
+@pytest.fixture(params=['memory', 'spill'])
+def index(request, tmp_path, monkeypatch):
+    root = str(tmp_path / 'out')
+    spill_path = None
+    if request.param == 'spill':
+        # Small batches, so lookups go to the SQLite file as well as to the pending set
+        monkeypatch.setattr(pathindex, 'SPILL_BATCH_SIZE', 3)
+        spill_path = str(tmp_path / pathindex.PATH_INDEX_FILE_NAME)
+    index = PathIndex(root, PATH_LIMITS['windows'], spill_path=spill_path, create_dirs=False)
+    yield index, root
+    index.close()
+
+
+def test_collisions_get_distinct_names(index):
+    index, root = index
+    resolved = resolve_all(index, root, NAMES)
+
+    assert resolved[0] == 'a/report.pdf'
+    assert resolved[4] == 'a/b/notes.txt'
+    assert resolved[8] == 'c/file'
+    assert len({name.casefold() for name in resolved}) == len(NAMES)
+    # A file does not take the name of a folder, whatever its case
+    assert resolved[5] != 'a/b' and resolved[6].casefold() != 'a/b'
+    assert resolved[9].startswith('c/file_') and resolved[10].startswith('c/FILE_')
+
+
+def test_counter_continues_after_collisions(index):
+    index, root = index
+    counter_key = (os.path.join(root, 'x').casefold(), 'name.txt')
+    resolved = resolve_all(index, root, ['x/name.txt'] * 4)
+
+    assert index.counters[counter_key] == 3
+    # The next collision goes on from the last count instead of retrying suffixes from 1
+    resolved += resolve_all(index, root, ['x/name.txt'])
+    assert index.counters[counter_key] == 4
+    assert len(set(resolved)) == 5
+
+
+def test_taken_variant_is_skipped(index):
+    index, root = index
+    first = resolve_all(index, root, ['x/name.txt'] * 2)[1]
+    index.claim(os.path.join(root, 'y', os.path.basename(first)))
+
+    # The first variant is already taken in y, e.g. by an earlier run, so it is passed over
+    assert resolve_all(index, root, ['y/name.txt']) == ['y/name.txt']
+    second = resolve_all(index, root, ['y/name.txt'])[0]
+    assert second.startswith('y/name_') and second != first.replace('x/', 'y/')
+    assert index.counters[(os.path.join(root, 'y').casefold(), 'name.txt')] == 2
+
+
+def test_spill_gives_the_same_names(tmp_path, monkeypatch):
+    monkeypatch.setattr(pathindex, 'SPILL_BATCH_SIZE', 7)
+    root = str(tmp_path / 'out')
+    names = NAMES * 3 + [f'd/{i % 5}.txt' for i in range(40)]
+    memory = PathIndex(root, PATH_LIMITS['windows'], create_dirs=False)
+    spilled = PathIndex(root, PATH_LIMITS['windows'], spill_path=str(tmp_path / 'spill.sqlite'), create_dirs=False)
+    try:
+        assert resolve_all(spilled, root, names) == resolve_all(memory, root, names)
+        assert os.path.exists(tmp_path / 'spill.sqlite')
+    finally:
+        spilled.close()
+        memory.close()
+    assert not os.path.exists(tmp_path / 'spill.sqlite')
+
+
+def test_merge_reads_existing_names(tmp_path):
+    root = tmp_path / 'out'
+    (root / 'a').mkdir(parents=True)
+    (root / 'a' / 'Existing.txt').write_bytes(b'from an earlier run\n')
+    (root / 'a' / '.~0123abcd.part').write_bytes(b'left by a killed run\n')
+    index = PathIndex(str(root), PATH_LIMITS['windows'], merge=True, clean_temp=True)
+
+    assert resolve_all(index, str(root), ['a/existing.txt', 'a/new.txt'])[0].startswith('a/existing_')
+    assert resolve_all(index, str(root), ['a/other.txt']) == ['a/other.txt']
+    assert sorted(os.listdir(root / 'a')) == ['Existing.txt']
@@ -0,0 +1,43 @@
+import random
+import zipfile
+
+import pytest
+
+from drive_extractor.statuslog import REASON
+
+from .exports import corrupt, extract, make_export, status, tree
+
+CORRUPT_NAME = 'My Drive/Projects/Folder 3/Sub 0/notes 3.txt'
+LARGE_DEFLATED_SIZE = 5 * 1024 * 1024  # Several pipeline chunks, compressed and decompressed
+
+
+@pytest.fixture
+def zip_files(tmp_path):
+    zip_files = make_export(tmp_path / 'zips')
+    # A deflated member that takes several chunks through the inflate stage
+    rng = random.Random(1)
+    data = b''.join(b'%d,%d\n' % (row, rng.getrandbits(48)) for row in range(LARGE_DEFLATED_SIZE // 20))
+    with zipfile.ZipFile(zip_files[-1], 'a', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('My Drive/Sheets/large.csv', data)
+    return zip_files
+
+
+def test_pipeline_writes_the_same_tree(zip_files, tmp_path):
+    extract(zip_files, tmp_path / 'default')
+
+    extract(zip_files, tmp_path / 'pipeline', pipeline=True)
+
+    assert tree(tmp_path / 'pipeline') == tree(tmp_path / 'default')
+    assert status(tmp_path / 'pipeline') == status(tmp_path / 'default')
+
+
+def test_pipeline_reports_a_bad_crc_like_the_default(zip_files, tmp_path):
+    corrupt(zip_files[0], CORRUPT_NAME)
+    extract(zip_files, tmp_path / 'default')
+
+    extract(zip_files, tmp_path / 'pipeline', pipeline=True)
+
+    assert tree(tmp_path / 'pipeline') == tree(tmp_path / 'default')
+    assert status(tmp_path / 'pipeline') == status(tmp_path / 'default')
+    failed = [row for row in status(tmp_path / 'pipeline') if row[REASON].startswith('Bad CRC-32')]
+    assert failed and CORRUPT_NAME not in tree(tmp_path / 'pipeline')
@@ -0,0 +1,37 @@
+import hashlib
+
+import pytest
+
+from drive_extractor.checkpoint import Checkpoint
+
+from .exports import corrupt, extract, make_export, status, tree
+
+
+@pytest.fixture
+def zip_files(tmp_path):
+    zip_files = make_export(tmp_path / 'zips')
+    corrupt(zip_files[0], 'My Drive/Projects/Folder 3/Sub 0/notes 3.txt')
+    return zip_files
+
+
+def test_processes_write_the_same_tree(zip_files, tmp_path):
+    extract(zip_files, tmp_path / 'default')
+
+    extract(zip_files, tmp_path / 'processes', processes=True)
+
+    assert tree(tmp_path / 'processes') == tree(tmp_path / 'default')
+    assert status(tmp_path / 'processes') == status(tmp_path / 'default')
+
+
+def test_processes_record_sha256(zip_files, tmp_path):
+    # The worker processes hash what they write and hand the digests back to the checkpoint
+    extract(zip_files, tmp_path / 'processes', processes=True, sha256=True)
+
+    files = tree(tmp_path / 'processes')
+    checkpoint = Checkpoint(str(tmp_path / 'processes'), read_only=True)
+    recorded = [row for row in checkpoint.load().values() if row[4]]
+    checkpoint.close()
+    assert len(recorded) == len(files)
+    for _, _, _, dest, _, sha256 in recorded:
+        with open(dest, 'rb') as file:
+            assert sha256 == hashlib.sha256(file.read()).hexdigest()
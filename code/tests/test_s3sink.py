@@ -0,0 +1,94 @@
+import os
+import zipfile
+
+import pytest
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+from drive_extractor import Extractor, S3Sink  # noqa: E402
+from drive_extractor.sinks import S3_MIN_PART_SIZE  # noqa: E402
+
+BUCKET = 'export'
+LARGE_SIZE = 2 * S3_MIN_PART_SIZE + 1234  # Three parts of S3_MIN_PART_SIZE
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    # An in-memory S3 from moto, with made-up credentials
+    for name, value in {'AWS_ACCESS_KEY_ID': 'test', 'AWS_SECRET_ACCESS_KEY': 'test',
+                        'AWS_DEFAULT_REGION': 'us-east-1'}.items():
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def export(tmp_path):
+    zip_file = tmp_path / 'drive-download-20240101T000000Z-001.zip'
+    with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('My Drive/notes.txt', b'small file\n' * 100)
+        zf.writestr('My Drive/Videos/large.bin', os.urandom(LARGE_SIZE), compress_type=zipfile.ZIP_STORED)
+        zf.writestr('My Drive/Copy/notes again.txt', b'small file\n' * 100)
+    return str(zip_file)
+
+
+def extract(export, output_folder, **options):
+    # The output folder only holds the checkpoint and logs, the files go to the bucket
+    os.makedirs(output_folder, exist_ok=True)
+    sink = S3Sink(f's3://{BUCKET}/backup', part_size=S3_MIN_PART_SIZE)
+    extractor = Extractor([export], str(output_folder), max_workers=2, sink=sink, **options)
+    extractor.process_zips()
+    return extractor
+
+
+def objects(client):
+    return {item['Key']: item['Size'] for item in client.list_objects_v2(Bucket=BUCKET).get('Contents', ())}
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_upload_small_and_multipart(s3, export, tmp_path, monkeypatch, pipeline):
+    calls = []
+    original = S3Sink.commit
+    monkeypatch.setattr(S3Sink, 'commit', lambda sink, upload: calls.append(upload.upload_id) or original(sink, upload))
+
+    extractor = extract(export, tmp_path / 'out', pipeline=pipeline)
+
+    assert extractor.pipeline == pipeline
+    assert extractor.files_processed == 3
+    assert objects(s3) == {'backup/My Drive/notes.txt': 1100, 'backup/My Drive/Videos/large.bin': LARGE_SIZE,
+                           'backup/My Drive/Copy/notes again.txt': 1100}
+    # The small files went up with put_object(), the large one as a multipart upload
+    assert sum(upload_id is not None for upload_id in calls) == 1
+    with zipfile.ZipFile(export) as zf:
+        body = s3.get_object(Bucket=BUCKET, Key='backup/My Drive/Videos/large.bin')['Body'].read()
+        assert body == zf.read('My Drive/Videos/large.bin')
+    assert not s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads')
+
+
+def test_dedup_copies_inside_the_store(s3, export, tmp_path, monkeypatch):
+    copies = []
+    original = S3Sink.link
+    monkeypatch.setattr(S3Sink, 'link', lambda sink, source, dest, *args: copies.append(dest) or
+                        original(sink, source, dest, *args))
+
+    extractor = extract(export, tmp_path / 'out', dedup='hardlink')
+
+    assert extractor.duplicates_linked == 1
+    assert [os.path.basename(dest) for dest in copies] == ['notes again.txt']
+    body = s3.get_object(Bucket=BUCKET, Key='backup/My Drive/Copy/notes again.txt')['Body'].read()
+    assert body == b'small file\n' * 100
+
+
+def test_resume_skips_uploaded_objects(s3, export, tmp_path):
+    output_folder = tmp_path / 'out'
+    extract(export, output_folder)
+    s3.delete_object(Bucket=BUCKET, Key='backup/My Drive/notes.txt')
+
+    extractor = extract(export, output_folder)
+
+    assert extractor.files_skipped == 2
+    assert extractor.files_processed == 1
+    assert 'backup/My Drive/notes.txt' in objects(s3)
@@ -0,0 +1,55 @@
+import os
+import random
+
+import pytest
+
+from drive_extractor.sanitize import PATH_LIMITS, PathSanitizer
+
+WORDS = ['My Drive', 'Photos', 'Report', 'Meeting notes', 'Budget 2023', 'Copy of Thesis', 'Untitled', 'Lab data',
+         'Résumé', 'Ünïcödé', '日本語のファイル', 'Ελληνικά', 'emoji 📷', 'con', 'aux.txt', '.', '..', '.hidden']
+EXTENSIONS = ['.docx', '.xlsx', '.pdf', '.jpg', '.tar.gz', '', '.', '.a-very-long-extension-' + 'x' * 60]
+INVALID = '<>:"|?*\\'
+
+# Output folders of different lengths, so paths cross the length limits at different depths
+OUTPUT_FOLDERS = ['out', os.path.join('a' * 40, 'b' * 40), os.path.join('deep', *['level'] * 20), 'x' * 200]
+
+
+def random_part(rng):
+    part = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+    if rng.random() < 0.2:
+        # Long names, over any limit
+        part = ' - '.join([part] * rng.randint(3, 40))
+    if rng.random() < 0.2:
+        part = part[:rng.randint(0, len(part))] + rng.choice(INVALID) + part[rng.randint(0, len(part)):]
+    if rng.random() < 0.1:
+        part = rng.choice([' ', '  ']) + part + rng.choice([' ', ''])
+    return part
+
+
+def random_path(rng):
+    folders = [random_part(rng) for _ in range(rng.choice([0, 1, 2, 3, 5, 10, 25]))]
+    name = random_part(rng) + rng.choice(EXTENSIONS)
+    separator = '\\' if rng.random() < 0.05 else '/'
+    return separator.join(folders + [name])
+
+
+def outcome(function, path):
+    # The sanitized path, or the error, which must be the same too
+    try:
+        return function(path)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+@pytest.mark.parametrize('limits', ['windows', 'posix', 's3'])
+@pytest.mark.parametrize('output_folder', OUTPUT_FOLDERS)
+def test_sanitize_matches_uncached(limits, output_folder):
+    rng = random.Random(f"{limits}-{output_folder}")
+    paths = [random_path(rng) for _ in range(2000)]
+    # Repeat some folders, so cached prefixes are reused
+    paths += [path.rsplit('/', 1)[0] + '/' + random_part(rng) + '.txt' for path in paths[:500] if '/' in path]
+
+    cached = PathSanitizer(output_folder, cache_size=256, limits=PATH_LIMITS[limits], relative=limits == 's3')
+    reference = PathSanitizer(output_folder, limits=PATH_LIMITS[limits], relative=limits == 's3')
+    for path in paths:
+        assert outcome(cached.sanitize, path) == outcome(reference.sanitize_uncached, path), path
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from drive_extractor import smallfiles
+from drive_extractor.manifest import Manifest
+from drive_extractor.smallfiles import SMALL_FILES_SUPPORTED, FolderWriter, is_small, small_runs
+
+from .exports import corrupt, extract, make_export, status, tree
+
+pytestmark = pytest.mark.skipif(not SMALL_FILES_SUPPORTED, reason="needs pread() and dir_fd")
+
+
+@pytest.fixture
+def zip_files(tmp_path):
+    return make_export(tmp_path / 'zips')
+
+
+def test_small_files_write_the_same_tree(zip_files, tmp_path):
+    corrupt(zip_files[0], 'My Drive/Projects/Folder 3/Sub 0/notes 3.txt')
+    extract(zip_files, tmp_path / 'default')
+
+    extract(zip_files, tmp_path / 'small', small_files=True)
+
+    assert tree(tmp_path / 'small') == tree(tmp_path / 'default')
+    assert status(tmp_path / 'small') == status(tmp_path / 'default')
+
+
+def test_runs_follow_the_archive(zip_files, monkeypatch):
+    monkeypatch.setattr(smallfiles, 'SMALL_RUN_FILES', 4)
+    manifest = Manifest(zip_files[:1])
+    entries = [entry for entry in manifest.entries(0) if is_small(manifest, entry)]
+    # The large stored video is left to the other paths
+    assert 0 < len(entries) < len(manifest.entries(0))
+
+    runs = small_runs(manifest, [(entry,) for entry in reversed(entries)])
+
+    assert [member[0] for run in runs for member in run] == sorted(entries, key=manifest.header_offset.__getitem__)
+    assert all(len(run) <= 4 for run in runs)
+
+
+def test_folder_writer_reuses_and_evicts_folders(tmp_path):
+    writer = FolderWriter(max_folders=2)
+    expected = {}
+    try:
+        for i in range(30):
+            folder = tmp_path / f'folder {i % 5}'
+            folder.mkdir(exist_ok=True)
+            dest_path = str(folder / f'file {i}.txt')
+            writer.write(dest_path, b'file %d\n' % i)
+            expected[os.path.relpath(dest_path, tmp_path).replace(os.sep, '/')] = b'file %d\n' % i
+            assert len(writer.folders) <= 2
+    finally:
+        writer.close()
+
+    assert tree(tmp_path) == expected
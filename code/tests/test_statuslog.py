@@ -0,0 +1,37 @@
+import csv
+import os
+import subprocess
+import sys
+
+from .exports import extract, make_export, status
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return list(csv.reader(file))
+
+
+def test_columnar_log_converts_to_the_csv_log(tmp_path):
+    zip_files = make_export(tmp_path / 'zips')
+    extract(zip_files, tmp_path / 'csv')
+    extract(zip_files, tmp_path / 'columnar', status_format='columnar')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    converted = subprocess.run([sys.executable, '-m', 'drive_extractor.statuscsv',
+                                str(tmp_path / 'columnar' / 'file_status.bin')], env=env, capture_output=True, text=True)
+
+    assert converted.returncode == 0
+    assert converted.stderr == ''
+    assert read_csv(tmp_path / 'columnar' / 'file_status.csv')[0] == read_csv(tmp_path / 'csv' / 'file_status.csv')[0]
+    assert status(tmp_path / 'columnar') == status(tmp_path / 'csv')
+
+
+def test_not_a_columnar_log(tmp_path):
+    (tmp_path / 'file_status.bin').write_bytes(b'something else')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    converted = subprocess.run([sys.executable, '-m', 'drive_extractor.statuscsv', str(tmp_path / 'file_status.bin')],
+                               env=env, capture_output=True, text=True)
+
+    assert converted.returncode == 1
+    assert converted.stderr.startswith('error: ')
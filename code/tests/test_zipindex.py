@@ -0,0 +1,49 @@
+import os
+import zipfile
+
+import pytest
+
+from drive_extractor import zipindex
+from drive_extractor.zipindex import ZIP_INDEX_SUFFIX, read_members, scan_members
+
+from .exports import make_export
+
+
+def same_members(a, b):
+    return a.names == b.names and a.orig_names == b.orig_names and a.columns == b.columns
+
+
+@pytest.fixture
+def zip_file(tmp_path):
+    return make_export(tmp_path, parts=2)[0]
+
+
+def test_index_is_written_and_reused(zip_file, monkeypatch):
+    members = read_members(zip_file, use_index=True)
+    assert os.path.isfile(zip_file + ZIP_INDEX_SUFFIX)
+    assert same_members(members, scan_members(zip_file))
+
+    def no_scan(zip_file):
+        raise AssertionError("central directory read again")
+    monkeypatch.setattr(zipindex, 'scan_members', no_scan)
+    assert same_members(read_members(zip_file, use_index=True), members)
+
+
+def test_index_is_rebuilt_when_the_zip_changes(zip_file):
+    read_members(zip_file, use_index=True)
+    with zipfile.ZipFile(zip_file, 'a') as zf:
+        zf.writestr('My Drive/added later.txt', b'new')
+
+    members = read_members(zip_file, use_index=True)
+
+    assert 'My Drive/added later.txt' in members.names
+    assert same_members(read_members(zip_file, use_index=True), members)
+
+
+def test_damaged_index_falls_back_to_the_zip(zip_file):
+    members = read_members(zip_file, use_index=True)
+    with open(zip_file + ZIP_INDEX_SUFFIX, 'r+b') as file:
+        file.seek(zipindex.INDEX_HEADER.size + 10)
+        file.write(b'garbage')
+
+    assert same_members(read_members(zip_file, use_index=True), members)